@@ -1,73 +1,89 @@
 # app.py
+from __future__ import annotations
+
+from utils import startup
+startup.install()       # times the imports below when APP_STARTUP_PROFILE=1
+startup.begin_run()
+# .env, then the legacy dpbox.env for anything it doesn't set (once per process).
+# Before the utils imports: several of them read their settings at import time.
+startup.load_env()
+
 import os
-import json
 import pandas as pd
-import dropbox
 import streamlit as st
 from datetime import datetime
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING
 import time
-import requests
-import re
 
 # --- your existing imports (unchanged) ---
 from utils import shopify_utils
 from constants.config import shopify_defaults
-from constants.data_loader import load_json
 from utils.sku_generator import generate_sku_dataframe
-from utils.google_utils import connect_to_sheet
 from utils.dropbox_utils import (
-    get_dropbox_client,
-    get_shared_link,     # used for art preview
     move_to_finished,    # used to archive processed folder
 )
-from utils.ui_utils import render_logo
-from utils.shopify_utils import upload_products_from_df, ShopifyError
+from utils.ui_utils import render_logo, StreamlitProgressSink
+from utils.shopify_utils import upload_products_from_df, upload_to_stores, ShopifyError, client_for, default_client
+from utils.variant_quota import get_default_quota
+from utils import design_builder
+from utils.design_builder import ensure_shopify_csv_fields
+from utils.csv_export import write_csv, export_to_store, export_parts_to_store
+from utils.artifact_store import get_default_store
+from utils import app_cache
+from utils.thumbnails import SIDEBAR_SIZE, GALLERY_SIZE
+from utils.sku_registry import get_default_registry
+from utils import workflow
+from utils.workflow import ledger_note, store_preflight, quota_eta, quota_gate, defer_leftovers
+from utils.job_queue import get_default_queue
 from utils.dropbox_utils import load_dropbox_image_links_parallel as load_dropbox_image_links
 
-import io, zipfile
+if TYPE_CHECKING:
+    import dropbox
 
-def _stash_downloads(key: str, files: list[tuple[str, bytes]]):
-    """
-    Store a list of (filename, file_bytes) in session_state under `key`.
-    """
-    st.session_state[key] = [{"name": n, "bytes": b} for (n, b) in files]
+startup.mark("imports")
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
 
 def _render_downloads(key: str, title: str, zip_name_prefix: str = "FILES"):
     """
-    Render persisted downloads from session_state[key].
+    Render persisted downloads from session_state[key] (artifact refs).
     Provides: individual download buttons, 'Download all as ZIP', and 'Clear' button.
+    File contents are read from disk only when a button is clicked.
     """
-    items = st.session_state.get(key) or []
-    if not items:
+    refs = st.session_state.get(key) or []
+    if not refs:
         return
 
+    store = get_default_store()
+    live = [r for r in refs if store.exists(r)]
     st.markdown(f"### {title}")
+    if len(live) < len(refs):
+        st.warning(f"{len(refs) - len(live)} file(s) expired from the artifact store — rebuild to download them.")
 
     # Individual download buttons
-    for i, item in enumerate(items, start=1):
+    for i, ref in enumerate(live, start=1):
         st.download_button(
-            label=f"📥 Download {item['name']}",
-            data=item["bytes"],
-            file_name=item["name"],
+            label=f"📥 Download {ref['name']}",
+            data=lambda r=ref: store.read_bytes(r),
+            file_name=ref["name"],
             mime="text/csv",
             key=f"{key}_dl_{i}"
         )
 
-    # Download all as ZIP
-    zip_buf = io.BytesIO()
-    with zipfile.ZipFile(zip_buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for item in items:
-            zf.writestr(item["name"], item["bytes"])
-    zip_buf.seek(0)
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    st.download_button(
-        label="⬇️ Download ALL as ZIP",
-        data=zip_buf.getvalue(),
-        file_name=f"{zip_name_prefix}_{ts}.zip",
-        mime="application/zip",
-        key=f"{key}_zip"
-    )
+    # Download all as ZIP (built once per set of files, then served from disk)
+    if live:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        bundle = store.zip_bundle(live, f"{zip_name_prefix}_{ts}.zip")
+        st.download_button(
+            label="⬇️ Download ALL as ZIP",
+            data=lambda: store.read_bytes(bundle),
+            file_name=f"{zip_name_prefix}_{ts}.zip",
+            mime="application/zip",
+            key=f"{key}_zip"
+        )
 
     # Clear button
     if st.button("🧹 Clear Downloads", key=f"{key}_clear"):
@@ -79,12 +95,6 @@ def _render_downloads(key: str, title: str, zip_name_prefix: str = "FILES"):
 st.set_page_config(page_title="SKU Generator", layout="centered")
 
 # ---------- Env / validation ----------
-# Load .env automatically (default)
-load_dotenv()
-
-# Optional fallback for legacy file name
-if not os.getenv("DROPBOX_REFRESH_TOKEN"):
-    load_dotenv("dpbox.env")
 
 FINISHED_DIR_NAME = os.getenv("FINISHED_DIR_NAME", "finished")
 COMPLETED_ROOT = os.getenv(
@@ -94,6 +104,7 @@ COMPLETED_ROOT = os.getenv(
 
 CSV_MAX_MB   = float(os.getenv("SHOPIFY_PRODUCT_CSV_MAX_MB", "14.5"))
 CSV_MAX_ROWS = int(os.getenv("SHOPIFY_PRODUCT_CSV_MAX_ROWS", "0"))
+GALLERY_COLUMNS = int(os.getenv("GALLERY_COLUMNS", "6"))
 
 # ---- Store picker (after load_dotenv) ----
 def _profile(label, url_env, token_env):
@@ -114,6 +125,10 @@ legacy_token = (os.getenv("SHOPIFY_API_PASSWORD") or os.getenv("SHOPIFY_ADMIN_AP
 if not STORE_PROFILES and legacy_url and legacy_token:
     STORE_PROFILES.append({"label": f"{legacy_url} (legacy env)", "url": legacy_url, "token": legacy_token})
 
+# Each session targets its own client; nothing here touches os.environ
+shop_client = default_client()
+fanout_clients = []    # extra stores "Send to Shopify" / "Upload built CSV" also upload to
+
 with st.sidebar:
     st.header("🛍️ Target Shopify Store")
     if not STORE_PROFILES:
@@ -130,18 +145,22 @@ with st.sidebar:
         selected_label = st.selectbox("Choose store", labels, index=default_idx)
         st.session_state.shop_profile_label = selected_label
         sel = next(p for p in STORE_PROFILES if p["label"] == selected_label)
-        os.environ["SHOPIFY_STORE_URL"] = sel["url"]
-        os.environ["SHOPIFY_API_PASSWORD"] = sel["token"]
+        shop_client = client_for(sel["url"], sel["token"], name=sel["label"])
         st.caption(f"Active store: `{sel['url']}`")
 
+        others = [p for p in STORE_PROFILES if p["label"] != selected_label]
+        if others:
+            also = st.multiselect("Also upload to", [p["label"] for p in others], key="fanout_labels",
+                                  help="Send to Shopify and Upload built CSV also go to these stores, all at "
+                                       "once, each with its own connection and rate budget. Batch runs use "
+                                       "the primary store only.")
+            fanout_clients = [client_for(p["url"], p["token"], name=p["label"])
+                              for p in others if p["label"] in also]
+
         if st.button("🔎 Check connection"):
             try:
-                api_ver = os.getenv("SHOPIFY_API_VERSION", "2024-10")
-                r = requests.get(
-                    f"https://{sel['url']}/admin/api/{api_ver}/shop.json",
-                    headers={"X-Shopify-Access-Token": sel["token"], "Accept": "application/json"},
-                    timeout=int(os.getenv("SHOPIFY_HTTP_TIMEOUT", "120"))
-                )
+                r = shop_client.session.get(f"{shop_client.api_base}/shop.json", headers=shop_client.headers,
+                                            timeout=int(os.getenv("SHOPIFY_HTTP_TIMEOUT", "120")))
                 limit = r.headers.get("X-Shopify-Shop-Api-Call-Limit")
                 st.write(f"Status: {r.status_code} — Call-Limit: {limit}")
                 if r.ok:
@@ -151,6 +170,11 @@ with st.sidebar:
             except Exception as e:
                 st.error(f"Check failed: {e}")
 
+    if st.button("♻️ Reload config", help="Re-read the constants/ JSON (prices, size guides, extras) now "
+                                         "instead of waiting for the cache to expire."):
+        app_cache.invalidate_config()
+        st.success("Config reloaded ✅")
+
 REQUIRED_ENV = [
     "GOOGLE_KEYFILE",
     "DROPBOX_APP_KEY",
@@ -165,6 +189,23 @@ if missing:
 FOLDER_PATH  = os.getenv("FOLDER_PATH", "").strip()
 DESIGNS_ROOT = os.getenv("FOLDER_PATH_Design", "").strip()
 
+startup.mark("env + store picker")
+
+# Filled here and again at the end of the run, so a run that stops early still shows it
+profile_slot = st.sidebar.empty()
+
+def render_startup_profile():
+    if not startup.STARTUP_PROFILE:
+        return
+    with profile_slot.container():
+        with st.expander("⏱ Startup profile"):
+            st.caption(f"This run so far: {startup.run_seconds():.2f}s · imports are timed once per process, "
+                       "phases on every run (first = cold start)")
+            st.dataframe(pd.DataFrame(startup.phase_report()), hide_index=True)
+            st.dataframe(pd.DataFrame(startup.import_report()), hide_index=True)
+
+render_startup_profile()
+
 # ---------- Session defaults ----------
 if "generating" not in st.session_state: st.session_state.generating = False
 if "ENABLE_IMAGE_MAPPING" not in st.session_state: st.session_state.ENABLE_IMAGE_MAPPING = False
@@ -173,95 +214,181 @@ if "dropbox_image_links" not in st.session_state: st.session_state.dropbox_image
 if "dropbox_links_loaded" not in st.session_state: st.session_state.dropbox_links_loaded = False
 if "loaded_folder_path" not in st.session_state: st.session_state.loaded_folder_path = None
 if "ready_folders" not in st.session_state: st.session_state.ready_folders = []
-if "auto_df" not in st.session_state: st.session_state.auto_df = None
+if "auto_df_ref" not in st.session_state: st.session_state.auto_df_ref = None
 if "auto_csv_name" not in st.session_state: st.session_state.auto_csv_name = None
 if "auto_folder" not in st.session_state: st.session_state.auto_folder = None
 if "auto_meta" not in st.session_state: st.session_state.auto_meta = None
 
 # ---------- Small helpers ----------
 def analyze_design_folders(dbx: dropbox.Dropbox, root: str):
-    """Return (ready_list, not_ready_list), with deeper .json validation (e.g. description count)."""
-    from constants.data_loader import load_json
+    return workflow.analyze_design_folders(dbx, root, list_folder=app_cache.list_folder)
 
-    garment_keys = load_json("garment_keys.json")
-    ready, not_ready = [], []
+def sku_registry():
+    return get_default_registry(app_cache.sku_sheet)
 
-    try:
-        res = dbx.files_list_folder(root)
-        IGNORE_FOLDERS = {"finished", "images", "designs", "1_Ready"}
+def sku_used(suffix: str) -> bool:
+    reg = sku_registry()
+    reg.refresh()
+    return reg.is_used(suffix)
 
-        folders = [
-            e.name for e in res.entries
-            if isinstance(e, dropbox.files.FolderMetadata) and e.name.lower() not in IGNORE_FOLDERS
-        ]
+def reserve_suffix(suffix: str, lister: str, flush: bool = True) -> bool:
+    """
+    SKU guard against the local registry: False if the suffix is taken,
+    else reserve it. flush=False leaves the Sheet write to the next batched flush.
+    """
+    reg = sku_registry()
+    reg.refresh()
+    if not reg.reserve(suffix, lister):
+        return False
+    try:
+        reg.flush() if flush else reg.flush_due()
     except Exception as e:
-        return ready, [{"Folder": "N/A", "Issues": f"Failed to list root: {e}"}]
+        st.warning(f"⚠️ {suffix} reserved locally; writing it to the SKU Tracker failed and will be retried: {e}")
+    return True
 
-    for name in folders:
-        path = f"{root}/{name}"
-        try:
-            entries = dbx.files_list_folder(path).entries
-            files = {e.name for e in entries if isinstance(e, dropbox.files.FileMetadata)}
-            errors = []
-
-            json_files = [fn for fn in files if fn.lower().endswith(".json")]
-            has_meta = bool(json_files)
-            has_txt = any(fn.lower().endswith((".txt", ".pdf")) for fn in files)
-
-            has_art = any(
-                fn.split(".")[0] == name and fn.lower().split(".")[-1] in {"png", "jpg", "jpeg", "webp"}
-                for fn in files
-            )
-            numbered_pngs = [fn for fn in files if fn.lower().endswith(".png") and fn.split(".")[0].isdigit()]
-            numbered_count = len(numbered_pngs)
-
-
-            if not has_art:
-                errors.append("Missing matching artwork")
-            if numbered_count < 80:
-                errors.append(f"Only {numbered_count}/80 images")
-
-            if errors:
-                not_ready.append({
-                    "Folder": name,
-                    "Has .json": "✅" if has_meta else "❌",
-                    "Has notes": "✅" if has_txt else "❌",
-                    "Has art": "✅" if has_art else "❌",
-                    "Image count": f"{numbered_count} / 80",
-                    "Issues": ", ".join(errors),
-                })
-            else:
-                ready.append(name)
+def status_emit_for(panels: dict):
+    """
+    emit_for(name) for the workflow runs: one st.status panel with a
+    StreamlitProgressSink per design, opened on its first message.
+    """
+    def emit_for(name):
+        if name not in panels:
+            box = st.status(f"📦 {name}…", expanded=True)
+            panels[name] = (box, StreamlitProgressSink(box))
+        return panels[name][1]
+    return emit_for
+
+def close_status_panels(panels: dict, summary: list[tuple]):
+    """Final label per design panel from the workflow's (design, status, detail, seconds) rows."""
+    rows = {row[0]: row for row in summary}
+    for name, (box, sink) in panels.items():
+        sink.flush()
+        if name not in rows:
+            box.update(expanded=False)
+            continue
+        _, status, detail, secs = rows[name]
+        box.update(label=f"{JOB_ICONS.get(status, status)} {name}: {status} in {fmt_secs(secs)}"
+                         + (f" — {detail}" if detail else ""), expanded=status != "done")
 
-        except Exception as e:
-            not_ready.append({
-                "Folder": name,
-                "Has metadata": "❌",
-                "Has .txt": "❌",
-                "Has art": "❌",
-                "Image count": "0 / 80",
-                "Issues": f"Error: {e}",
-            })
-
-    return ready, not_ready
-
-def download_metadata(dbx: dropbox.Dropbox, folder_path: str) -> dict:
-    try:
-        entries = dbx.files_list_folder(folder_path).entries
-        json_files = [e.name for e in entries if isinstance(e, dropbox.files.FileMetadata) and e.name.lower().endswith(".json")]
-        if not json_files:
-            raise FileNotFoundError(f"No .json metadata file found in {folder_path}")
-        target_file = json_files[0]  # Use first one found
-        _, res = dbx.files_download(f"{folder_path}/{target_file}")
-        return json.loads(res.content)
-    except dropbox.exceptions.ApiError as e:
-        raise RuntimeError(f"Error accessing {folder_path}: {e}")
-
-
-def ensure_image_src_column(df: pd.DataFrame) -> pd.DataFrame:
-    if "Image Src" not in df.columns and "Image URL" in df.columns:
-        df["Image Src"] = df["Image URL"]
-    return df
+def run_workflow(run, move_after_upload: bool) -> tuple[list[tuple], dict]:
+    """
+    Run a workflow upload (run(emit_for) -> summary rows) with status panels.
+    Moved designs are dropped from the cached folder listings.
+    Returns (summary, panels).
+    """
+    panels = {}
+    summary = run(status_emit_for(panels))
+    close_status_panels(panels, summary)
+    if move_after_upload:
+        moved = [name for name, status, _, _ in summary if status == "done"]
+        if moved:
+            app_cache.invalidate_folders(DESIGNS_ROOT, *(f"{DESIGNS_ROOT}/{name}" for name in moved))
+    return summary, panels
+
+def render_batch_summary(summary: list[tuple]):
+    for name, status, detail, secs in summary:
+        st.write(f"• {name}: {JOB_ICONS.get(status, status)} {fmt_secs(secs)}" + (f" — {detail}" if detail else ""))
+
+def run_clients() -> list:
+    """The primary store's client (first) and the fan-out ones for one upload run, sharing a fresh HttpMetrics."""
+    run = shop_client.for_run()
+    return [run] + [c.for_run(run.metrics) for c in fanout_clients]
+
+def render_http_metrics(key: str, metrics: shopify_utils.HttpMetrics):
+    """
+    One run's Shopify HTTP telemetry: wire vs sleep time per endpoint, plus
+    JSON / Prometheus export (and the process-wide cumulative Prometheus view).
+    """
+    snap = metrics.snapshot()
+    if not snap["endpoints"]:
+        return
+    with st.expander("📊 Shopify HTTP telemetry (this run)"):
+        rows = [{
+            "Endpoint": f"{e['method']} {e['endpoint']}",
+            "Requests": e["requests"],
+            "429s": e["throttled_429"],
+            "Retries": e["retries"],
+            "Wire (s)": e["wire_seconds"],
+            "Avg (s)": e["wire_avg"],
+            "Max (s)": e["wire_max"],
+            "Sleep (s)": e["sleep_seconds"],
+            "Sleep by reason": ", ".join(f"{r} {v['seconds']:.1f}s" for r, v in e["sleep"].items()),
+        } for e in snap["endpoints"]]
+        st.dataframe(pd.DataFrame(rows), use_container_width=True)
+        wire = sum(e["wire_seconds"] for e in snap["endpoints"])
+        slept = sum(e["sleep_seconds"] for e in snap["endpoints"])
+        st.caption(f"Run wall-clock {fmt_secs(snap['elapsed'])} — on the wire {fmt_secs(wire)}, sleeping {fmt_secs(slept)}")
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        c1, c2, c3 = st.columns(3)
+        c1.download_button("⬇️ Metrics (JSON)", metrics.to_json(), file_name=f"shopify_metrics_{ts}.json",
+                           mime="application/json", key=f"{key}_metrics_json")
+        c2.download_button("⬇️ Metrics (Prometheus)", metrics.to_prometheus(), file_name=f"shopify_metrics_{ts}.prom",
+                           mime="text/plain", key=f"{key}_metrics_prom")
+        c3.download_button("⬇️ Process totals (Prometheus)", shopify_utils.METRICS.to_prometheus(),
+                           file_name=f"shopify_metrics_process_{ts}.prom", mime="text/plain",
+                           key=f"{key}_metrics_prom_total")
+
+def send_to_stores(df: pd.DataFrame, clients: list):
+    """upload_products_from_df to every store at once, one status panel per store."""
+    statuses = {c.name: st.status(f"🚀 {c.name}: uploading…", expanded=True) for c in clients}
+    sinks = {name: StreamlitProgressSink(box) for name, box in statuses.items()}
+    per_store = upload_to_stores(df, clients, progress_for=lambda c: sinks[c.name])
+    for name, results in per_store.items():
+        sinks[name].flush()
+        box = statuses[name]
+        if isinstance(results, Exception):
+            box.update(label=f"❌ {name}: upload failed")
+            box.error(f"{name}: {results}")
+            continue
+        deferred = [r for r in results if r["status"] == "deferred (quota)"]
+        box.update(label=f"✅ {name}: {len(results) - len(deferred)} product(s) uploaded"
+                         + (f", {len(deferred)} deferred (quota)" if deferred else ""), expanded=False)
+        box.json(results)
+
+def job_options(move: bool, preflight: bool, abort_on_conflict: bool, sku_lister: str = None,
+                variant_budget: int = None) -> dict:
+    return {"move": move, "preflight": preflight, "abort_on_conflict": abort_on_conflict,
+            "sku_lister": sku_lister, "variant_budget": variant_budget or None, "out_dir": os.path.abspath(".")}
+
+def enqueue_job(kind: str, design: str, params: dict, client=None) -> int | None:
+    """Queue a job for the background workers unless one is already queued/running for this design."""
+    queue = get_default_queue()
+    store = (client or shop_client).store
+    if queue.active_for(store, design):
+        return None
+    return queue.enqueue(kind, design, store, {"designs_root": DESIGNS_ROOT, **params})
+
+JOB_ICONS = {"queued": "⏳", "running": "🔄", "done": "✅", "failed": "❌", "deferred": "⏸️", "cancelled": "🚫"}
+
+@st.fragment(run_every=float(os.getenv("JOB_PANEL_REFRESH_SECS", "3")))
+def render_jobs_panel():
+    """Background job status, polled from the job queue without rerunning the page."""
+    queue = get_default_queue()
+    jobs = queue.jobs(limit=20)
+    workers = queue.workers_online()
+    if not jobs and not workers:
+        return
+    st.subheader("🧵 Background jobs")
+    st.caption(f"{len(workers)} worker(s) online" if workers else
+               "No workers online — start them with `python cli.py worker --processes 2`")
+    for job in jobs:
+        p = job["progress"] or {}
+        done = f" — {p.get('products_done', 0)}/{p.get('products_total', 0)} products" if p.get("products_total") else ""
+        label = f"{JOB_ICONS.get(job['status'], '')} #{job['id']} {job['kind']} · {job['design']}{done}"
+        with st.expander(label, expanded=job["status"] == "running"):
+            if job["status"] == "running" and p.get("current"):
+                st.write(f"Current: `{p['current']}` · {p.get('requests', 0)} requests · "
+                         f"{fmt_secs(p.get('sleep_seconds', 0))} throttled")
+            for row in (job["result"] or {}).get("summary", []):
+                name, status, detail, secs = row
+                st.write(f"• {name}: {JOB_ICONS.get(status, status)} {fmt_secs(secs)}" + (f" — {detail}" if detail else ""))
+            if job["error"]:
+                st.error(job["error"].splitlines()[0])
+            lines = queue.log_lines(job["id"], limit=12)
+            if lines:
+                st.code("\n".join(l["msg"] for l in lines), language=None)
+            if job["status"] == "queued" and st.button("Cancel", key=f"job_cancel_{job['id']}"):
+                queue.cancel(job["id"])
 
 def fmt_secs(sec: float) -> str:
     if sec < 60: return f"{sec:.1f}s"
@@ -270,107 +397,9 @@ def fmt_secs(sec: float) -> str:
     h, m = divmod(int(m), 60)
     return f"{h}h {m}m {s:.0f}s"
 
-# ----- SEO / CSV helpers you asked for -----
-
-def _strip_after_pipe(title: str) -> str:
-    return (title or "").split("|", 1)[0].strip()
-
-def _html_to_text(html: str) -> str:
-    s = re.sub(r"<[^>]+>", " ", html or "")
-    return re.sub(r"\s+", " ", s).strip()
-
-def _meta_150_last_sentence(html: str) -> str:
-    """
-    Plain text from HTML, then cut at the last '.' before 150 chars.
-    If no '.' exists before 150, return the first 150 chars trimmed.
-    """
-    text = _html_to_text(html)
-    if len(text) <= 150:
-        return text
-    cut = text[:150]
-    last_dot = cut.rfind(".")
-    if last_dot != -1:
-        return cut[:last_dot+1].strip()
-    return cut.strip()
-
-def ensure_shopify_csv_fields(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    - Title = product_name + garment type (already in df)
-    - SEO Title = full title with pipe (already in df["SEO Title"])
-    - SEO Description: from Body (HTML), cut at last '.' before 150 chars
-    - Google Shopping / Custom Label 0: 'Sal'
-    """
-    # Use existing df["Title"] and df["SEO Title"], no modification
-    # Just ensure the SEO Description is processed
-
-    df["SEO Description"] = df["Body (HTML)"].astype(str).apply(_meta_150_last_sentence)
-
-    col = "Google Shopping / Custom Label 0"
-    if col not in df.columns:
-        df[col] = "Sal"
-    else:
-        df[col] = df[col].fillna("Sal").replace("", "Sal")
-
-    return df
-
-
 def build_design_dataframe(dbx: dropbox.Dropbox, folder: str, excluded_colors: list[str] = None):
-    folder_path = f"{DESIGNS_ROOT}/{folder}"
-    meta = download_metadata(dbx, folder_path)
-
-
-    # --- NEW: extract Restrictions field ---
-    restrictions = meta.get("Restrictions", "")
-    if restrictions:
-        excluded_colors = [c.strip() for c in restrictions.split(",") if c.strip()]
-    else:
-        excluded_colors = []  # Treat missing or empty as "no restriction"
-
-    product_name = meta.get("product_name","").strip()
-    sku_suffix   = meta.get("sku_suffix","").strip().upper()
-    main_color   = meta.get("main_color","").strip()
-    tags_list    = meta.get("tags", [])
-    descriptions = meta.get("descriptions", [])
-    page_titles  = meta.get("page_titles", [])
-
-    if not product_name or not sku_suffix or not main_color:
-        raise ValueError("metadata.json missing product_name / sku_suffix / main_color")
-    if not isinstance(tags_list, list):
-        raise ValueError("metadata.json 'tags' must be a list")
-    if len(descriptions) != len(garment_keys):
-        raise ValueError(f"metadata.json 'descriptions' must have {len(garment_keys)} items")
-
-    image_links, missing = load_dropbox_image_links(dbx, folder_path, total_images=80)
-
-    tags_csv = ", ".join(t.strip() for t in tags_list if t.strip())
-    df = generate_sku_dataframe(
-        product_name=product_name,
-        sku_suffix=sku_suffix,
-        main_color=main_color,
-        tags=tags_csv,
-        garment_keys=garment_keys,
-        raw_descriptions=descriptions,
-        body_html_map=body_html_map,
-        product_extras=product_extras,
-        product_types=product_types,
-        correct_colors_by_type=correct_colors_by_type,
-        vendor=vendor,
-        published=published,
-        inventory_policy=inventory_policy,
-        fulfillment_service=fulfillment_service,
-        requires_shipping=requires_shipping,
-        taxable=taxable,
-        inventory_tracker=inventory_tracker,
-        image_links=image_links,
-        excluded_colors=excluded_colors,
-        page_titles=page_titles
-    )
-    df = ensure_image_src_column(df)
-
-    # >>> Your requested CSV fields <<<
-    df = ensure_shopify_csv_fields(df)
-
-    return df, meta, missing
+    # Excluded colours come from metadata.json "Restrictions"; the argument is kept for callers
+    return design_builder.build_design_dataframe(dbx, DESIGNS_ROOT, folder)
 
 
 # ---------- Header / logo ----------
@@ -383,7 +412,7 @@ if not st.session_state.generating:
         st.header("🖼️ Dropbox Image Loader (Manual tab)")
         if st.button("🔄 Get / Refresh Image Links"):
             try:
-                dbx = get_dropbox_client()
+                dbx = app_cache.dropbox_client()
                 with st.spinner("⏳ Fetching image links from Dropbox..."):
                     links, failed = load_dropbox_image_links(dbx, FOLDER_PATH, total_images=80)
                 st.session_state.dropbox_image_links = links
@@ -399,12 +428,14 @@ if not st.session_state.generating:
 
         if st.session_state.dropbox_links_loaded:
             img_num = st.number_input("Image # to Preview", 1, 80, value=1)
-            url = st.session_state.dropbox_image_links.get(int(img_num))
-            if url:
+            # All 80 mockups come down in four batch calls once, so stepping through them is instant
+            mockups = tuple(f"{FOLDER_PATH}/{i}.png" for i in range(1, 81))
+            thumb = app_cache.thumbnails(app_cache.dropbox_client(), mockups, SIDEBAR_SIZE).get(mockups[int(img_num) - 1])
+            if thumb:
                 st.markdown("### 🎨 Preview")
-                st.markdown(f'<img src="{url}" style="width:100%; border-radius:10px;" />', unsafe_allow_html=True)
+                st.image(thumb, use_container_width=True)
             else:
-                st.warning("No URL for that image number.")
+                st.warning("No preview for that image number.")
 
 # ---------- Shopify defaults ----------
 vendor = shopify_defaults["vendor"]
@@ -416,11 +447,12 @@ taxable = shopify_defaults["taxable"]
 inventory_tracker = shopify_defaults["inventory_tracker"]
 
 # ---------- Config JSON ----------
-garment_keys           = load_json("garment_keys.json")
-body_html_map          = load_json("size_guides.json")
-product_extras         = load_json("product_extras.json")
-product_types          = load_json("product_types.json")
-correct_colors_by_type = load_json("colors.json")
+catalog_cfg            = app_cache.catalog_config()
+garment_keys           = catalog_cfg["garment_keys"]
+body_html_map          = catalog_cfg["body_html_map"]
+product_extras         = catalog_cfg["product_extras"]
+product_types          = catalog_cfg["product_types"]
+correct_colors_by_type = catalog_cfg["correct_colors_by_type"]
 
 # After loading colors.json
 ALL_COLORS = sorted({c for colors in correct_colors_by_type.values() for c in colors})
@@ -432,6 +464,8 @@ excluded_colors = st.multiselect(
 )
 
 
+startup.mark("sidebar + config")
+
 # ---------- Tabs ----------
 tab_manual, tab_auto = st.tabs(["📝 Manual entry", "🤖 Auto from Dropbox"])
 
@@ -460,12 +494,9 @@ with tab_manual:
                 st.warning("⚠️ Please complete all fields.")
                 st.stop()
 
-            sheet = connect_to_sheet("SKU Tracker")
-            existing_suffixes = [row[0].strip().upper() for row in sheet.get_all_values()[1:]]
-            if sku_suffix in existing_suffixes:
+            if not reserve_suffix(sku_suffix, lister):
                 st.error("❌ That SKU suffix is already used in Google Sheets. Please enter a new one.")
                 st.stop()
-            sheet.append_row([sku_suffix, lister, datetime.now().isoformat()])
 
             image_links = st.session_state.dropbox_image_links if st.session_state.dropbox_links_loaded else None
 
@@ -481,28 +512,40 @@ with tab_manual:
             df = ensure_shopify_csv_fields(df)
 
             filename = f"{sku_suffix}.csv"
-            df.to_csv(filename, index=False, encoding="utf-8-sig")
-            with open(filename, "rb") as f:
-                st.download_button("📥 Download CSV File", f, file_name=filename)
+            csv_ref = export_to_store(df, filename)
+            st.download_button("📥 Download CSV File", lambda: get_default_store().read_bytes(csv_ref),
+                               file_name=filename, mime="text/csv")
 
             if st.button("Send to Shopify"):
-                with st.status("🚀 Uploading to Shopify…", expanded=True) as s:
-                    try:
-                        def emit(msg: str): s.write(msg)
-                        results = upload_products_from_df(df, progress=emit)
-                        s.update(label="✅ Upload complete")
-                        st.success(f"Uploaded {len(results)} products.")
-                        st.json(results)
-                    except ShopifyError as e:
-                        if str(e).startswith("DAILY_VARIANT_LIMIT:"):
-                            s.update(label="⛔ Daily variant creation limit hit")
-                            st.error("You’ve hit Shopify’s daily variant creation limit. Use CSV import now or resume via API tomorrow.")
-                        else:
-                            s.update(label="❌ Shopify upload failed")
-                            st.error(f"Shopify error: {e}")
-                    except Exception as e:
-                        s.update(label="❌ Unexpected error during upload")
-                        st.error(f"Unexpected error: {e}")
+                clients = run_clients()
+                if fanout_clients:
+                    send_to_stores(df, clients)
+                else:
+                    with st.status("🚀 Uploading to Shopify…", expanded=True) as s:
+                        emit = StreamlitProgressSink(s)
+                        try:
+                            note = ledger_note(df, shop_client)
+                            if note: emit(note)
+                            results = upload_products_from_df(df, progress=emit, client=clients[0])
+                            s.update(label="✅ Upload complete")
+                            deferred = [r for r in results if r["status"] == "deferred (quota)"]
+                            st.success(f"Uploaded {len(results) - len(deferred)} products.")
+                            if deferred:
+                                st.info(f"⏸️ {len(deferred)} product(s) didn't fit today's variant quota — send again once it frees up.")
+                            st.json(results)
+                        except ShopifyError as e:
+                            if str(e).startswith("DAILY_VARIANT_LIMIT:"):
+                                s.update(label="⛔ Daily variant creation limit hit")
+                                st.error("You’ve hit Shopify’s daily variant creation limit. Use CSV import now or re-run tomorrow — finished products are skipped via the upload ledger.")
+                            else:
+                                s.update(label="❌ Shopify upload failed")
+                                st.error(f"Shopify error: {e}")
+                        except Exception as e:
+                            s.update(label="❌ Unexpected error during upload")
+                            st.error(f"Unexpected error: {e}")
+                        finally:
+                            emit.flush()
+                render_http_metrics("manual_upload", clients[0].metrics)
 
             with st.expander("📝 Preview Descriptions"):
                 key_col = "Base Type" if "Base Type" in df.columns else "Type"
@@ -529,96 +572,25 @@ with tab_manual:
 # Helpers for Auto tab
 # ------------------------------------------------------------
 
-# --- CSV chunking helpers (batch, no upload) ---
-def _csv_bytes_len(df: pd.DataFrame) -> int:
-    return len(df.to_csv(index=False).encode("utf-8-sig"))
-
-def _split_df_by_limits(df: pd.DataFrame, *, max_mb: float = None, max_rows: int = None) -> list[pd.DataFrame]:
-    if max_mb is None:
-        max_mb = CSV_MAX_MB
-    if max_rows is None:
-        max_rows = CSV_MAX_ROWS
-
-    bytes_limit = int(max_mb * 1024 * 1024)
-    chunks: list[pd.DataFrame] = []
-    cur_parts: list[pd.DataFrame] = []
-
-    def flush_current():
-        if cur_parts:
-            out = pd.concat(cur_parts, ignore_index=True)
-            chunks.append(out)
-            cur_parts.clear()
-
-    def fits_with(piece: pd.DataFrame) -> bool:
-        tmp = piece if not cur_parts else pd.concat(cur_parts + [piece], ignore_index=True)
-        size = _csv_bytes_len(tmp)
-        rows = len(tmp)
-        if size > bytes_limit: return False
-        if max_rows and rows > max_rows: return False
-        return True
-
-    for _, g in df.groupby("Handle", sort=False):
-        if _csv_bytes_len(g) > bytes_limit or (max_rows and len(g) > max_rows):
-            flush_current()
-            start, step = 0, max(1, min(len(g), max_rows if max_rows else len(g)))
-            while start < len(g):
-                piece = g.iloc[start:start+step]
-                while (_csv_bytes_len(piece) > bytes_limit or (max_rows and len(piece) > max_rows)) and len(piece) > 1:
-                    step = max(1, step // 2)
-                    piece = g.iloc[start:start+step]
-                chunks.append(piece.reset_index(drop=True))
-                start += len(piece)
-            continue
-
-        if not fits_with(g):
-            flush_current()
-        cur_parts.append(g.reset_index(drop=True))
-
-    flush_current()
-    return chunks
-
-def _dbx_exists(dbx: dropbox.Dropbox, path: str) -> bool:
-    try:
-        dbx.files_get_metadata(path)
-        return True
-    except dropbox.exceptions.ApiError:
-        return False
-
-def _ensure_folder(dbx: dropbox.Dropbox, path: str):
-    if not _dbx_exists(dbx, path):
-        dbx.files_create_folder_v2(path)
+def finish_design(folder: str, finished_dir: str = "finished") -> str:
+    """move_to_finished with the shared client; drops the cached listings it changes."""
+    final_path = move_to_finished(app_cache.dropbox_client(), DESIGNS_ROOT, folder, finished_dir=finished_dir)
+    app_cache.invalidate_folders(DESIGNS_ROOT, f"{DESIGNS_ROOT}/{folder}")
+    return final_path
 
 def move_selected_to_finished(dbx: dropbox.Dropbox, folder: str) -> str:
-    from utils.dropbox_utils import move_to_finished, get_dropbox_client
-    final_path = move_to_finished(get_dropbox_client(), DESIGNS_ROOT, folder, finished_dir=FINISHED_DIR_NAME)
-    return final_path
+    return finish_design(folder, finished_dir=FINISHED_DIR_NAME)
 
 def clean_and_archive_to_completed(dbx: dropbox.Dropbox, folder: str) -> tuple[int, str]:
-    finished_path = f"{DESIGNS_ROOT}/{FINISHED_DIR_NAME}/{folder}"
-    if not _dbx_exists(dbx, finished_path):
-        raise RuntimeError(f"Folder not in /{FINISHED_DIR_NAME}: {finished_path}")
-
-    pat = re.compile(r"^([1-9]\d{0,2})\.(png|jpg|jpeg|webp)$", re.IGNORECASE)
-    deleted = 0
-    entries = dbx.files_list_folder(finished_path).entries
-    for e in entries:
-        if isinstance(e, dropbox.files.FileMetadata):
-            m = pat.match(e.name)
-            if not m:
-                continue
-            num = int(m.group(1))
-            if 1 <= num <= 127:
-                dbx.files_delete_v2(f"{finished_path}/{e.name}")
-                deleted += 1
-
-    _ensure_folder(dbx, COMPLETED_ROOT)
-    dest = f"{COMPLETED_ROOT}/{folder}"
-    dbx.files_move_v2(finished_path, dest, autorename=True)
+    deleted, dest = workflow.clean_and_archive_to_completed(dbx, DESIGNS_ROOT, folder, FINISHED_DIR_NAME, COMPLETED_ROOT)
+    app_cache.invalidate_folders(f"{DESIGNS_ROOT}/{FINISHED_DIR_NAME}", f"{DESIGNS_ROOT}/{FINISHED_DIR_NAME}/{folder}")
     return deleted, dest
 
 # =========================
 # Tab 2: Auto from Dropbox
 # =========================
+startup.mark("manual tab")
+
 with tab_auto:
     st.subheader("Auto-generate from Dropbox design folders")
 
@@ -626,11 +598,12 @@ with tab_auto:
         st.warning("Set `FOLDER_PATH_Design` in dpbox.env to your `/designs` root to use this tab.")
         st.stop()
 
-    dbx = get_dropbox_client()
+    dbx = app_cache.dropbox_client()
 
     colA, colB = st.columns([1,1])
     with colA:
         if st.button("🔄 Refresh ready folders"):
+            app_cache.invalidate_folders()
             ready, not_ready = analyze_design_folders(dbx, DESIGNS_ROOT)
             st.session_state.ready_folders = ready
             st.session_state.not_ready_folders = not_ready
@@ -647,6 +620,7 @@ with tab_auto:
     colA, colB = st.columns([1, 1])
     with colA:
         if st.button("🔄 Refresh folder analysis"):
+            app_cache.invalidate_folders()
             st.session_state.ready_folders, st.session_state.not_ready_folders = analyze_design_folders(dbx, DESIGNS_ROOT)
 
     ready_folders = st.session_state.ready_folders
@@ -667,6 +641,18 @@ with tab_auto:
     else:
         st.success("✅ All folders are ready!")
 
+    if st.checkbox(f"🖼️ Show gallery of ready folders ({len(ready_folders)})", value=False):
+        arts = {f: app_cache.design_art_name(dbx, f"{DESIGNS_ROOT}/{f}", f) for f in ready_folders}
+        paths = {f: f"{DESIGNS_ROOT}/{f}/{a}" for f, a in arts.items() if a}
+        thumbs = app_cache.thumbnails(dbx, tuple(paths.values()), GALLERY_SIZE)
+        cols = st.columns(GALLERY_COLUMNS)
+        for i, f in enumerate(ready_folders):
+            with cols[i % GALLERY_COLUMNS]:
+                if thumbs.get(paths.get(f)):
+                    st.image(thumbs[paths[f]], caption=f, use_container_width=True)
+                else:
+                    st.caption(f"{f} (no preview)")
+
     col1, col2, col3 = st.columns(3)
     do_google_guard     = col1.checkbox("Google SKU guard", value=True)
     show_preview        = col2.checkbox("Show design preview", value=True)
@@ -677,19 +663,21 @@ with tab_auto:
     variant_cap         = col5.number_input("Max variants to create this run (0 = no cap)",
                                             min_value=0, value=0, step=50)
 
+    col6, col7 = st.columns(2)
+    do_store_preflight  = col6.checkbox("Store pre-flight (handles/SKUs)", value=True,
+                                        help="Look up every handle and SKU in the store before creating anything.")
+    abort_on_conflict   = col7.checkbox("Abort design on conflict", value=False,
+                                        help="Otherwise conflicting products are skipped and the rest uploaded.")
+    run_in_background   = st.checkbox("Run uploads in background workers",
+                                      value=bool(get_default_queue().workers_online()),
+                                      help="Queue uploads for `python cli.py worker` processes; they keep "
+                                           "running if this page is refreshed or closed.")
+
     if show_preview:
         try:
-            entries = dbx.files_list_folder(folder_path).entries
-            art = next(
-                (e.name for e in entries
-                 if isinstance(e, dropbox.files.FileMetadata)
-                 and e.name.split(".")[0]==folder
-                 and e.name.lower().split(".")[-1] in {"png","jpg","jpeg","webp"}), None
-            )
-            if art:
-                art_url = get_shared_link(dbx, f"{folder_path}/{art}")
-                if art_url:
-                    st.image(art_url, caption=art, use_container_width=True)
+            art, thumb = app_cache.design_art_thumb(dbx, folder_path, folder)
+            if thumb:
+                st.image(thumb, caption=art, use_container_width=True)
         except Exception:
             pass
 
@@ -707,30 +695,27 @@ with tab_auto:
                 s.write("✅ DataFrame ready")
 
                 if do_google_guard:
-                    sheet = connect_to_sheet("SKU Tracker")
-                    existing = [row[0].strip().upper() for row in sheet.get_all_values()[1:]]
                     sku_suffix = meta.get("sku_suffix","").strip().upper()
-                    if sku_suffix in existing:
+                    if sku_used(sku_suffix):
                         s.update(label=f"❌ SKU suffix already used: {sku_suffix}")
                         st.stop()
 
                 local_name = f"{meta.get('sku_suffix','').strip().upper()}.csv"
-                df.to_csv(local_name, index=False, encoding="utf-8-sig")
+                write_csv(df, local_name)
                 s.write(f"📝 CSV saved: {local_name}")
 
-                st.session_state.auto_df = df
+                st.session_state.auto_df_ref = get_default_store().put_dataframe(df, f"{folder}.parquet")
                 st.session_state.auto_csv_name = local_name
                 st.session_state.auto_folder = folder
                 st.session_state.auto_meta = meta
 
             st.success("Build complete. You can download the CSV below or upload when ready.")
-            try:
-                with open(st.session_state.auto_csv_name, "rb") as f:
-                    st.download_button("📥 Download CSV File", f, file_name=st.session_state.auto_csv_name)
-            except Exception:
-                pass
+            if os.path.exists(st.session_state.auto_csv_name or ""):
+                # Read only when the button is clicked
+                st.download_button("📥 Download CSV File", lambda p=st.session_state.auto_csv_name: _read_file(p),
+                                   file_name=st.session_state.auto_csv_name, mime="text/csv")
 
-            st.dataframe(st.session_state.auto_df.head(15))
+            st.dataframe(df.head(15))
 
             col_m, col_c = st.columns(2)
             if col_m.button("📦 Move this design to /finished now"):
@@ -750,48 +735,107 @@ with tab_auto:
             st.info(f"⏱ Build finished in {fmt_secs(time.perf_counter() - design_start)}")
 
     # -------- Upload built CSV (separate step) --------
-    upload_disabled = st.session_state.auto_df is None or st.session_state.auto_folder != folder
+    auto_ref = st.session_state.auto_df_ref
+    upload_disabled = (auto_ref is None or st.session_state.auto_folder != folder
+                       or not get_default_store().exists(auto_ref))
     if st.button("🚀 Upload built CSV to Shopify", disabled=upload_disabled):
         if upload_disabled:
             st.warning("Build the CSV first for this folder.")
+        elif run_in_background:
+            df = get_default_store().load_dataframe(auto_ref)
+            sku_suffix = st.session_state.auto_meta.get("sku_suffix","").strip().upper()
+            if do_google_guard and not ledger_note(df, shop_client) and not reserve_suffix(sku_suffix, "StreamlitAuto"):
+                st.error(f"❌ SKU suffix already used: {sku_suffix}")
+                st.stop()
+            upload_jobs = []
+            for c in [shop_client] + fanout_clients:
+                # With extra stores each job leaves the folder in place; a move job follows once they're all done
+                job_id = enqueue_job("upload_csv", folder, {
+                    "csv_path": os.path.abspath(st.session_state.auto_csv_name),
+                    "options": job_options(move_after_upload and not fanout_clients, do_store_preflight, abort_on_conflict,
+                                           variant_budget=variant_cap),
+                }, client=c)
+                if job_id:
+                    st.success(f"🧵 {c.name}: queued as job #{job_id} — progress is shown under Background jobs.")
+                    upload_jobs.append(job_id)
+                else:
+                    st.info(f"{c.name}: {folder} already has a queued or running job.")
+                    upload_jobs += [j["id"] for j in [get_default_queue().active_for(c.store, folder)] if j]
+            if move_after_upload and fanout_clients:
+                move_id = get_default_queue().enqueue("move", folder, shop_client.store,
+                                                      {"designs_root": DESIGNS_ROOT, "after": upload_jobs})
+                st.caption(f"📦 Job #{move_id} moves {folder} to /finished once every store's upload is done.")
         else:
             design_start = time.perf_counter()
-            df = st.session_state.auto_df
+            df = get_default_store().load_dataframe(auto_ref)
             meta = st.session_state.auto_meta
 
-            if do_google_guard:
-                sheet = connect_to_sheet("SKU Tracker")
-                existing = [row[0].strip().upper() for row in sheet.get_all_values()[1:]]
+            # A design the ledger already knows about reserved its suffix on the first run
+            if do_google_guard and not ledger_note(df, shop_client):
                 sku_suffix = meta.get("sku_suffix","").strip().upper()
-                if sku_suffix in existing:
+                if not reserve_suffix(sku_suffix, "StreamlitAuto"):
                     st.error(f"❌ SKU suffix already used: {sku_suffix}")
                     st.stop()
-                sheet.append_row([sku_suffix, "StreamlitAuto", datetime.now().isoformat()])
 
-            with st.status("🚀 Uploading to Shopify…", expanded=True) as s:
-                try:
-                    def emit(msg: str): s.write(msg)
-                    cap = variant_cap if variant_cap > 0 else None
-                    results = upload_products_from_df(df, progress=emit, variant_budget=cap)
-                    s.update(label="✅ Upload complete")
-                    st.success(f"Uploaded {len(results)} products.")
-                    st.json(results)
-                except ShopifyError as e:
-                    if str(e).startswith("DAILY_VARIANT_LIMIT:"):
-                        s.update(label="⛔ Daily variant creation limit hit")
-                        st.error("You’ve hit Shopify’s daily variant creation limit. Use CSV import now or resume via API tomorrow.")
+            clients = run_clients()
+            if fanout_clients:
+                statuses = {c.name: st.status(f"🚀 {c.name}: uploading…", expanded=True) for c in clients}
+                sinks = {name: StreamlitProgressSink(box) for name, box in statuses.items()}
+                per_store = workflow.upload_csv_to_stores(
+                    dbx, DESIGNS_ROOT, folder, st.session_state.auto_csv_name, clients, lambda c: sinks[c.name],
+                    job_options(False, do_store_preflight, abort_on_conflict, variant_budget=variant_cap))
+                for name, rows in per_store.items():
+                    sinks[name].flush()
+                    _, status, detail, _ = rows[0]
+                    statuses[name].update(label=f"{JOB_ICONS.get(status, status)} {name}: {status}"
+                                                + (f" — {detail}" if detail else ""), expanded=status != "done")
+                if move_after_upload and all(rows[0][1] == "done" for rows in per_store.values()):
+                    try:
+                        st.success(f"📦 Moved folder to: {finish_design(folder)}")
+                    except Exception as e:
+                        st.warning(f"Uploaded, but move_to_finished failed: {e}")
+            else:
+                with st.status("🚀 Uploading to Shopify…", expanded=True) as s:
+                    emit = StreamlitProgressSink(s)
+                    try:
+                        note = ledger_note(df, shop_client)
+                        if note: emit(note)
+                        if do_store_preflight:
+                            df = store_preflight(df, emit, abort_on_conflict=abort_on_conflict, client=clients[0])
+                        if df is None:
+                            s.update(label="⛔ Pre-flight found products already in the store")
+                        else:
+                            cap = variant_cap if variant_cap > 0 else None
+                            results = upload_products_from_df(df, progress=emit, variant_budget=cap, client=clients[0])
+                            s.update(label="✅ Upload complete")
+                            queued = defer_leftovers(folder, st.session_state.auto_csv_name, results, shop_client)
+                            st.success(f"Uploaded {len(results) - queued} products.")
+                            if queued:
+                                st.info(f"⏸️ {queued} product(s) didn't fit today's variant quota and were queued — "
+                                        "they upload automatically on the next batch run once the quota frees up.")
+                            st.json(results)
+                    except ShopifyError as e:
+                        queued = 0
+                        if str(e).startswith("DAILY_VARIANT_LIMIT:"):
+                            s.update(label="⛔ Daily variant creation limit hit")
+                            quota_gate(folder, df, st.session_state.auto_csv_name, emit, client=shop_client)
+                            st.error("You’ve hit Shopify’s daily variant creation limit. The design was queued and resumes once the quota frees up — finished products are skipped via the upload ledger.")
+                        else:
+                            s.update(label="❌ Shopify upload failed"); st.error(f"Shopify error: {e}")
+                    except Exception as e:
+                        queued = 0
+                        s.update(label="❌ Unexpected error during upload"); st.error(f"Unexpected error: {e}")
                     else:
-                        s.update(label="❌ Shopify upload failed"); st.error(f"Shopify error: {e}")
-                except Exception as e:
-                    s.update(label="❌ Unexpected error during upload"); st.error(f"Unexpected error: {e}")
-                else:
-                    if move_after_upload:
-                        try:
-                            final_path = move_to_finished(get_dropbox_client(), DESIGNS_ROOT, folder, finished_dir="finished")
-                            st.success(f"📦 Moved folder to: {final_path}")
-                        except Exception as e:
-                            st.warning(f"Uploaded, but move_to_finished failed: {e}")
+                        if move_after_upload and df is not None and not queued:
+                            try:
+                                final_path = finish_design(folder)
+                                st.success(f"📦 Moved folder to: {final_path}")
+                            except Exception as e:
+                                st.warning(f"Uploaded, but move_to_finished failed: {e}")
+                    finally:
+                        emit.flush()
             st.info(f"⏱ Upload finished in {fmt_secs(time.perf_counter() - design_start)}")
+            render_http_metrics("auto_upload", clients[0].metrics)
 
     # ---------- Batch CSV (no upload) ----------
     st.markdown("### 🧾 Batch CSV (no upload)")
@@ -801,36 +845,31 @@ with tab_auto:
         batch_start = time.perf_counter()
         try:
             targets = [folder] if only_selected else list(ready_folders)
-            dfs = []
-            for fname in targets:
-                df_i, _, _ = build_design_dataframe(dbx, fname, excluded_colors=excluded_colors)
-
-                dfs.append(df_i)
+            with st.status(f"Building {len(targets)} design(s)…", expanded=False) as s:
+                emit = StreamlitProgressSink(s)
+                built_designs = design_builder.build_designs_parallel(dbx, DESIGNS_ROOT, targets, progress=emit)
+                emit.flush()
+            errors = [(f, e) for f, _, _, _, e in built_designs if e is not None]
+            for f, e in errors:
+                st.error(f"{f}: {e}")
+            if errors:
+                st.stop()
+            dfs = [df_i for _, df_i, _, _, _ in built_designs]
 
             if not dfs:
                 st.warning("No dataframes built.")
                 st.stop()
 
             all_df = pd.concat(dfs, ignore_index=True)
-            chunks = _split_df_by_limits(all_df)
-
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            built = []
-            files = []
-            for i, cdf in enumerate(chunks, start=1):
-                csv_bytes = cdf.to_csv(index=False).encode("utf-8-sig")
-                size_kb = len(csv_bytes) / 1024.0
-                fname = f"BATCH_{ts}_part{i}.csv"
-                files.append((fname, csv_bytes))
-                built.append((fname, len(cdf), size_kb))
-
-            # Store in session so buttons persist
-            _stash_downloads("batch_csv_files", files)
+            # Parts stream straight into the artifact store; session_state keeps only the refs
+            parts = export_parts_to_store(all_df, f"BATCH_{ts}", CSV_MAX_MB, CSV_MAX_ROWS)
+            st.session_state["batch_csv_files"] = [ref for ref, _ in parts]
 
             _render_downloads("batch_csv_files", "Your batch CSV file(s)", zip_name_prefix="BATCH")
 
-            total_rows = sum(r for _, r, _ in built)
-            st.success(f"Built {len(built)} CSV file(s) under {CSV_MAX_MB} MB each, total {total_rows} rows.")
+            total_rows = sum(n for _, n in parts)
+            st.success(f"Built {len(parts)} CSV file(s) under {CSV_MAX_MB} MB each, total {total_rows} rows.")
             st.session_state.batch_targets = targets
 
         finally:
@@ -865,63 +904,77 @@ with tab_auto:
             s.update(label=f"Done. {ok}/{len(targets)} archived.")
 
     # -------- Original batch uploader (unchanged) --------
-    if st.button("⚙️ Build & Upload ALL ready folders"):
+    use_bulk = st.checkbox("Use Shopify Bulk Operations for the whole batch", value=False,
+                           help="Builds every design first, then creates all products in one server-side "
+                                "bulk job instead of per-product requests.")
+    quota = get_default_quota()
+    store_url = shop_client.store
+    queued_items = quota.queued(store_url) if quota else []
+    if quota:
+        st.caption(f"📊 Daily variant quota: {quota.describe(store_url)} "
+                   f"(rolling 24h, {len(queued_items)} design(s) queued)")
+    if queued_items:
+        with st.expander(f"⏸️ Quota queue ({len(queued_items)})"):
+            st.dataframe(pd.DataFrame([{
+                "Design": i["design"],
+                "Products": len(i["handles"]),
+                "Variants": i["variants"],
+                "Queued": datetime.fromtimestamp(i["created_at"]).strftime("%Y-%m-%d %H:%M"),
+                "ETA": quota_eta(quota, store_url, i["variants"]),
+            } for i in queued_items]), use_container_width=True)
+            if st.button("▶️ Upload queued designs that fit now"):
+                run = shop_client.for_run()
+                summary, _ = run_workflow(lambda emit_for: workflow.resume_quota_queue(
+                    dbx, DESIGNS_ROOT, emit_for, job_options(move_after_upload, do_store_preflight, abort_on_conflict),
+                    client=run), move_after_upload)
+                render_batch_summary(summary)
+                render_http_metrics("quota_queue", run.metrics)
+
+    batch_clicked = st.button("⚙️ Build & Upload ALL ready folders")
+    options = job_options(move_after_upload, do_store_preflight, abort_on_conflict,
+                          sku_lister="StreamlitBatch" if do_google_guard else None)
+    if batch_clicked and run_in_background:
+        queued = []
+        # Queued designs go first so the oldest work gets today's quota
+        if queued_items and enqueue_job("resume", "quota queue", {"options": options}):
+            queued.append("quota queue")
+        if use_bulk:
+            # One bulk job needs every design in the same worker
+            todo = [f for f in ready_folders if f not in {i["design"] for i in queued_items}]
+            if todo and enqueue_job("upload", f"bulk: {len(todo)} designs", {
+                    "designs": todo, "options": {**options, "bulk": True}}):
+                queued.append(f"bulk job ({len(todo)} designs)")
+        else:
+            for f in ready_folders:
+                if f not in {i["design"] for i in queued_items} and enqueue_job("upload", f, {"designs": [f], "options": options}):
+                    queued.append(f)
+        if queued:
+            st.success(f"🧵 Queued {len(queued)} job(s): {', '.join(queued)}")
+        else:
+            st.info("Nothing new to queue — every ready folder already has a job.")
+    elif batch_clicked:
         batch_start = time.perf_counter()
-        summary = []
-        for fname in ready_folders:
-            fpath = f"{DESIGNS_ROOT}/{fname}"
-            with st.status(f"📦 {fname}: starting…", expanded=True) as s:
-                t0 = time.perf_counter()
-                try:
-                    df, meta, missing = build_design_dataframe(dbx, folder, excluded_colors=excluded_colors)
-
-                    if missing: s.write(f"⚠️ Missing images: {missing[:10]}{'…' if len(missing)>10 else ''}")
-                    else: s.write("✅ All image links fetched")
-                    s.write("✅ DataFrame ready")
-
-                    if do_google_guard:
-                        sheet = connect_to_sheet("SKU Tracker")
-                        existing = [row[0].strip().upper() for row in sheet.get_all_values()[1:]]
-                        sku_suffix = meta.get("sku_suffix","").strip().upper()
-                        if sku_suffix in existing:
-                            s.update(label=f"❌ {fname}: SKU already used")
-                            summary.append((fname, False, "SKU used", time.perf_counter()-t0))
-                            continue
-                        sheet.append_row([sku_suffix, "StreamlitBatch", datetime.now().isoformat()])
-
-                    local_name = f"{meta.get('sku_suffix','').strip().upper()}.csv"
-                    df.to_csv(local_name, index=False, encoding="utf-8-sig")
-                    s.write(f"📝 CSV saved: {local_name}")
-
-                    def emit(msg: str): s.write(msg)
-                    results = upload_products_from_df(df, progress=emit)
-                    s.update(label=f"✅ {fname}: upload complete")
-                    summary.append((fname, True, "", time.perf_counter()-t0))
-
-                    if move_after_upload:
-                        try:
-                            final_path = move_to_finished(get_dropbox_client(), DESIGNS_ROOT, fname, finished_dir="finished")
-                            s.write("📦 Moved to /finished")
-                        except Exception as e:
-                            s.write(f"⚠️ Move failed: {e}")
-
-                except ShopifyError as e:
-                    if str(e).startswith("DAILY_VARIANT_LIMIT:"):
-                        s.update(label=f"⛔ {fname}: daily variant creation limit hit")
-                        summary.append((fname, False, "Daily variant limit", time.perf_counter()-t0))
-                        break
-                    else:
-                        s.update(label=f"❌ {fname}: failed")
-                        summary.append((fname, False, str(e), time.perf_counter()-t0))
-                except Exception as e:
-                    s.update(label=f"❌ {fname}: failed")
-                    summary.append((fname, False, str(e), time.perf_counter()-t0))
+        run = shop_client.for_run()
+        if do_google_guard:
+            sku_registry()   # bind the shared registry to the cached SKU Tracker sheet before the run uses it
+        # Queued designs go first so the oldest work gets today's quota; next builds prefetch while one uploads
+        summary, panels = run_workflow(lambda emit_for: workflow.upload_designs(
+            dbx, DESIGNS_ROOT, ready_folders, emit_for, {**options, "bulk": use_bulk}, resume=True,
+            client=run), move_after_upload)
 
         total = time.perf_counter() - batch_start
         st.subheader("Batch summary")
-        for name, ok, err, secs in summary:
-            if ok:
-                st.write(f"• {name}: ✅ {fmt_secs(secs)}")
-            else:
-                st.write(f"• {name}: ❌ {fmt_secs(secs)} — {err}")
+        render_batch_summary(summary)
         st.info(f"⏱ All ready folders processed in {fmt_secs(total)}")
+        built = [sink.agg.snapshot() for _, sink in panels.values()]
+        build_total = sum(b["build_seconds"] for b in built)
+        if build_total:
+            st.caption(f"Dropbox builds took {fmt_secs(build_total)} in total; uploads waited on them "
+                       f"for {fmt_secs(sum(b['build_wait_seconds'] for b in built))} "
+                       "(the rest overlapped with uploading)")
+        render_http_metrics("batch_upload", run.metrics)
+
+    render_jobs_panel()
+
+startup.mark("auto tab")
+render_startup_profile()
@@ -0,0 +1,220 @@
+# bench/bench_csv_pipeline.py
+"""
+CSV generation pipeline benchmark: time and peak memory per stage for
+synthetic designs built from the real constants/ config, compared with a
+stored baseline.
+
+Stages, each fed the previous stage's output:
+    generate         generate_sku_dataframe per design + concat
+    image_src        ensure_image_src_column
+    seo_description  _meta_150_last_sentence per distinct Body (HTML) (text_derive.map_unique)
+    csv_fields       ensure_shopify_csv_fields (SEO Description + custom label)
+    split_csv        csv_chunker.split_csv at SHOPIFY_PRODUCT_CSV_MAX_MB
+    export_parts     csv_export.export_parts_to_dir, the same parts streamed to files
+    to_csv           DataFrame.to_csv(encoding="utf-8-sig") to a file
+    write_csv        csv_export.write_csv, the same file streamed in blocks
+
+    python -m bench.bench_csv_pipeline                       # 1, 10, 100, 1000 designs vs the baseline
+    python -m bench.bench_csv_pipeline --sizes 1 10 100 --repeat 3
+    python -m bench.bench_csv_pipeline --update-baseline     # store this run as the new baseline
+
+The text_derive memo caches are cleared before every run, so each one
+derives from scratch. Time is the best of --repeat runs with tracing off;
+peak memory comes from one extra run under tracemalloc (Python allocations,
+which covers pandas object columns and CSV buffers). A stage is flagged when it is more than
+--tolerance times the baseline and the difference is above the noise floor
+(--min-ms / --min-mb). Exit code 1 when anything regressed.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from bench.synthetic import design_kwargs
+from utils.sku_generator import generate_sku_dataframe
+from utils.design_builder import ensure_image_src_column, ensure_shopify_csv_fields, _meta_150_last_sentence
+from utils.csv_chunker import split_csv
+from utils.csv_export import write_csv, export_parts_to_dir
+from utils.text_derive import map_unique, clear_caches
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "csv_pipeline_baseline.json")
+DEFAULT_SIZES = [1, 10, 100, 1000]
+CSV_MAX_MB = float(os.getenv("SHOPIFY_PRODUCT_CSV_MAX_MB", "14.5"))
+
+
+def _generate(n):
+    return pd.concat([generate_sku_dataframe(**design_kwargs(i, "https://bench.invalid"))
+                      for i in range(1, n + 1)], ignore_index=True)
+
+
+def _seo_description(df):
+    df["SEO Description"] = map_unique(df["Body (HTML)"], _meta_150_last_sentence)
+    return df
+
+
+def _to_csv(df, out_dir):
+    path = os.path.join(out_dir, "bench.csv")
+    df.to_csv(path, index=False, encoding="utf-8-sig")
+    return df
+
+
+# name, fn(input) -> output, whether fn mutates its input (each run then gets a fresh copy)
+STAGES = [
+    ("image_src", ensure_image_src_column, True),
+    ("seo_description", _seo_description, True),
+    ("csv_fields", ensure_shopify_csv_fields, True),
+    ("split_csv", lambda df: (split_csv(df, CSV_MAX_MB), df)[1], False),
+]
+
+
+def measure(fn, arg, repeat: int, memory: bool, copy: bool = False):
+    """(output, best seconds, peak MB or None) for fn(arg)."""
+    best, out = None, None
+    for _ in range(repeat):
+        inp = arg.copy() if copy else arg
+        clear_caches()
+        gc.collect()
+        t0 = time.perf_counter()
+        out = fn(inp)
+        secs = time.perf_counter() - t0
+        best = secs if best is None else min(best, secs)
+    peak = None
+    if memory:
+        inp = arg.copy() if copy else arg
+        clear_caches()
+        gc.collect()
+        tracemalloc.start()
+        fn(inp)
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return out, best, peak
+
+
+def run_size(n: int, repeat: int, memory: bool) -> dict:
+    stages = {}
+
+    def record(name, secs, peak):
+        stages[name] = {"seconds": round(secs, 4), "peak_mb": round(peak, 2) if peak is not None else None}
+
+    # generate scales linearly and dominates large sizes; one timed run is enough there
+    df, secs, peak = measure(_generate, n, repeat if n <= 100 else 1, memory)
+    record("generate", secs, peak)
+    for name, fn, mutates in STAGES:
+        df, secs, peak = measure(fn, df, repeat, memory, copy=mutates)
+        record(name, secs, peak)
+    with tempfile.TemporaryDirectory() as tmp:
+        _, secs, peak = measure(lambda d: export_parts_to_dir(d, tmp, "bench", CSV_MAX_MB), df, repeat, memory)
+        record("export_parts", secs, peak)
+        _, secs, peak = measure(lambda d: _to_csv(d, tmp), df, repeat, memory)
+        record("to_csv", secs, peak)
+        _, secs, peak = measure(lambda d: write_csv(d, os.path.join(tmp, "bench.csv")), df, repeat, memory)
+        record("write_csv", secs, peak)
+    return {"designs": n, "rows": len(df), "products": int(df["Handle"].nunique()), "stages": stages}
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(terse=True),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float, min_ms: float, min_mb: float) -> list[str]:
+    """Regression lines for stages slower / bigger than baseline beyond tolerance and the noise floor."""
+    base = {str(r["designs"]): r["stages"] for r in baseline.get("results", [])}
+    flagged = []
+    for r in results:
+        for stage, now in r["stages"].items():
+            then = base.get(str(r["designs"]), {}).get(stage)
+            if not then:
+                continue
+            if (now["seconds"] > then["seconds"] * tolerance
+                    and (now["seconds"] - then["seconds"]) * 1000 > min_ms):
+                flagged.append(f"{r['designs']:>5} designs  {stage:<16} time {then['seconds']:.3f}s → "
+                               f"{now['seconds']:.3f}s ({now['seconds'] / then['seconds']:.2f}×)")
+            if (now["peak_mb"] is not None and then.get("peak_mb")
+                    and now["peak_mb"] > then["peak_mb"] * tolerance and now["peak_mb"] - then["peak_mb"] > min_mb):
+                flagged.append(f"{r['designs']:>5} designs  {stage:<16} peak {then['peak_mb']:.1f}MB → "
+                               f"{now['peak_mb']:.1f}MB ({now['peak_mb'] / then['peak_mb']:.2f}×)")
+    return flagged
+
+
+def print_table(results: list[dict], baseline: dict):
+    base = {str(r["designs"]): r["stages"] for r in baseline.get("results", [])}
+    print(f"{'designs':>7} {'rows':>8}  {'stage':<16}{'ms':>10}{'peak MB':>10}{'base ms':>10}{'ratio':>8}")
+    for r in results:
+        for stage, now in r["stages"].items():
+            then = base.get(str(r["designs"]), {}).get(stage)
+            ratio = f"{now['seconds'] / then['seconds']:.2f}" if then and then["seconds"] else "-"
+            peak = f"{now['peak_mb']:.1f}" if now["peak_mb"] is not None else "-"
+            print(f"{r['designs']:>7} {r['rows']:>8}  {stage:<16}{now['seconds'] * 1000:>10.1f}{peak:>10}"
+                  f"{then['seconds'] * 1000 if then else float('nan'):>10.1f}{ratio:>8}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the CSV generation pipeline against a stored baseline")
+    ap.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="design counts to run")
+    ap.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is kept)")
+    ap.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc runs")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true", help="write this run to --baseline")
+    ap.add_argument("--tolerance", type=float, default=1.5, help="flag stages above this multiple of the baseline")
+    ap.add_argument("--min-ms", type=float, default=20.0, help="ignore time differences below this")
+    ap.add_argument("--min-mb", type=float, default=5.0, help="ignore peak memory differences below this")
+    ap.add_argument("--json", help="write this run's results to this file")
+    args = ap.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = []
+    for n in args.sizes:
+        t0 = time.perf_counter()
+        results.append(run_size(n, args.repeat, args.memory))
+        print(f"… {n} design(s) done in {time.perf_counter() - t0:.1f}s", file=sys.stderr, flush=True)
+
+    run = {"environment": environment(), "csv_max_mb": CSV_MAX_MB, "results": results}
+    print_table(results, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+
+    if args.update_baseline:
+        # Keep baseline entries for sizes this run didn't cover
+        kept = [r for r in baseline.get("results", []) if r["designs"] not in set(args.sizes)]
+        run["results"] = sorted(kept + results, key=lambda r: r["designs"])
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to store one.")
+        return 0
+    if baseline.get("environment") != run["environment"]:
+        print(f"⚠️ Baseline was recorded on {baseline.get('environment')}; this run is {run['environment']}.")
+    flagged = compare(results, baseline, args.tolerance, args.min_ms, args.min_mb)
+    if flagged:
+        print(f"\n⛔ {len(flagged)} regression(s) over {args.tolerance}× the baseline:")
+        for line in flagged:
+            print("  " + line)
+        return 1
+    print(f"\n✅ No stage over {args.tolerance}× the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
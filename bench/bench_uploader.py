@@ -0,0 +1,117 @@
+# bench/bench_uploader.py
+"""
+Uploader throughput benchmark against the local Shopify stand-in.
+
+Builds synthetic multi-design DataFrames from the real constants/ config,
+uploads them with upload_products_from_df (or bulk_upload_from_df with
+--bulk) and reports products per minute, requests per product, 429s and
+wire vs sleep time.
+
+    python -m bench.bench_uploader --designs 3 --scenario throttled
+    python -m bench.bench_uploader --designs 3 --scenario throttled --bulk
+    python -m bench.bench_uploader --designs 2 --scenario all --json bench_uploader.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.shopify_standin import start_standin
+from bench.synthetic import synthetic_designs
+
+SCENARIOS = {
+    # name: stand-in config
+    "baseline":    {"bucket_size": 1000, "leak_rate": 1000.0},
+    "throttled":   {"bucket_size": 40, "leak_rate": 2.0},
+    "storm":       {"bucket_size": 40, "leak_rate": 2.0, "storm_every": 150, "storm_length": 4},
+    "slow":        {"bucket_size": 40, "leak_rate": 2.0, "latency": 0.05, "slow_rate": 0.05, "slow_seconds": 2.0},
+    "image422":    {"bucket_size": 40, "leak_rate": 2.0, "image_422_rate": 0.3},
+    "daily-limit": {"bucket_size": 40, "leak_rate": 2.0, "daily_variant_limit": 1000},
+}
+
+
+def run_scenario(name, designs, cooldown, bulk=False):
+    server, state, base = start_standin(**SCENARIOS[name])
+    os.environ["SHOPIFY_STORE_URL"] = base
+    os.environ["SHOPIFY_API_PASSWORD"] = "bench"
+    from utils import shopify_utils
+    from utils.shopify_bulk import bulk_upload_from_df
+    from utils.upload_ledger import UploadLedger
+    from utils.variant_quota import VariantQuota
+
+    shopify_utils.CREATE_COOLDOWN = cooldown
+    df = synthetic_designs(designs, base)
+    handles = df["Handle"].nunique()
+
+    client = shopify_utils.client_for(base, "bench").for_run()
+    error = None
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = UploadLedger(os.path.join(tmp, "ledger.sqlite3"))
+        quota = VariantQuota(os.path.join(tmp, "quota.sqlite3"))
+        t0 = time.perf_counter()
+        upload = bulk_upload_from_df if bulk else shopify_utils.upload_products_from_df
+        try:
+            results = upload(df, progress=lambda m: None, ledger=ledger, quota=quota, client=client)
+            failed = [r for r in results if r["status"] == "failed"]
+            if failed:
+                error = f"{len(failed)} failed, e.g. {failed[0]['handle_or_title']}: {failed[0].get('errors')}"[:120]
+        except shopify_utils.ShopifyError as e:
+            error = str(e)[:120]
+        wall = time.perf_counter() - t0
+        ledger.close()
+        quota.close()
+    server.shutdown()
+
+    snap = client.metrics.snapshot()["endpoints"]
+    counts = state.summary()
+    created = counts["products"]
+    return {
+        "scenario": name,
+        "mode": "bulk" if bulk else "rest",
+        "designs": designs,
+        "handles": handles,
+        "products_created": created,
+        "wall_seconds": round(wall, 2),
+        "products_per_minute": round(created / wall * 60, 1) if wall else 0.0,
+        "requests": counts["requests"],
+        "requests_per_product": round(counts["requests"] / created, 2) if created else None,
+        "http_429": counts["429"],
+        "http_5xx": counts["5xx"],
+        "image_422": counts["422"],
+        "wire_seconds": round(sum(e["wire_seconds"] for e in snap), 2),
+        "sleep_seconds": round(sum(e["sleep_seconds"] for e in snap), 2),
+        "error": error,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark upload_products_from_df against the local stand-in")
+    ap.add_argument("--designs", type=int, default=1)
+    ap.add_argument("--scenario", default="throttled", choices=sorted(SCENARIOS) + ["all"])
+    ap.add_argument("--cooldown", type=float, default=float(os.getenv("SHOPIFY_PRODUCT_CREATE_COOLDOWN", "1.0")),
+                    help="SHOPIFY_PRODUCT_CREATE_COOLDOWN to use for the run")
+    ap.add_argument("--bulk", action="store_true", help="create through Bulk Operations (productSet) instead of REST")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args(argv)
+
+    names = sorted(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    rows = []
+    for name in names:
+        row = run_scenario(name, args.designs, args.cooldown, bulk=args.bulk)
+        rows.append(row)
+        print(f"{row['scenario']:<12} {row['products_created']:>4} products in {row['wall_seconds']:>7.1f}s  "
+              f"{row['products_per_minute']:>6.1f}/min  {row['requests_per_product'] or 0:>5.1f} req/product  "
+              f"429={row['http_429']} 5xx={row['http_5xx']} 422={row['image_422']}  "
+              f"wire={row['wire_seconds']}s sleep={row['sleep_seconds']}s"
+              + (f"  ⛔ {row['error']}" if row["error"] else ""))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
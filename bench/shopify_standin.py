@@ -0,0 +1,458 @@
+# bench/shopify_standin.py
+"""
+Local stand-in for the parts of the Shopify Admin API the uploader uses.
+
+REST:     POST products.json, POST products/{id}/images.json, PUT variants/{id}.json
+GraphQL:  products / productVariants search (pre-flight, catalog sync), stagedUploadsCreate,
+          productUpdate, productVariantsBulkUpdate, productSet (create), bulkOperationRunMutation
+          for those three (runs at once; node(id) polls report COMPLETED with a results URL)
+Staged:   POST /staged/<key> (multipart), GET /staged/<key>
+
+Emulates the REST leaky bucket (X-Shopify-Shop-Api-Call-Limit + 429 Retry-After),
+5xx storms, slow responses, image-fetch 422s and the daily variant creation limit.
+
+    python -m bench.shopify_standin --port 8787 --bucket 40 --leak 2 --storm-every 200
+    SHOPIFY_STORE_URL=http://127.0.0.1:8787 SHOPIFY_API_PASSWORD=x streamlit run app.py
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULTS = {
+    "bucket_size": 40,            # REST leaky bucket capacity
+    "leak_rate": 2.0,             # requests drained per second
+    "latency": 0.0,               # base latency added to every response (s)
+    "slow_rate": 0.0,             # share of responses delayed by slow_seconds
+    "slow_seconds": 3.0,
+    "storm_every": 0,             # every N requests start a 5xx storm (0 = off)
+    "storm_length": 5,            # consecutive 503s per storm
+    "image_422_rate": 0.0,        # share of image src uploads answered with "Could not download image"
+    "daily_variant_limit": 0,     # variants creatable before the daily-limit 429 (0 = unlimited)
+    "seed": 7,
+}
+
+
+class StandinState:
+    """Shared in-memory store plus rate-limit bookkeeping for all handler threads."""
+
+    def __init__(self, **config):
+        self.config = dict(DEFAULTS, **{k: v for k, v in config.items() if v is not None})
+        self.lock = threading.Lock()
+        self.rng = random.Random(self.config["seed"])
+        self.next_id = 1000
+        self.products = {}           # id -> product dict
+        self.variants = {}           # id -> variant dict
+        self.staged = {}             # key -> bytes
+        self.bulk_ops = {}           # gid -> BulkOperation node
+        self.bucket = 0.0
+        self.bucket_ts = time.monotonic()
+        self.variants_created = 0
+        self.storm_left = 0
+        self.counts = {"requests": 0, "429": 0, "5xx": 0, "422": 0, "daily_limit": 0}
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def take_token(self):
+        """Leak the bucket, then try to add this request. Returns (ok, used, cap)."""
+        cap = int(self.config["bucket_size"])
+        now = time.monotonic()
+        self.bucket = max(0.0, self.bucket - (now - self.bucket_ts) * float(self.config["leak_rate"]))
+        self.bucket_ts = now
+        if self.bucket + 1 > cap:
+            return False, int(self.bucket), cap
+        self.bucket += 1
+        return True, int(round(self.bucket)), cap
+
+    def storm(self):
+        every = int(self.config["storm_every"])
+        if self.storm_left > 0:
+            self.storm_left -= 1
+            return True
+        if every and self.counts["requests"] % every == 0:
+            self.storm_left = int(self.config["storm_length"]) - 1
+            return True
+        return False
+
+    def summary(self):
+        with self.lock:
+            return dict(self.counts, products=len(self.products), variants=self.variants_created)
+
+
+_REST_RE = re.compile(r"^/admin/api/[^/]+/(?P<path>.+)$")
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    state: StandinState = None
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024   # headers + body leave in one write (flushed per request)
+
+    def log_message(self, fmt, *args):  # keep benchmark output clean
+        pass
+
+    # ---------- plumbing ----------
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def _send(self, status, payload=None, headers=None, raw=None, ctype="application/json"):
+        data = raw if raw is not None else json.dumps(payload or {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _delay(self):
+        cfg = self.state.config
+        delay = float(cfg["latency"])
+        with self.state.lock:
+            if cfg["slow_rate"] and self.state.rng.random() < float(cfg["slow_rate"]):
+                delay += float(cfg["slow_seconds"])
+        if delay > 0:
+            time.sleep(delay)
+
+    def _admin_gate(self):
+        """Common 5xx-storm / leaky-bucket handling. Returns call-limit headers, or None if answered."""
+        st = self.state
+        with st.lock:
+            st.counts["requests"] += 1
+            if st.storm():
+                st.counts["5xx"] += 1
+                storm = True
+            else:
+                storm = False
+                ok, used, cap = st.take_token()
+                if not ok:
+                    st.counts["429"] += 1
+        self._delay()
+        if storm:
+            self._send(503, {"errors": "Service Unavailable (stand-in storm)"})
+            return None
+        if not ok:
+            self._send(429, {"errors": "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."},
+                       headers={"Retry-After": "2.0", "X-Shopify-Shop-Api-Call-Limit": f"{cap}/{cap}"})
+            return None
+        return {"X-Shopify-Shop-Api-Call-Limit": f"{used}/{cap}"}
+
+    # ---------- routing ----------
+
+    def do_GET(self):
+        if self.path.startswith("/staged/"):
+            data = self.state.staged.get(self.path[len("/staged/"):])
+            if data is None:
+                return self._send(404, {"errors": "Not Found"})
+            return self._send(200, raw=data, ctype="application/octet-stream")
+        if self.path.startswith("/img/"):
+            # Fake origin images for the benchmark's image links
+            return self._send(200, raw=b"\x89PNG\r\n\x1a\n" + b"0" * 2048, ctype="image/png")
+        self._send(404, {"errors": "Not Found"})
+
+    def do_POST(self):
+        if self.path.startswith("/staged/"):
+            self.state.staged[self.path[len("/staged/"):]] = self._body()
+            return self._send(201, {})
+        m = _REST_RE.match(self.path)
+        if not m:
+            return self._send(404, {"errors": "Not Found"})
+        body = self._body()
+        headers = self._admin_gate()
+        if headers is None:
+            return
+        path = m.group("path")
+        payload = json.loads(body or b"{}")
+        if path == "products.json":
+            return self._create_product(payload.get("product") or {}, headers)
+        im = re.match(r"^products/(\d+)/images\.json$", path)
+        if im:
+            return self._create_image(int(im.group(1)), payload.get("image") or {}, headers)
+        if path == "graphql.json":
+            return self._graphql(payload, headers)
+        self._send(404, {"errors": "Not Found"}, headers)
+
+    def do_PUT(self):
+        m = _REST_RE.match(self.path)
+        if not m:
+            return self._send(404, {"errors": "Not Found"})
+        body = self._body()
+        headers = self._admin_gate()
+        if headers is None:
+            return
+        vm = re.match(r"^variants/(\d+)\.json$", m.group("path"))
+        if not vm:
+            return self._send(404, {"errors": "Not Found"}, headers)
+        st = self.state
+        with st.lock:
+            variant = st.variants.get(int(vm.group(1)))
+            if variant is None:
+                return self._send(404, {"errors": "Not Found"}, headers)
+            variant.update({k: v for k, v in (json.loads(body).get("variant") or {}).items() if k != "id"})
+            return self._send(200, {"variant": dict(variant)}, headers)
+
+    # ---------- REST resources ----------
+
+    def _create_product(self, product, headers):
+        st = self.state
+        variants_in = product.get("variants") or []
+        with st.lock:
+            limit = int(st.config["daily_variant_limit"])
+            if limit and st.variants_created + len(variants_in) > limit:
+                st.counts["daily_limit"] += 1
+                return self._send(429, {"errors": {"product": [
+                    "Daily variant creation limit reached. Please try again later."]}}, headers)
+            pid = st.new_id()
+            handle = re.sub(r"[^a-z0-9]+", "-", str(product.get("title", "")).lower()).strip("-")
+            while any(p["handle"] == handle for p in st.products.values()):
+                handle += "-1"
+            variants = []
+            for v in variants_in:
+                vid = st.new_id()
+                variant = dict(v, id=vid, product_id=pid, image_id=None)
+                st.variants[vid] = variant
+                variants.append(variant)
+            images = [dict(img, id=st.new_id(), product_id=pid) for img in product.get("images") or []]
+            st.products[pid] = dict(product, id=pid, handle=handle, variants=variants, images=images)
+            st.variants_created += len(variants)
+            out = dict(st.products[pid], variants=[dict(v) for v in variants])
+        self._send(201, {"product": out}, headers)
+
+    def _create_image(self, pid, image, headers):
+        st = self.state
+        with st.lock:
+            product = st.products.get(pid)
+            if product is None:
+                return self._send(404, {"errors": "Not Found"}, headers)
+            src = image.get("src") or ""
+            fail = (src and not src.startswith(self._self_base() + "/staged/")
+                    and st.config["image_422_rate"] and st.rng.random() < float(st.config["image_422_rate"]))
+            if fail:
+                st.counts["422"] += 1
+                return self._send(422, {"errors": {"image": [f"Could not download image: [\"{src}\"]"]}}, headers)
+            img = dict(image, id=st.new_id(), product_id=pid)
+            product["images"].append(img)
+        self._send(200, {"image": img}, headers)
+
+    def _self_base(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # ---------- GraphQL (just what the uploader asks for) ----------
+
+    def _graphql(self, payload, headers):
+        query = payload.get("query") or ""
+        variables = payload.get("variables") or {}
+        st = self.state
+        if "stagedUploadsCreate" in query:
+            targets = []
+            for inp in variables.get("input") or []:
+                key = f"{int(time.time() * 1000)}-{st.new_id()}-{inp.get('filename', 'file')}"
+                targets.append({
+                    "url": f"{self._self_base()}/staged/{key}",
+                    "resourceUrl": f"{self._self_base()}/staged/{key}",
+                    "parameters": [{"name": "key", "value": key}],
+                })
+            return self._send(200, {"data": {"stagedUploadsCreate": {"stagedTargets": targets, "userErrors": []}}}, headers)
+
+        if "bulkOperationRunMutation" in query:
+            return self._send(200, {"data": {"bulkOperationRunMutation": self._run_bulk(variables)}}, headers)
+        if "node(id:" in query:
+            with st.lock:
+                node = st.bulk_ops.get(variables.get("id"))
+            return self._send(200, {"data": {"node": node}}, headers)
+        if "productUpdate" in query or "productVariantsBulkUpdate" in query or "productSet" in query:
+            with st.lock:
+                return self._send(200, {"data": self._mutate(query, variables)}, headers)
+
+        terms = re.findall(r'(handle|sku):"((?:[^"\\]|\\.)*)"', variables.get("q") or "")
+        with st.lock:
+            if "productVariants" in query:
+                wanted = {v for k, v in terms if k == "sku"}
+                nodes = [{"sku": v.get("sku"),
+                          "product": {"id": f"gid://shopify/Product/{v['product_id']}",
+                                      "handle": st.products[v["product_id"]]["handle"]}}
+                         for v in st.variants.values() if v.get("sku") in wanted]
+                key = "productVariants"
+            elif "products(" in query:
+                wanted = {v for k, v in terms if k == "handle"}
+                full = "descriptionHtml" in query
+                nodes = [self._product_node(p) if full else {"id": f"gid://shopify/Product/{p['id']}", "handle": p["handle"]}
+                         for p in st.products.values() if p["handle"] in wanted]
+                key = "products"
+            else:
+                return self._send(200, {"errors": [{"message": "stand-in does not support this query"}]}, headers)
+        # Offset cursors, so callers that page with first/after see several pages
+        start = int(variables.get("after") or 0)
+        first = int(variables.get("first") or len(nodes) or 1)
+        more = start + first < len(nodes)
+        conn = {"nodes": nodes[start:start + first],
+                "pageInfo": {"hasNextPage": more, "endCursor": str(start + first) if more else None}}
+        self._send(200, {"data": {key: conn}}, headers)
+
+    # ---------- catalog sync / bulk create (call with st.lock held) ----------
+
+    @staticmethod
+    def _product_node(p):
+        variants = [{"id": f"gid://shopify/ProductVariant/{v['id']}", "sku": v.get("sku"), "price": str(v.get("price"))}
+                    for v in p["variants"]]
+        return {
+            "id": f"gid://shopify/Product/{p['id']}", "handle": p["handle"], "title": p.get("title"),
+            "descriptionHtml": p.get("body_html") or "", "vendor": p.get("vendor") or "",
+            "productType": p.get("product_type") or "",
+            "tags": [t.strip() for t in str(p.get("tags") or "").split(",") if t.strip()],
+            "seo": {"title": p.get("metafields_global_title_tag"),
+                    "description": p.get("metafields_global_description_tag")},
+            "variants": {"nodes": variants, "pageInfo": {"hasNextPage": False, "endCursor": None}},
+        }
+
+    def _product_set(self, inp):
+        """productSet as a create: the product, its variants (Size / Colour) and images, like POST products.json."""
+        st = self.state
+        variants_in = inp.get("variants") or []
+        limit = int(st.config["daily_variant_limit"])
+        if limit and st.variants_created + len(variants_in) > limit:
+            st.counts["daily_limit"] += 1
+            return {"productSet": {"product": None, "userErrors": [
+                {"field": ["input", "variants"], "message": "Daily variant creation limit reached. Please try again later."}]}}
+        pid = st.new_id()
+        handle = inp.get("handle") or re.sub(r"[^a-z0-9]+", "-", str(inp.get("title", "")).lower()).strip("-")
+        while any(p["handle"] == handle for p in st.products.values()):
+            handle += "-1"
+        images = {}
+        for f in (inp.get("files") or []) + [v["file"] for v in variants_in if v.get("file")]:
+            src = f.get("originalSource")
+            if src and src not in images:
+                images[src] = {"id": st.new_id(), "product_id": pid, "src": src, "alt": f.get("alt"),
+                               "position": len(images) + 1}
+        variants = []
+        for v in variants_in:
+            opts = {o.get("optionName"): o.get("name") for o in v.get("optionValues") or []}
+            item = v.get("inventoryItem") or {}
+            vid = st.new_id()
+            variant = {"id": vid, "product_id": pid, "option1": opts.get("Size"), "option2": opts.get("Colour"),
+                       "sku": item.get("sku"), "price": v.get("price"), "taxable": v.get("taxable"),
+                       "requires_shipping": item.get("requiresShipping"),
+                       "image_id": images[v["file"]["originalSource"]]["id"] if v.get("file") else None}
+            st.variants[vid] = variant
+            variants.append(variant)
+        seo = inp.get("seo") or {}
+        st.products[pid] = {
+            "id": pid, "handle": handle, "title": inp.get("title"), "body_html": inp.get("descriptionHtml"),
+            "vendor": inp.get("vendor"), "product_type": inp.get("productType"),
+            "tags": ", ".join(inp.get("tags") or []),
+            "metafields_global_title_tag": seo.get("title"), "metafields_global_description_tag": seo.get("description"),
+            "variants": variants, "images": list(images.values()),
+        }
+        st.variants_created += len(variants)
+        return {"productSet": {"product": {
+            "id": f"gid://shopify/Product/{pid}", "handle": handle, "title": inp.get("title"),
+            "variants": {"nodes": [{"id": f"gid://shopify/ProductVariant/{v['id']}",
+                                    "selectedOptions": [{"name": "Size", "value": v["option1"]},
+                                                        {"name": "Colour", "value": v["option2"]}]}
+                                   for v in variants]},
+        }, "userErrors": []}}
+
+    def _mutate(self, query, variables):
+        st = self.state
+        gid_num = lambda gid: int(str(gid).rsplit("/", 1)[-1])
+        if "productSet" in query:
+            return self._product_set(variables.get("input") or {})
+        if "productVariantsBulkUpdate" in query:
+            product = st.products.get(gid_num(variables.get("productId")))
+            if product is None:
+                return {"productVariantsBulkUpdate": {"product": None, "userErrors": [
+                    {"field": ["productId"], "message": "Product does not exist"}]}}
+            errors = []
+            for i, inp in enumerate(variables.get("variants") or []):
+                variant = st.variants.get(gid_num(inp.get("id")))
+                if variant is None or variant["product_id"] != product["id"]:
+                    errors.append({"field": ["variants", str(i), "id"], "message": "Variant does not exist"})
+                elif "price" in inp:
+                    variant["price"] = inp["price"]
+            return {"productVariantsBulkUpdate": {"product": {"id": f"gid://shopify/Product/{product['id']}"},
+                                                  "userErrors": errors}}
+        inp = variables.get("input") or {}
+        product = st.products.get(gid_num(inp.get("id")))
+        if product is None:
+            return {"productUpdate": {"product": None, "userErrors": [
+                {"field": ["id"], "message": "Product does not exist"}]}}
+        for gql, rest in (("title", "title"), ("descriptionHtml", "body_html"), ("vendor", "vendor"),
+                          ("productType", "product_type")):
+            if gql in inp:
+                product[rest] = inp[gql]
+        if "tags" in inp:
+            product["tags"] = ", ".join(inp["tags"])
+        if "seo" in inp:
+            product["metafields_global_title_tag"] = inp["seo"].get("title")
+            product["metafields_global_description_tag"] = inp["seo"].get("description")
+        return {"productUpdate": {"product": {"id": f"gid://shopify/Product/{product['id']}"}, "userErrors": []}}
+
+    def _run_bulk(self, variables):
+        st = self.state
+        mutation = variables.get("mutation") or ""
+        if not any(m in mutation for m in ("productUpdate", "productVariantsBulkUpdate", "productSet")):
+            return {"bulkOperation": None, "userErrors": [{"field": ["mutation"], "message":
+                    "stand-in only runs productUpdate / productVariantsBulkUpdate / productSet in bulk"}]}
+        raw = st.staged.get(variables.get("path") or "")
+        if raw is None:
+            return {"bulkOperation": None, "userErrors": [{"field": ["stagedUploadPath"], "message": "Not staged"}]}
+        # The staged body is the multipart form; the JSONL is the file part
+        lines = [ln for ln in raw.decode("utf-8", "replace").splitlines() if ln.startswith("{")]
+        with st.lock:
+            results = [dict(self._mutate(mutation, json.loads(ln)), __lineNumber=i) for i, ln in enumerate(lines)]
+            op_id = f"gid://shopify/BulkOperation/{st.new_id()}"
+            key = f"bulk-results-{op_id.rsplit('/', 1)[-1]}.jsonl"
+            st.staged[key] = "".join(json.dumps({"data": {k: v for k, v in r.items() if k != "__lineNumber"},
+                                                 "__lineNumber": r["__lineNumber"]}) + "\n" for r in results).encode()
+            st.bulk_ops[op_id] = {"id": op_id, "status": "COMPLETED", "errorCode": None, "objectCount": len(lines),
+                                  "url": f"{self._self_base()}/staged/{key}", "partialDataUrl": None}
+        return {"bulkOperation": {"id": op_id, "status": "CREATED"}, "userErrors": []}
+
+
+def start_standin(host="127.0.0.1", port=0, **config):
+    """Start the stand-in on a daemon thread. Returns (server, state, base_url)."""
+    state = StandinState(**config)
+    handler = type("BoundStandinHandler", (StandinHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    h, p = server.server_address[:2]
+    return server, state, f"http://{h}:{p}"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Local Shopify Admin API stand-in")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--bucket", dest="bucket_size", type=int)
+    ap.add_argument("--leak", dest="leak_rate", type=float)
+    ap.add_argument("--latency", type=float)
+    ap.add_argument("--slow-rate", type=float)
+    ap.add_argument("--slow-seconds", type=float)
+    ap.add_argument("--storm-every", type=int)
+    ap.add_argument("--storm-length", type=int)
+    ap.add_argument("--image-422-rate", type=float)
+    ap.add_argument("--daily-variant-limit", type=int)
+    ap.add_argument("--seed", type=int)
+    args = vars(ap.parse_args(argv))
+    host, port = args.pop("host"), args.pop("port")
+    server, state, url = start_standin(host, port, **args)
+    print(f"Shopify stand-in listening on {url} — set SHOPIFY_STORE_URL={url}")
+    try:
+        while True:
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print(json.dumps(state.summary(), indent=2))
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# bench/synthetic.py
+"""Synthetic designs built from the real constants/ config, shared by the benchmarks."""
+from constants.config import shopify_defaults as d
+from utils.design_builder import _catalog_config
+
+
+def design_kwargs(i, image_base):
+    """generate_sku_dataframe keyword arguments for synthetic design number i."""
+    cfg = _catalog_config()
+    return dict(
+        product_name=f"Bench Design {i}", sku_suffix=f"BENCH{i:04d}", main_color="Black",
+        tags="bench, synthetic", garment_keys=cfg["garment_keys"],
+        raw_descriptions=[f"Synthetic description {i} for {g}. Soft and comfy." for g in cfg["garment_keys"]],
+        body_html_map=cfg["body_html_map"], product_extras=cfg["product_extras"],
+        product_types=cfg["product_types"], correct_colors_by_type=cfg["correct_colors_by_type"],
+        vendor=d["vendor"], published=d["published"], inventory_policy=d["inventory_policy"],
+        fulfillment_service=d["fulfillment_service"], requires_shipping=d["requires_shipping"],
+        taxable=d["taxable"], inventory_tracker=d["inventory_tracker"],
+        image_links={k: f"{image_base}/img/bench{i}/{k}.png" for k in range(1, 81)},
+    )
+
+
+def synthetic_designs(n, image_base):
+    """n designs shaped like build_design_dataframe output, image links under image_base."""
+    import pandas as pd
+    from utils.sku_generator import generate_sku_dataframe
+
+    dfs = []
+    for i in range(1, n + 1):
+        df = generate_sku_dataframe(**design_kwargs(i, image_base))
+        df["Image Src"] = df["Image URL"]
+        dfs.append(df)
+    return pd.concat(dfs, ignore_index=True)
@@ -0,0 +1,387 @@
+# cli.py
+"""
+Headless Dropbox → CSV → Shopify runs, without Streamlit.
+
+    python cli.py ready
+    python cli.py build DESIGN [DESIGN ...] [--out DIR]
+    python cli.py batch-build --all [--out DIR]
+    python cli.py upload --all [--bulk] [--move] [--store prod]
+    python cli.py resume [--move]
+    python cli.py sync --all [--fields price,body_html,seo] [--apply] [--store prod]
+    python cli.py worker [--processes N]
+    python cli.py jobs
+    python cli.py move DESIGN [DESIGN ...]
+    python cli.py archive DESIGN [DESIGN ...]
+
+Reads the same .env / dpbox.env as the app. Progress goes to stderr, the
+per-design summary to stdout. Exit codes: 0 all done, 1 a design failed,
+2 bad configuration or arguments, 3 nothing failed but some work was
+queued for the daily variant quota (run `resume` later).
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from utils import startup
+startup.install()       # APP_STARTUP_PROFILE=1 prints import / init timings to stderr on exit
+startup.begin_run()
+
+EXIT_OK, EXIT_FAILED, EXIT_CONFIG, EXIT_DEFERRED = 0, 1, 2, 3
+
+
+class ConfigError(Exception):
+    pass
+
+
+class ConsoleProgress:
+    """Progress callback that prints one line per event at or above `level`."""
+    accepts_events = True
+
+    def __init__(self, prefix: str = "", level: str = None, stream=None):
+        from utils.progress import PROGRESS_LEVEL
+        self.prefix = f"[{prefix}] " if prefix else ""
+        self.level = level or PROGRESS_LEVEL
+        self.stream = stream or sys.stderr
+
+    def __call__(self, msg):
+        from utils.progress import as_event, level_enabled
+        ev = as_event(msg)
+        if level_enabled(ev.level, self.level):
+            print(f"{datetime.now():%H:%M:%S} {self.prefix}{ev}", file=self.stream, flush=True)
+
+    def flush(self):
+        pass
+
+
+# ---------- environment ----------
+
+def select_store(choice: str = None) -> str:
+    """Point SHOPIFY_STORE_URL / SHOPIFY_API_PASSWORD at the test or prod profile (same env names as the app)."""
+    profiles = {
+        "test": ("SHOPIFY_STORE_URL_TEST", "SHOPIFY_API_PASSWORD_TEST"),
+        "prod": ("SHOPIFY_STORE_URL_PROD", "SHOPIFY_API_PASSWORD_PROD"),
+    }
+    if choice:
+        url_env, token_env = profiles[choice]
+        url, token = (os.getenv(url_env) or "").strip(), (os.getenv(token_env) or "").strip()
+        if not (url and token):
+            raise ConfigError(f"--store {choice}: set {url_env} and {token_env}")
+        os.environ["SHOPIFY_STORE_URL"], os.environ["SHOPIFY_API_PASSWORD"] = url, token
+    elif not os.getenv("SHOPIFY_STORE_URL"):
+        # Same order as the app's store picker: test first, then prod
+        for url_env, token_env in profiles.values():
+            url, token = (os.getenv(url_env) or "").strip(), (os.getenv(token_env) or "").strip()
+            if url and token:
+                os.environ["SHOPIFY_STORE_URL"], os.environ["SHOPIFY_API_PASSWORD"] = url, token
+                break
+    if not os.getenv("SHOPIFY_STORE_URL"):
+        raise ConfigError("No Shopify store configured (SHOPIFY_STORE_URL_* / SHOPIFY_API_PASSWORD_*)")
+    return os.environ["SHOPIFY_STORE_URL"]
+
+
+def designs_root() -> str:
+    root = os.getenv("FOLDER_PATH_Design", "").strip()
+    if not root:
+        raise ConfigError("Set FOLDER_PATH_Design to your /designs root")
+    return root
+
+
+def dropbox_client():
+    missing = [k for k in ("DROPBOX_APP_KEY", "DROPBOX_APP_SECRET", "DROPBOX_REFRESH_TOKEN") if not os.getenv(k)]
+    if missing:
+        raise ConfigError(f"Environment missing: {', '.join(missing)}")
+    from utils.dropbox_utils import get_dropbox_client
+    return get_dropbox_client()
+
+
+def resolve_targets(args, dbx) -> list[str]:
+    if args.designs:
+        return list(args.designs)
+    if not getattr(args, "all", False):
+        raise ConfigError("Name one or more design folders, or pass --all")
+    from utils.workflow import analyze_design_folders
+    ready, not_ready = analyze_design_folders(dbx, designs_root())
+    for row in not_ready:
+        print(f"skip {row['Folder']}: {row['Issues']}", file=sys.stderr)
+    return ready
+
+
+def print_summary(summary: list[tuple]) -> int:
+    """summary rows are (design, status, detail, seconds); returns the exit code."""
+    for name, status, detail, secs in summary:
+        print(f"{status:<9} {name:<40} {secs:7.1f}s" + (f"  {detail}" if detail else ""))
+    if any(status == "failed" for _, status, _, _ in summary):
+        return EXIT_FAILED
+    if any(status == "deferred" for _, status, _, _ in summary):
+        return EXIT_DEFERRED
+    return EXIT_OK
+
+
+# ---------- commands ----------
+
+def cmd_ready(args):
+    from utils.workflow import analyze_design_folders
+    ready, not_ready = analyze_design_folders(dropbox_client(), designs_root())
+    for name in ready:
+        print(f"ready     {name}")
+    for row in not_ready:
+        print(f"not-ready {row['Folder']}: {row['Issues']}")
+    return EXIT_OK
+
+
+def _sku_guard(suffix: str) -> bool:
+    """True if suffix is free (checked against the local SKU registry)."""
+    from utils.sku_registry import get_default_registry
+    reg = get_default_registry()
+    reg.refresh()
+    return not reg.is_used(suffix)
+
+
+def cmd_build(args):
+    from utils.design_builder import build_designs_parallel
+    from utils.csv_export import write_csv
+    dbx = dropbox_client()
+    root = designs_root()
+    targets = resolve_targets(args, dbx)
+    os.makedirs(args.out, exist_ok=True)
+    summary = []
+    t0 = time.perf_counter()
+    for folder, df, meta, missing, error in build_designs_parallel(dbx, root, targets, progress=ConsoleProgress(level=args.level)):
+        if error is not None:
+            summary.append((folder, "failed", str(error), time.perf_counter() - t0))
+            continue
+        suffix = meta.get("sku_suffix", "").strip().upper()
+        if args.sku_guard and not _sku_guard(suffix):
+            summary.append((folder, "failed", f"SKU suffix already used: {suffix}", time.perf_counter() - t0))
+            continue
+        path = os.path.join(args.out, f"{suffix}.csv")
+        write_csv(df, path)
+        detail = path + (f" (missing images: {missing[:10]})" if missing else "")
+        summary.append((folder, "built", detail, time.perf_counter() - t0))
+    return print_summary(summary)
+
+
+def cmd_batch_build(args):
+    from utils import design_builder
+    from utils.csv_export import export_parts_to_dir
+    import pandas as pd
+    dbx = dropbox_client()
+    targets = resolve_targets(args, dbx)
+    t0 = time.perf_counter()
+    built = design_builder.build_designs_parallel(dbx, designs_root(), targets, progress=ConsoleProgress(level=args.level))
+    summary = [(f, "failed", str(e), time.perf_counter() - t0) for f, _, _, _, e in built if e is not None]
+    dfs = [df for _, df, _, _, e in built if e is None]
+    if summary or not dfs:
+        return print_summary(summary) if summary else EXIT_FAILED
+
+    all_df = pd.concat(dfs, ignore_index=True)
+    max_mb = float(os.getenv("SHOPIFY_PRODUCT_CSV_MAX_MB", "14.5"))
+    max_rows = int(os.getenv("SHOPIFY_PRODUCT_CSV_MAX_ROWS", "0"))
+    prefix = f"BATCH_{datetime.now():%Y%m%d_%H%M%S}"
+    written = export_parts_to_dir(all_df, args.out, prefix, max_mb, max_rows)
+    for path, n_rows, size in written:
+        print(f"wrote     {path:<40} {n_rows} rows, {size / 1024:.0f} KB")
+    print(f"{len(targets)} design(s), {len(all_df)} rows in {time.perf_counter() - t0:.1f}s")
+    return EXIT_OK
+
+
+def upload_options(args) -> dict:
+    return {
+        "preflight": args.preflight,
+        "abort_on_conflict": args.abort_on_conflict,
+        "move": args.move,
+        "bulk": getattr(args, "bulk", False),
+        "sku_lister": "CLI" if getattr(args, "sku_guard", False) else None,
+        "out_dir": getattr(args, "out", "."),
+    }
+
+
+def cmd_resume(args):
+    from utils.workflow import resume_quota_queue
+    select_store(args.store)
+    emit_for = lambda name: ConsoleProgress(name, level=args.level)
+    return print_summary(resume_quota_queue(dropbox_client(), designs_root(), emit_for, upload_options(args)))
+
+
+def cmd_upload(args):
+    from utils import shopify_utils
+    from utils.workflow import upload_designs
+
+    select_store(args.store)
+    client = shopify_utils.default_client().for_run()
+    dbx = dropbox_client()
+    targets = resolve_targets(args, dbx)
+    emit_for = lambda name: ConsoleProgress(name, level=args.level)
+    summary = upload_designs(dbx, designs_root(), targets, emit_for, upload_options(args), client=client)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(client.metrics.to_json())
+    return print_summary(summary)
+
+
+def cmd_sync(args):
+    from utils.catalog_sync import ALL_SYNC_FIELDS
+    from utils.dropbox_utils import list_folder_names
+    from utils.workflow import sync_designs
+
+    fields = [f.strip() for f in args.fields.split(",") if f.strip()]
+    unknown = sorted(set(fields) - set(ALL_SYNC_FIELDS))
+    if unknown:
+        raise ConfigError(f"--fields: unknown {', '.join(unknown)} (choose from {', '.join(ALL_SYNC_FIELDS)})")
+    select_store(args.store)
+    dbx = dropbox_client()
+    root = designs_root()
+    if args.designs:
+        targets = list(args.designs)
+    elif args.all:
+        _, targets = list_folder_names(dbx, f"{root}/{os.getenv('FINISHED_DIR_NAME', 'finished')}")
+    else:
+        raise ConfigError("Name one or more design folders, or pass --all")
+    summary = sync_designs(dbx, root, targets, ConsoleProgress("sync", level=args.level), fields=fields,
+                           dry_run=not args.apply)
+    if not args.apply:
+        print("dry run: pass --apply to write these changes", file=sys.stderr)
+    return print_summary(summary)
+
+
+def cmd_worker(args):
+    from utils.job_worker import run_workers
+    run_workers(args.processes, once=args.once)
+    return EXIT_OK
+
+
+def cmd_jobs(args):
+    from utils.job_queue import get_default_queue
+    queue = get_default_queue()
+    for w in queue.workers_online():
+        print(f"worker    {w['worker']:<40} " + (f"job {w['job_id']}" if w["job_id"] else "idle"))
+    for job in reversed(queue.jobs(limit=args.limit)):
+        p = job["progress"] or {}
+        done = f"{p.get('products_done', 0)}/{p.get('products_total', 0)}" if p else ""
+        print(f"{job['id']:>5} {job['status']:<9} {job['kind']:<10} {job['design']:<30} {done:>9}"
+              + (f"  {job['error'].splitlines()[0]}" if job["error"] else ""))
+    return EXIT_OK
+
+
+def cmd_move(args):
+    from utils.workflow import finish_design
+    dbx = dropbox_client()
+    summary = []
+    for name in args.designs:
+        t0 = time.perf_counter()
+        try:
+            summary.append((name, "moved", finish_design(dbx, designs_root(), name), time.perf_counter() - t0))
+        except Exception as e:
+            summary.append((name, "failed", str(e), time.perf_counter() - t0))
+    return print_summary(summary)
+
+
+def cmd_archive(args):
+    from utils.workflow import clean_and_archive_to_completed
+    dbx = dropbox_client()
+    root = designs_root()
+    finished_dir = os.getenv("FINISHED_DIR_NAME", "finished")
+    completed_root = os.getenv("COMPLETED_ROOT", "/Spoofy/Portrait/1. uk office folder/1. Uk office Completed")
+    summary = []
+    for name in args.designs:
+        t0 = time.perf_counter()
+        try:
+            deleted, dest = clean_and_archive_to_completed(dbx, root, name, finished_dir, completed_root)
+            summary.append((name, "archived", f"{deleted} images deleted → {dest}", time.perf_counter() - t0))
+        except Exception as e:
+            summary.append((name, "failed", str(e), time.perf_counter() - t0))
+    return print_summary(summary)
+
+
+# ---------- argument parsing ----------
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="cli.py", description="Headless SKU Generator runs (no Streamlit).")
+    p.add_argument("-v", "--verbose", dest="level", action="store_const", const="debug", default=None,
+                   help="Print per-request progress (SHOPIFY_PROGRESS_LEVEL=debug)")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    def targets(sp, allow_all=True):
+        sp.add_argument("designs", nargs="*" if allow_all else "+", help="Design folder names under FOLDER_PATH_Design")
+        if allow_all:
+            sp.add_argument("--all", action="store_true", help="Every ready folder")
+
+    sp = sub.add_parser("ready", help="List ready / not-ready design folders")
+    sp.set_defaults(func=cmd_ready)
+
+    sp = sub.add_parser("build", help="Build one CSV per design")
+    targets(sp)
+    sp.add_argument("--out", default=".", help="Output directory (default: current)")
+    sp.add_argument("--no-sku-guard", dest="sku_guard", action="store_false", help="Skip the SKU Tracker check")
+    sp.set_defaults(func=cmd_build)
+
+    sp = sub.add_parser("batch-build", help="Build all designs into size-limited combined CSVs")
+    targets(sp)
+    sp.add_argument("--out", default=".", help="Output directory (default: current)")
+    sp.set_defaults(func=cmd_batch_build)
+
+    for name, func, help_ in (("upload", cmd_upload, "Build and upload designs (queued designs first)"),
+                              ("resume", cmd_resume, "Upload designs queued for the daily variant quota")):
+        sp = sub.add_parser(name, help=help_)
+        if name == "upload":
+            targets(sp)
+            sp.add_argument("--out", default=".", help="Where per-design CSVs are written (kept for the quota queue)")
+            sp.add_argument("--bulk", action="store_true", help="Create all products in one Bulk Operations job")
+            sp.add_argument("--no-sku-guard", dest="sku_guard", action="store_false", help="Skip the SKU Tracker guard")
+            sp.add_argument("--metrics", help="Write Shopify HTTP metrics JSON to this file")
+        sp.add_argument("--store", choices=["test", "prod"], help="Store profile (default: SHOPIFY_STORE_URL, else test, else prod)")
+        sp.add_argument("--move", action="store_true", help="Move each uploaded design to /finished")
+        sp.add_argument("--no-preflight", dest="preflight", action="store_false", help="Skip the store handle/SKU pre-flight")
+        sp.add_argument("--abort-on-conflict", action="store_true", help="Skip a design entirely if any product already exists")
+        sp.set_defaults(func=func)
+
+    sp = sub.add_parser("sync", help="Push catalog config changes (prices, size guides, extras) to live products")
+    sp.add_argument("designs", nargs="*", help="Design folder names (in FOLDER_PATH_Design or /finished)")
+    sp.add_argument("--all", action="store_true", help="Every folder in /finished")
+    sp.add_argument("--fields", default="price,body_html,seo",
+                    help="Comma-separated: price, body_html, seo, title, tags, product_type, vendor")
+    sp.add_argument("--apply", action="store_true", help="Write the changes (default: dry run, report only)")
+    sp.add_argument("--store", choices=["test", "prod"], help="Store profile (default: SHOPIFY_STORE_URL, else test, else prod)")
+    sp.set_defaults(func=cmd_sync)
+
+    sp = sub.add_parser("worker", help="Run background job workers for jobs queued from the app")
+    sp.add_argument("--processes", type=int, default=1, help="Worker processes (default 1)")
+    sp.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    sp.set_defaults(func=cmd_worker)
+
+    sp = sub.add_parser("jobs", help="List background jobs and workers")
+    sp.add_argument("--limit", type=int, default=20)
+    sp.set_defaults(func=cmd_jobs)
+
+    sp = sub.add_parser("move", help="Move designs to /finished")
+    targets(sp, allow_all=False)
+    sp.set_defaults(func=cmd_move)
+
+    sp = sub.add_parser("archive", help="Delete numbered images in /finished and move to Completed")
+    targets(sp, allow_all=False)
+    sp.set_defaults(func=cmd_archive)
+    return p
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    startup.load_env()
+    startup.mark("env + arguments")
+    try:
+        return args.func(args)
+    except ConfigError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_CONFIG
+    except KeyboardInterrupt:
+        print("interrupted", file=sys.stderr)
+        return 130
+    finally:
+        if startup.STARTUP_PROFILE:
+            startup.mark(args.command)
+            print(startup.format_report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
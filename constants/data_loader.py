@@ -1,8 +1,9 @@
 import json
 import os
 
+def json_path(filename):
+    return os.path.join(os.path.dirname(__file__), filename)
+
 def load_json(filename):
-    base_path = os.path.dirname(__file__)
-    file_path = os.path.join(base_path, filename)
-    with open(file_path, "r", encoding="utf-8") as f:
+    with open(json_path(filename), "r", encoding="utf-8") as f:
         return json.load(f)
@@ -0,0 +1,154 @@
+# utils/app_cache.py
+"""
+Cross-rerun caches for the Streamlit app. Every widget click re-runs app.py
+from the top; these keep clients, config and Dropbox lookups between reruns
+and share them across sessions (Streamlit locks each cache entry, so one
+session computes a value while the others wait for it).
+
+Clients are resources (one shared object); folder listings and links are
+data (copied per call) with TTLs. Call the invalidate_* hooks after
+anything that changes what they describe (moves, archive, refresh buttons).
+"""
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+import streamlit as st
+
+from constants.data_loader import load_json
+from utils.dropbox_utils import get_dropbox_client, get_shared_link, list_folder_entries
+from utils.google_utils import connect_to_sheet
+from utils.thumbnails import get_thumbnails, PREVIEW_SIZE
+
+if TYPE_CHECKING:
+    import dropbox
+
+CONFIG_TTL = int(os.getenv("APP_CACHE_CONFIG_TTL", "600"))    # constants/*.json
+SHEET_TTL  = int(os.getenv("APP_CACHE_SHEET_TTL", "1800"))    # authorized gspread worksheet
+FOLDER_TTL = int(os.getenv("APP_CACHE_FOLDER_TTL", "60"))     # Dropbox folder listings
+LINK_TTL   = int(os.getenv("APP_CACHE_LINK_TTL", "3600"))     # Dropbox shared links
+
+CONFIG_FILES = {
+    "garment_keys": "garment_keys.json",
+    "body_html_map": "size_guides.json",
+    "product_extras": "product_extras.json",
+    "product_types": "product_types.json",
+    "correct_colors_by_type": "colors.json",
+}
+
+
+@st.cache_resource(show_spinner=False)
+def dropbox_client() -> dropbox.Dropbox:
+    """One Dropbox client for the process; it refreshes its own access token."""
+    return get_dropbox_client()
+
+
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
+def sku_sheet(sheet_name: str = "SKU Tracker"):
+    """Authorized worksheet. Rows are not cached: guards always read current values."""
+    return connect_to_sheet(sheet_name)
+
+
+@st.cache_resource(ttl=CONFIG_TTL, show_spinner=False)
+def catalog_config() -> dict:
+    """The constants/ JSON files by name (shared objects: treat as read-only)."""
+    return {key: load_json(fname) for key, fname in CONFIG_FILES.items()}
+
+
+@st.cache_data(ttl=FOLDER_TTL, show_spinner=False)
+def folder_entries(_dbx: dropbox.Dropbox, path: str) -> tuple[dict[str, str], list[str]]:
+    """({file name: rev}, folder names) directly under path."""
+    return list_folder_entries(_dbx, path)
+
+
+def list_folder(dbx: dropbox.Dropbox, path: str) -> tuple[list[str], list[str]]:
+    """(file names, folder names) directly under path."""
+    files, folders = folder_entries(dbx, path)
+    return list(files), folders
+
+
+@st.cache_data(ttl=LINK_TTL, show_spinner=False)
+def shared_link(_dbx: dropbox.Dropbox, path: str) -> str | None:
+    return get_shared_link(_dbx, path)
+
+
+@st.cache_data(ttl=FOLDER_TTL, show_spinner=False, max_entries=64)
+def _thumbnails(_dbx: dropbox.Dropbox, files: tuple[tuple[str, str], ...], size: str) -> dict[str, bytes]:
+    """Keyed by (path, rev) pairs, so a new rev is a new entry."""
+    return get_thumbnails(_dbx, files, size)
+
+
+def thumbnails(dbx: dropbox.Dropbox, paths: tuple[str, ...], size: str) -> dict[str, bytes]:
+    """
+    {path: thumbnail bytes} for Dropbox files, revs taken from the cached
+    listings of their folders (see utils.thumbnails for the disk cache).
+    Paths missing from their folder's listing are skipped.
+    """
+    files = []
+    for p in paths:
+        folder, name = p.rsplit("/", 1)
+        rev = folder_entries(dbx, folder)[0].get(name)
+        if rev:
+            files.append((p, rev))
+    return _thumbnails(dbx, tuple(files), size)
+
+
+def design_art_name(dbx: dropbox.Dropbox, folder_path: str, folder: str) -> str | None:
+    """File name of the design's artwork, e.g. <folder>/<folder>.png."""
+    files, _ = list_folder(dbx, folder_path)
+    return next(
+        (fn for fn in files
+         if fn.split(".")[0] == folder and fn.lower().split(".")[-1] in {"png", "jpg", "jpeg", "webp"}),
+        None,
+    )
+
+
+def design_art_url(dbx: dropbox.Dropbox, folder_path: str, folder: str) -> tuple[str, str] | tuple[None, None]:
+    """(file name, direct link) of the design's artwork."""
+    art = design_art_name(dbx, folder_path, folder)
+    if not art:
+        return None, None
+    return art, shared_link(dbx, f"{folder_path}/{art}")
+
+
+def design_art_thumb(dbx: dropbox.Dropbox, folder_path: str, folder: str,
+                     size: str = PREVIEW_SIZE) -> tuple[str, bytes] | tuple[None, None]:
+    """(file name, thumbnail bytes) of the design's artwork."""
+    art = design_art_name(dbx, folder_path, folder)
+    if not art:
+        return None, None
+    path = f"{folder_path}/{art}"
+    return art, thumbnails(dbx, (path,), size).get(path)
+
+
+# ---------- invalidation hooks ----------
+
+def invalidate_folders(*paths: str):
+    """
+    Drop cached listings for these paths (all listings if none given).
+    Thumbnails are keyed by rev, so relisting a folder picks up changed files.
+    """
+    if not paths:
+        folder_entries.clear()
+        _thumbnails.clear()
+        return
+    for p in paths:
+        folder_entries.clear(None, p)
+
+
+def invalidate_links():
+    shared_link.clear()
+
+
+def invalidate_clients():
+    """Reconnect Dropbox / Google on next use (e.g. after rotating credentials)."""
+    dropbox_client.clear()
+    sku_sheet.clear()
+
+
+def invalidate_config():
+    """Re-read constants/ JSON here and in the design builder (e.g. after editing prices)."""
+    from utils.design_builder import clear_catalog_config
+    catalog_config.clear()
+    clear_catalog_config()
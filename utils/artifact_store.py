@@ -0,0 +1,304 @@
+# utils/artifact_store.py
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+
+import pandas as pd
+
+ARTIFACT_DIR       = os.getenv("ARTIFACT_STORE_DIR", os.path.join(".state", "artifacts"))
+ARTIFACT_MAX_MB    = float(os.getenv("ARTIFACT_STORE_MAX_MB", "2048"))
+ARTIFACT_TTL_HOURS = float(os.getenv("ARTIFACT_STORE_TTL_HOURS", "72"))
+
+_HASH_CHUNK = 1024 * 1024
+_JSON_COLUMNS_ATTR = "artifact_json_columns"
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Object columns that mix value types (e.g. '' and ints in Image Position)
+    can't go to Parquet as-is; store those cells as JSON and remember which
+    columns were encoded, so load_dataframe gives back the same values.
+    """
+    mixed = [c for c in df.columns if df[c].dtype == object and df[c].map(type).nunique() > 1]
+    if not mixed:
+        return df
+    out = df.copy()
+    for c in mixed:
+        out[c] = out[c].map(lambda v: json.dumps(v.item() if hasattr(v, "item") else v))
+    out.attrs[_JSON_COLUMNS_ATTR] = mixed
+    return out
+
+
+class ArtifactWriter:
+    """
+    A file being written into the store: write() hashes as it goes, close()
+    adopts it under its digest and returns the ref, abort() throws it away.
+    As a context manager it closes on success and aborts on error; the ref
+    is on `.ref` afterwards.
+    """
+
+    def __init__(self, store: "ArtifactStore", name: str, kind: str):
+        self._store, self.name, self.kind = store, name, kind
+        self._f = store._tmp(kind)
+        self._h = hashlib.sha256()
+        self.ref = None
+
+    def write(self, data: bytes):
+        self._h.update(data)
+        self._f.write(data)
+
+    def close(self) -> dict:
+        if self.ref is None:
+            self._f.close()
+            self.ref = self._store._adopt(self._f.name, self._h.hexdigest(), self.kind, self.name)
+        return self.ref
+
+    def abort(self):
+        self._f.close()
+        try:
+            os.remove(self._f.name)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest      TEXT PRIMARY KEY,
+    ext         TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bundles (
+    bundle_key  TEXT PRIMARY KEY,
+    digest      TEXT NOT NULL
+);
+"""
+
+class ArtifactStore:
+    """
+    Content-addressed files on local disk for built outputs (CSV chunks,
+    ZIP bundles, DataFrames as Parquet). Callers keep only small refs —
+    {"id", "name", "kind", "size"} — so Streamlit sessions don't hold the
+    bytes. Identical content is stored once. Objects unused for
+    ARTIFACT_STORE_TTL_HOURS are dropped, then least-recently-used ones
+    until the store is under ARTIFACT_STORE_MAX_MB.
+    """
+
+    def __init__(self, root: str = None, max_mb: float = None, ttl_hours: float = None):
+        self.root = root or ARTIFACT_DIR
+        self.max_bytes = int((ARTIFACT_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self.ttl = (ARTIFACT_TTL_HOURS if ttl_hours is None else ttl_hours) * 3600
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._pinned = Counter()     # digests eviction must leave alone (being adopted / zipped)
+        self._conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"),
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _exec(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.{ext}")
+
+    @contextmanager
+    def _pin(self, digests):
+        """Keep these objects out of eviction (from any thread) for the duration."""
+        digests = list(digests)
+        with self._lock:
+            self._pinned.update(digests)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pinned.subtract(digests)
+                self._pinned += Counter()   # drop zero counts
+
+    # ---------- put ----------
+
+    def _adopt(self, tmp_path: str, digest: str, ext: str, name: str) -> dict:
+        """Move a finished temp file into place under its digest (or drop it if already stored)."""
+        dest = self._object_path(digest, ext)
+        size = os.path.getsize(tmp_path)
+        if os.path.exists(dest):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(tmp_path, dest)
+        now = time.time()
+        self._exec("INSERT INTO objects (digest, ext, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                   "ON CONFLICT(digest) DO UPDATE SET accessed_at=excluded.accessed_at",
+                   (digest, ext, size, now, now))
+        with self._pin([digest]):
+            self.evict()
+        return {"id": digest, "name": name, "kind": ext, "size": size}
+
+    def _tmp(self, ext: str):
+        return tempfile.NamedTemporaryFile(dir=os.path.join(self.root, "tmp"), suffix=f".{ext}", delete=False)
+
+    def put_bytes(self, data: bytes, name: str, kind: str = "csv") -> dict:
+        digest = hashlib.sha256(data).hexdigest()
+        if self.exists({"id": digest, "kind": kind}):
+            self.touch({"id": digest})
+            return {"id": digest, "name": name, "kind": kind, "size": len(data)}
+        with self._tmp(kind) as f:
+            f.write(data)
+        return self._adopt(f.name, digest, kind, name)
+
+    def writer(self, name: str, kind: str = "csv") -> ArtifactWriter:
+        """Stream an artifact in without building it in memory first."""
+        return ArtifactWriter(self, name, kind)
+
+    def put_file(self, path: str, name: str = None, kind: str = None) -> dict:
+        """Copy a file in, hashing while streaming it."""
+        kind = kind or os.path.splitext(path)[1].lstrip(".") or "bin"
+        with open(path, "rb") as src, self.writer(name or os.path.basename(path), kind) as w:
+            for block in iter(lambda: src.read(_HASH_CHUNK), b""):
+                w.write(block)
+        return w.ref
+
+    def put_dataframe(self, df: pd.DataFrame, name: str) -> dict:
+        """Store df as Parquet; the id is the hash of the Parquet file."""
+        with self._tmp("parquet") as f:
+            tmp_path = f.name
+        _arrow_safe(df).to_parquet(tmp_path, index=False)
+        return self._adopt(tmp_path, _hash_file(tmp_path), "parquet", name)
+
+    def zip_bundle(self, refs: list[dict], name: str) -> dict:
+        """
+        One ZIP of the given artifacts, built on disk the first time and
+        reused afterwards (keyed by member ids and names).
+        """
+        bundle_key = hashlib.sha256("\n".join(f"{r['id']}:{r['name']}" for r in refs).encode("utf-8")).hexdigest()
+        rows = self._exec("SELECT digest FROM bundles WHERE bundle_key=?", (bundle_key,))
+        if rows and self.exists({"id": rows[0]["digest"], "kind": "zip"}):
+            self.touch({"id": rows[0]["digest"]})
+            return {"id": rows[0]["digest"], "name": name, "kind": "zip",
+                    "size": os.path.getsize(self.path({"id": rows[0]["digest"], "kind": "zip"}))}
+        with self._tmp("zip") as f:
+            tmp_path = f.name
+        with self._pin(r["id"] for r in refs):
+            with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for r in refs:
+                    zf.write(self.path(r), arcname=r["name"])
+            ref = self._adopt(tmp_path, _hash_file(tmp_path), "zip", name)
+        self._exec("INSERT OR REPLACE INTO bundles (bundle_key, digest) VALUES (?, ?)", (bundle_key, ref["id"]))
+        return ref
+
+    # ---------- get ----------
+
+    def path(self, ref: dict) -> str:
+        return self._object_path(ref["id"], ref["kind"])
+
+    def exists(self, ref: dict) -> bool:
+        return os.path.exists(self.path(ref))
+
+    def touch(self, ref: dict):
+        self._exec("UPDATE objects SET accessed_at=? WHERE digest=?", (time.time(), ref["id"]))
+
+    def read_bytes(self, ref: dict) -> bytes:
+        self.touch(ref)
+        with open(self.path(ref), "rb") as f:
+            return f.read()
+
+    def load_dataframe(self, ref: dict) -> pd.DataFrame:
+        self.touch(ref)
+        df = pd.read_parquet(self.path(ref))
+        for c in df.attrs.pop(_JSON_COLUMNS_ATTR, []):
+            df[c] = df[c].map(json.loads)
+        return df
+
+    # ---------- eviction ----------
+
+    def total_bytes(self) -> int:
+        return int(self._exec("SELECT COALESCE(SUM(size), 0) AS n FROM objects")[0]["n"])
+
+    def _drop(self, digest: str, ext: str):
+        try:
+            os.remove(self._object_path(digest, ext))
+        except FileNotFoundError:
+            pass
+        self._exec("DELETE FROM objects WHERE digest=?", (digest,))
+        self._exec("DELETE FROM bundles WHERE digest=?", (digest,))
+
+    def evict(self) -> int:
+        """
+        TTL first, then LRU down to max size. Pinned objects (just adopted,
+        or members of a bundle being built) are skipped, even if that leaves
+        the store over size. Returns the number of objects removed.
+        """
+        with self._lock:
+            pinned = set(self._pinned)
+        removed = 0
+        if self.ttl > 0:
+            for r in self._exec("SELECT digest, ext FROM objects WHERE accessed_at < ?", (time.time() - self.ttl,)):
+                if r["digest"] in pinned:
+                    continue
+                self._drop(r["digest"], r["ext"])
+                removed += 1
+        total = self.total_bytes()
+        if total > self.max_bytes:
+            for r in self._exec("SELECT digest, ext, size FROM objects ORDER BY accessed_at"):
+                if total <= self.max_bytes:
+                    break
+                if r["digest"] in pinned:
+                    continue
+                self._drop(r["digest"], r["ext"])
+                total -= r["size"]
+                removed += 1
+        # temp files left behind by a crashed write
+        tmp_dir = os.path.join(self.root, "tmp")
+        cutoff = time.time() - 3600
+        for fname in os.listdir(tmp_dir):
+            p = os.path.join(tmp_dir, fname)
+            if os.path.getmtime(p) < cutoff:
+                shutil.rmtree(p, ignore_errors=True) if os.path.isdir(p) else os.remove(p)
+        return removed
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_store():
+    """Process-wide store at ARTIFACT_STORE_DIR (shared by every Streamlit session)."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ArtifactStore()
+        return _default_store
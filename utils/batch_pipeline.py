@@ -0,0 +1,59 @@
+# utils/batch_pipeline.py
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_PREFETCH      = int(os.getenv("BATCH_PREFETCH", "2"))        # designs built ahead of the one uploading
+BATCH_BUILD_WORKERS = int(os.getenv("BATCH_BUILD_WORKERS", "2"))   # concurrent Dropbox builds
+
+
+def _timed(func, item):
+    t0 = time.perf_counter()
+    try:
+        return func(item), None, time.perf_counter() - t0
+    except Exception as e:
+        return None, e, time.perf_counter() - t0
+
+
+def prefetch_map(func, items, prefetch: int = None, workers: int = None):
+    """
+    Producer/consumer pipeline: run func(item) on a small thread pool while
+    the caller consumes earlier results, keeping at most `prefetch` items
+    built ahead of the one being consumed (a bounded window, so a slow
+    consumer never piles up finished DataFrames).
+
+    Yields (item, result, error, stats) in input order; func's exception is
+    returned as `error` instead of being raised so one bad folder doesn't
+    stop the batch. stats = {"build": seconds in func, "wait": seconds the
+    consumer blocked on it}. The consumer (Streamlit, Shopify uploads) stays
+    on the calling thread; func must not touch the UI.
+    """
+    prefetch = BATCH_PREFETCH if prefetch is None else max(0, int(prefetch))
+    workers = max(1, int(workers or BATCH_BUILD_WORKERS))
+    source = iter(items)
+    window = deque()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-build")
+
+    def submit_next():
+        for item in source:
+            window.append((item, pool.submit(_timed, func, item)))
+            return True
+        return False
+
+    try:
+        for _ in range(prefetch + 1):
+            if not submit_next():
+                break
+        while window:
+            item, fut = window.popleft()
+            t_wait = time.perf_counter()
+            result, error, build_secs = fut.result()
+            wait_secs = time.perf_counter() - t_wait
+            # Refill before handing control back, so the next build overlaps this item's upload
+            submit_next()
+            yield item, result, error, {"build": build_secs, "wait": wait_secs}
+    finally:
+        for _, fut in window:
+            fut.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,346 @@
+# utils/catalog_sync.py
+"""
+Push catalog config changes to products that are already live, without
+re-creating them: product_types.json prices, size_guides.json /
+product_extras.json body HTML (and the SEO description derived from it),
+optionally titles, tags, product types and vendors.
+
+    desired   generator output (a DataFrame; workflow.sync_designs rebuilds
+              it from each design's metadata.json with the current config)
+    live      the same handles fetched from the store with paginated
+              GraphQL searches (SYNC_FETCH_CHUNK handles per search)
+    diff      per product, only the fields that differ; variants are
+              matched by SKU and only their price is compared
+    apply     productVariantsBulkUpdate (one call per product, every changed
+              variant at once) and productUpdate. With SYNC_BULK_MIN or more
+              calls of a kind they go through one Bulk Operation instead,
+              so a price change across thousands of variants is a couple of
+              bulk jobs rather than a re-listing.
+"""
+import os
+import re
+import json
+import tempfile
+from decimal import Decimal, InvalidOperation
+
+from utils.shopify_utils import (
+    ShopifyError,
+    PREFLIGHT_CHUNK,
+    _prepare_payloads,
+    _graphql,
+    _graphql_paginate,
+    _chunks,
+    _search_quote,
+    _say,
+    default_client,
+)
+
+SYNC_FIELDS     = ("price", "body_html", "seo")
+ALL_SYNC_FIELDS = ("price", "body_html", "seo", "title", "tags", "product_type", "vendor")
+
+SYNC_FETCH_CHUNK = int(os.getenv("SHOPIFY_SYNC_FETCH_CHUNK", str(PREFLIGHT_CHUNK)))  # handles per search
+SYNC_PAGE_SIZE   = int(os.getenv("SHOPIFY_SYNC_PAGE_SIZE", "8"))    # products per page (×100 variants: query cost)
+SYNC_BULK_MIN    = int(os.getenv("SHOPIFY_SYNC_BULK_MIN", "20"))    # this many calls of a kind → one Bulk Operation
+
+_LIVE_Q = """
+query($q: String!, $first: Int!, $after: String) {
+  products(first: $first, after: $after, query: $q) {
+    nodes {
+      id handle title descriptionHtml vendor productType tags
+      seo { title description }
+      variants(first: 100) { nodes { id sku price } pageInfo { hasNextPage endCursor } }
+    }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+_MORE_VARIANTS_Q = """
+query($id: ID!, $after: String) {
+  product(id: $id) {
+    variants(first: 250, after: $after) { nodes { id sku price } pageInfo { hasNextPage endCursor } }
+  }
+}
+"""
+
+_VARIANTS_UPDATE_M = """
+mutation call($productId: ID!, $variants: [ProductVariantsBulkInput!]!) {
+  productVariantsBulkUpdate(productId: $productId, variants: $variants) {
+    product { id }
+    userErrors { field message }
+  }
+}
+"""
+
+_PRODUCT_UPDATE_M = """
+mutation call($input: ProductInput!) {
+  productUpdate(input: $input) {
+    product { id }
+    userErrors { field message }
+  }
+}
+"""
+
+_WS_RE = re.compile(r"\s+")
+_TAG_GAP_RE = re.compile(r">\s+<")
+
+
+# ------------------ normalization ------------------
+
+def _price(v):
+    try:
+        return Decimal(str(v).strip()).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _html(v):
+    """Whitespace-insensitive form of body HTML (Shopify reflows whitespace between tags)."""
+    return _TAG_GAP_RE.sub("><", _WS_RE.sub(" ", str(v or ""))).strip()
+
+
+def _tag_list(v):
+    items = v if isinstance(v, list) else str(v or "").split(",")
+    return list(dict.fromkeys(t.strip() for t in items if t and str(t).strip()))
+
+
+def _text(v):
+    return str(v or "").strip()
+
+
+# ------------------ desired / live state ------------------
+
+def desired_state(df) -> dict:
+    """{handle: {"title", "body_html", "vendor", "product_type", "tags", "seo", "prices": {sku: Decimal}}}."""
+    out = {}
+    for handle, prep in _prepare_payloads(df).items():
+        p = prep["payload"]
+        out[handle] = {
+            "title": _text(p["title"]),
+            "body_html": str(p["body_html"] or ""),
+            "vendor": _text(p["vendor"]),
+            "product_type": _text(p["product_type"]),
+            "tags": _tag_list(p["tags"]),
+            "seo": {"title": _text(p["metafields_global_title_tag"]),
+                    "description": _text(p["metafields_global_description_tag"])},
+            "prices": {str(v["sku"]).strip(): _price(v["price"]) for v in prep["variants"] if str(v["sku"]).strip()},
+        }
+    return out
+
+
+def _all_variants(client, node, progress=None) -> list:
+    """The product's variants, continuing past the first page for products with more than 100."""
+    conn = node.get("variants") or {}
+    variants = list(conn.get("nodes") or [])
+    page = conn.get("pageInfo") or {}
+    while page.get("hasNextPage"):
+        data = _graphql(client, _MORE_VARIANTS_Q, {"id": node["id"], "after": page.get("endCursor")},
+                        progress=progress)
+        conn = ((data.get("product") or {}).get("variants") or {})
+        variants += conn.get("nodes") or []
+        page = conn.get("pageInfo") or {}
+    return variants
+
+
+def fetch_live(handles, progress=None, client=None, chunk_size: int = None) -> dict:
+    """
+    Live state of the given handles: {handle: {"id", "title", "body_html",
+    "vendor", "product_type", "tags", "seo", "variants": {sku: (variant gid, Decimal price)}}}.
+    Handles not in the store are left out.
+    """
+    client = client or default_client()
+    chunk_size = chunk_size or SYNC_FETCH_CHUNK
+    handles = [h for h in dict.fromkeys(handles) if h]
+    out = {}
+    for chunk in _chunks(handles, chunk_size):
+        q = " OR ".join(f"handle:{_search_quote(h)}" for h in chunk)
+        wanted = set(chunk)
+        for node in _graphql_paginate(client, _LIVE_Q, {"q": q, "first": SYNC_PAGE_SIZE}, ("products",),
+                                      progress=progress):
+            if node.get("handle") not in wanted:
+                continue
+            variants = _all_variants(client, node, progress)
+            seo = node.get("seo") or {}
+            out[node["handle"]] = {
+                "id": node["id"],
+                "title": _text(node.get("title")),
+                "body_html": str(node.get("descriptionHtml") or ""),
+                "vendor": _text(node.get("vendor")),
+                "product_type": _text(node.get("productType")),
+                "tags": _tag_list(node.get("tags") or []),
+                "seo": {"title": _text(seo.get("title")), "description": _text(seo.get("description"))},
+                "variants": {_text(v.get("sku")): (v["id"], _price(v.get("price")))
+                             for v in variants if _text(v.get("sku"))},
+            }
+    return out
+
+
+# ------------------ diff ------------------
+
+def diff_catalog(desired: dict, live: dict, fields=SYNC_FIELDS) -> dict:
+    """
+    Minimal changes to make live match desired for the given fields.
+    Returns {"products": [{"handle", "id", "input": productUpdate input, "changes": [(field, old, new)]}],
+             "variants": [{"handle", "id", "variants": [{"id", "price"}], "changes": [(sku, old, new)]}],
+             "missing": [handles not in the store], "unmatched_skus": {handle: [skus not in the store]}}.
+    """
+    fields = set(fields)
+    products, variants, missing, unmatched = [], [], [], {}
+    for handle, want in desired.items():
+        have = live.get(handle)
+        if not have:
+            missing.append(handle)
+            continue
+
+        inp, changes = {}, []
+        if "title" in fields and want["title"] and want["title"] != have["title"]:
+            inp["title"] = want["title"]
+            changes.append(("title", have["title"], want["title"]))
+        if "body_html" in fields and _html(want["body_html"]) != _html(have["body_html"]):
+            inp["descriptionHtml"] = want["body_html"]
+            changes.append(("body_html", f"{len(have['body_html'])} chars", f"{len(want['body_html'])} chars"))
+        if "vendor" in fields and want["vendor"] and want["vendor"] != have["vendor"]:
+            inp["vendor"] = want["vendor"]
+            changes.append(("vendor", have["vendor"], want["vendor"]))
+        if "product_type" in fields and want["product_type"] and want["product_type"] != have["product_type"]:
+            inp["productType"] = want["product_type"]
+            changes.append(("product_type", have["product_type"], want["product_type"]))
+        if "tags" in fields and {t.lower() for t in want["tags"]} != {t.lower() for t in have["tags"]}:
+            inp["tags"] = want["tags"]
+            changes.append(("tags", ", ".join(have["tags"]), ", ".join(want["tags"])))
+        if "seo" in fields:
+            seo = {k: v for k, v in want["seo"].items() if v and v != have["seo"][k]}
+            if seo:
+                inp["seo"] = dict(have["seo"], **seo)
+                changes += [(f"seo.{k}", have["seo"][k], v) for k, v in seo.items()]
+        if inp:
+            products.append({"handle": handle, "id": have["id"], "input": dict(inp, id=have["id"]),
+                             "changes": changes})
+
+        if "price" in fields:
+            vin, vchanges = [], []
+            for sku, price in want["prices"].items():
+                live_v = have["variants"].get(sku)
+                if not live_v:
+                    unmatched.setdefault(handle, []).append(sku)
+                    continue
+                if price is not None and price != live_v[1]:
+                    vin.append({"id": live_v[0], "price": str(price)})
+                    vchanges.append((sku, str(live_v[1]), str(price)))
+            if vin:
+                variants.append({"handle": handle, "id": have["id"], "variants": vin, "changes": vchanges})
+    return {"products": products, "variants": variants, "missing": missing, "unmatched_skus": unmatched}
+
+
+# ------------------ apply ------------------
+
+def _user_errors(payload) -> list:
+    return [f"{'.'.join(map(str, e.get('field') or []))}: {e.get('message')}".lstrip(": ")
+            for e in (payload or {}).get("userErrors") or []]
+
+
+def _apply_direct(client, mutation, key, calls, progress=None) -> dict:
+    """{handle: [errors]} for calls made one mutation each."""
+    errors = {}
+    for handle, variables in calls:
+        try:
+            errs = _user_errors(_graphql(client, mutation, variables, progress=progress).get(key))
+        except ShopifyError as e:
+            errs = [str(e)]
+        if errs:
+            errors[handle] = errs
+            _say(progress, f"⚠️ {handle}: {'; '.join(errs)}", level="warning", handle=handle)
+    return errors
+
+
+def _apply_bulk(client, mutation, key, calls, progress=None) -> dict:
+    """{handle: [errors]} for calls run as Bulk Operations (one JSONL line each, BULK_MAX_MB per job)."""
+    from utils.shopify_bulk import BULK_MAX_MB, run_bulk_mutation, iter_bulk_results
+    limit = int(BULK_MAX_MB * 1024 * 1024)
+    lines = [(handle, json.dumps(variables, ensure_ascii=False) + "\n") for handle, variables in calls]
+    parts, cur, size = [], [], 0
+    for handle, line in lines:
+        n = len(line.encode("utf-8"))
+        if cur and size + n > limit:
+            parts.append(cur)
+            cur, size = [], 0
+        cur.append((handle, line))
+        size += n
+    if cur:
+        parts.append(cur)
+
+    errors = {}
+    with tempfile.TemporaryDirectory(prefix="shopify_sync_") as tmp:
+        for i, part in enumerate(parts, start=1):
+            path = os.path.join(tmp, f"sync_{key}_{i}.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(line for _, line in part)
+            _say(progress, f"📦 {key} bulk job {i}/{len(parts)}: {len(part)} products")
+            op = run_bulk_mutation(client, path, progress=progress, mutation=mutation)
+            seen = set()
+            for row in iter_bulk_results(op.get("url") or op.get("partialDataUrl")):
+                idx = row.get("__lineNumber")
+                if idx is None or idx >= len(part):
+                    continue
+                seen.add(idx)
+                errs = _user_errors((row.get("data") or {}).get(key)) + [
+                    str(e.get("message", e)) for e in row.get("errors") or []]
+                if errs:
+                    errors[part[idx][0]] = errs
+            for idx, (handle, _) in enumerate(part):
+                if idx not in seen:
+                    errors.setdefault(handle, ["no result from the bulk operation"])
+    return errors
+
+
+def apply_diff(diff: dict, progress=None, client=None, bulk: bool = None) -> dict:
+    """
+    Apply a diff_catalog result. bulk=None picks Bulk Operations for kinds
+    with SYNC_BULK_MIN or more calls. Returns {handle: [errors]}.
+    """
+    client = client or default_client()
+    errors = {}
+    for key, mutation, calls in (
+        ("productVariantsBulkUpdate", _VARIANTS_UPDATE_M,
+         [(d["handle"], {"productId": d["id"], "variants": d["variants"]}) for d in diff["variants"]]),
+        ("productUpdate", _PRODUCT_UPDATE_M,
+         [(d["handle"], {"input": d["input"]}) for d in diff["products"]]),
+    ):
+        if not calls:
+            continue
+        use_bulk = bulk if bulk is not None else len(calls) >= SYNC_BULK_MIN
+        _say(progress, f"✏️ {key}: {len(calls)} product(s)" + (" via Bulk Operations" if use_bulk else ""),
+             stage="sync", kind=key, calls=len(calls))
+        apply = _apply_bulk if use_bulk else _apply_direct
+        for handle, errs in apply(client, mutation, key, calls, progress=progress).items():
+            errors.setdefault(handle, []).extend(errs)
+    return errors
+
+
+# ------------------ public entrypoint ------------------
+
+def sync_catalog(df, progress=None, fields=SYNC_FIELDS, dry_run: bool = False, client=None, bulk: bool = None) -> dict:
+    """
+    Bring the live products for df's handles in line with df (generator
+    output) for the given fields. dry_run computes the diff without writing.
+    Returns the diff_catalog result plus "checked" (handles compared) and
+    "errors" ({handle: [errors]}, empty on a dry run).
+    """
+    client = client or default_client()
+    unknown = set(fields) - set(ALL_SYNC_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown sync field(s): {', '.join(sorted(unknown))}")
+    desired = desired_state(df)
+    _say(progress, f"🔁 Sync: fetching {len(desired)} product(s) from the store", stage="sync",
+         products=len(desired))
+    live = fetch_live(list(desired), progress=progress, client=client)
+    diff = diff_catalog(desired, live, fields)
+    n_var = sum(len(d["variants"]) for d in diff["variants"])
+    _say(progress, f"🔁 Sync: {len(live)} live, {len(diff['missing'])} not in store — "
+                   f"{len(diff['products'])} product update(s), {n_var} variant price(s) across "
+                   f"{len(diff['variants'])} product(s)")
+    for handle, skus in diff["unmatched_skus"].items():
+        _say(progress, f"⚠️ {handle}: {len(skus)} SKU(s) not in the store (not created by sync)",
+             level="warning", handle=handle)
+    errors = {} if dry_run else apply_diff(diff, progress=progress, client=client, bulk=bulk)
+    return dict(diff, checked=len(desired), errors=errors)
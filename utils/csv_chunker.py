@@ -0,0 +1,115 @@
+# utils/csv_chunker.py
+"""
+Split a Shopify product CSV into files under a byte / row limit in one pass.
+
+Every row is serialized exactly once; chunk sizes are running sums of those
+row byte counts, and chunk files are the header plus the row bytes joined.
+Products (Handle groups) are never split across files unless a single
+product is larger than the limit on its own.
+"""
+import os
+
+import pandas as pd
+
+_BOM = "\ufeff".encode("utf-8")
+_ROW_SEP = "\x1e"   # record separator; appended to the line terminator to find row boundaries
+
+
+def header_bytes(df: pd.DataFrame) -> bytes:
+    return df.iloc[:0].to_csv(index=False).encode("utf-8")
+
+
+def row_bytes(df: pd.DataFrame) -> list[bytes]:
+    """
+    Each row of df as the exact bytes df.to_csv(index=False) would write for it.
+    One to_csv call for the whole frame: rows are terminated with an extra
+    record-separator character and split on it afterwards.
+    """
+    if not len(df):
+        return []
+    text_cols = df.select_dtypes(include=["object", "string"]).columns
+    has_sep = any(df[c].astype(str).str.contains(_ROW_SEP, regex=False).any() for c in text_cols)
+    if has_sep:
+        # A field containing the separator would be mis-split; fall back to one call per row
+        return [df.iloc[i:i+1].to_csv(index=False, header=False).encode("utf-8") for i in range(len(df))]
+    term = _ROW_SEP + os.linesep
+    blob = df.to_csv(index=False, header=False, lineterminator=term).encode("utf-8")
+    sep = term.encode("utf-8")
+    nl = os.linesep.encode("utf-8")
+    parts = blob.split(sep)
+    return [p + nl for p in parts[:-1]]
+
+
+def plan_chunks(df: pd.DataFrame, sizes: list[int], header_size: int, max_bytes: int, max_rows: int = 0) -> list[list[int]]:
+    """
+    Row positions for each chunk. Handle groups (first-seen order) are packed
+    whole; a group that can't fit in an empty chunk is split greedily by rows.
+    """
+    chunks: list[list[int]] = []
+    cur: list[int] = []
+    cur_bytes = header_size
+
+    def fits(extra_bytes, extra_rows):
+        if cur_bytes + extra_bytes > max_bytes:
+            return False
+        return not max_rows or len(cur) + extra_rows <= max_rows
+
+    def flush():
+        nonlocal cur, cur_bytes
+        if cur:
+            chunks.append(cur)
+        cur, cur_bytes = [], header_size
+
+    groups = df.groupby("Handle", sort=False).indices
+    for handle in df["Handle"].dropna().unique():
+        pos = groups[handle]
+        g_bytes = sum(sizes[i] for i in pos)
+        if header_size + g_bytes > max_bytes or (max_rows and len(pos) > max_rows):
+            flush()
+            for i in pos:
+                if cur and not fits(sizes[i], 1):
+                    flush()
+                cur.append(i)
+                cur_bytes += sizes[i]
+            flush()
+            continue
+        if not fits(g_bytes, len(pos)):
+            flush()
+        cur.extend(pos)
+        cur_bytes += g_bytes
+
+    flush()
+    return chunks
+
+
+def _plan(df, max_mb, max_rows, rows):
+    rows = row_bytes(df) if rows is None else rows
+    header = _BOM + header_bytes(df)
+    plan = plan_chunks(df, [len(r) for r in rows], len(header), int(max_mb * 1024 * 1024), max_rows)
+    return rows, header, plan
+
+
+def split_csv(df: pd.DataFrame, max_mb: float, max_rows: int = 0, rows=None) -> list[tuple[bytes, int]]:
+    """
+    [(utf-8-sig CSV bytes, row count)] with every file at most max_mb.
+    `rows` may pass precomputed row_bytes(df) (e.g. serialized on worker processes).
+    """
+    rows, header, plan = _plan(df, max_mb, max_rows, rows)
+    return [(header + b"".join(rows[i] for i in pos), len(pos)) for pos in plan]
+
+
+def write_csv_chunks(df: pd.DataFrame, out_dir: str, prefix: str, max_mb: float, max_rows: int = 0, rows=None):
+    """Write split_csv(df) to out_dir/{prefix}_part{n}.csv; returns [(path, row count, bytes)]."""
+    os.makedirs(out_dir, exist_ok=True)
+    rows, header, plan = _plan(df, max_mb, max_rows, rows)
+    written = []
+    for n, pos in enumerate(plan, start=1):
+        path = os.path.join(out_dir, f"{prefix}_part{n}.csv")
+        size = len(header)
+        with open(path, "wb") as f:
+            f.write(header)
+            for i in pos:
+                f.write(rows[i])
+                size += len(rows[i])
+        written.append((path, len(pos), size))
+    return written
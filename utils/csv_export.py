@@ -0,0 +1,209 @@
+# utils/csv_export.py
+"""
+One export path for Shopify product CSVs (utf-8-sig, same bytes as
+df.to_csv(index=False, encoding="utf-8-sig")).
+
+Rows are serialized in blocks of CSV_EXPORT_BLOCK_ROWS (one pandas C-writer
+call per block, on worker processes for large frames) and streamed into
+their destination as they are produced: a local file, the artifact store,
+or size-limited parts. Nothing is encoded twice or read back to be offered
+for download, zipped or uploaded; the artifact store's file is the download.
+
+Parts follow csv_chunker's rules (Handle groups kept whole, a group bigger
+than the limit split by rows) but are cut while streaming, so only the
+current block and product are held in memory instead of every row.
+"""
+import os
+from collections import deque
+
+import pandas as pd
+
+from utils.csv_chunker import _BOM, header_bytes, row_bytes, _plan
+
+CSV_EXPORT_BLOCK_ROWS = int(os.getenv("CSV_EXPORT_BLOCK_ROWS", "2000"))   # ~9 MB of row text per block
+
+
+def _block_csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False, header=False).encode("utf-8")
+
+
+def _blocks(df: pd.DataFrame, fn, block_rows: int = None, cpu_workers: int = None):
+    """fn(slice) for consecutive row slices of df, in order; on worker processes for large frames."""
+    from utils import design_builder
+    block_rows = max(1, int(block_rows or CSV_EXPORT_BLOCK_ROWS))
+    starts = range(0, len(df), block_rows)
+    cpu_workers = max(1, int(cpu_workers or design_builder.BATCH_CPU_WORKERS))
+    if cpu_workers == 1 or len(df) < design_builder.BATCH_MIN_ROWS_FOR_PROCESSES:
+        for i in starts:
+            yield fn(df.iloc[i:i+block_rows])
+        return
+    # Keep at most two blocks per worker in flight so memory stays bounded
+    with design_builder._process_pool(cpu_workers) as pool:
+        pending = deque()
+        for i in starts:
+            pending.append(pool.submit(fn, df.iloc[i:i+block_rows]))
+            if len(pending) >= 2 * cpu_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_csv(df: pd.DataFrame, out, block_rows: int = None, cpu_workers: int = None) -> int:
+    """
+    Stream df as a utf-8-sig CSV into `out` (a path or a binary file object).
+    Returns the byte count.
+    """
+    if isinstance(out, (str, os.PathLike)):
+        with open(out, "wb") as f:
+            return write_csv(df, f, block_rows, cpu_workers)
+    head = _BOM + header_bytes(df)
+    out.write(head)
+    size = len(head)
+    for block in _blocks(df, _block_csv, block_rows, cpu_workers):
+        out.write(block)
+        size += len(block)
+    return size
+
+
+def export_to_store(df: pd.DataFrame, name: str, store=None, block_rows: int = None) -> dict:
+    """Stream df as CSV into the artifact store; returns its ref."""
+    from utils.artifact_store import get_default_store
+    store = store or get_default_store()
+    w = store.writer(name, kind="csv")
+    try:
+        write_csv(df, w, block_rows)
+    except BaseException:
+        w.abort()
+        raise
+    return w.close()
+
+
+def _handle_groups(df: pd.DataFrame, blocks):
+    """Row bytes of one product (Handle) at a time, in order; rows with no Handle are skipped, as in groupby."""
+    handles = df["Handle"].to_numpy()
+    cur, group, i = None, [], 0
+    for block in blocks:
+        for r in block:
+            h = handles[i]
+            i += 1
+            if pd.isna(h):
+                continue
+            if group and h != cur:
+                yield group
+                group = []
+            cur = h
+            group.append(r)
+    if group:
+        yield group
+
+
+def _contiguous_handles(df: pd.DataFrame) -> bool:
+    h = df["Handle"].dropna()
+    return int((h != h.shift()).sum()) == h.nunique()
+
+
+class _FileWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "wb")
+
+    def write(self, data: bytes):
+        self._f.write(data)
+
+    def close(self) -> str:
+        self._f.close()
+        return self.path
+
+
+class _PartSplitter:
+    """csv_chunker.plan_chunks' packing rules, applied while products stream in."""
+
+    def __init__(self, header: bytes, max_bytes: int, max_rows: int, open_part):
+        self.header, self.max_bytes, self.max_rows, self.open_part = header, max_bytes, max_rows, open_part
+        self.parts = []
+        self.w = None
+        self.rows, self.size = 0, len(header)
+
+    def _fits(self, extra_bytes: int, extra_rows: int) -> bool:
+        if self.size + extra_bytes > self.max_bytes:
+            return False
+        return not self.max_rows or self.rows + extra_rows <= self.max_rows
+
+    def write(self, rows: list[bytes]):
+        if self.w is None:
+            self.w = self.open_part(len(self.parts) + 1)
+            self.w.write(self.header)
+            self.rows, self.size = 0, len(self.header)
+        for r in rows:
+            self.w.write(r)
+            self.size += len(r)
+        self.rows += len(rows)
+
+    def flush(self):
+        if self.w is not None:
+            self.parts.append((self.w.close(), self.rows, self.size))
+            self.w = None
+
+    def abort(self):
+        if self.w is not None:
+            getattr(self.w, "abort", self.w.close)()
+            self.w = None
+
+    def add_product(self, rows: list[bytes]):
+        g_bytes = sum(len(r) for r in rows)
+        if len(self.header) + g_bytes > self.max_bytes or (self.max_rows and len(rows) > self.max_rows):
+            # Bigger than a whole part on its own: split it greedily by rows
+            self.flush()
+            for r in rows:
+                if self.w is not None and not self._fits(len(r), 1):
+                    self.flush()
+                self.write([r])
+            self.flush()
+            return
+        if self.w is not None and not self._fits(g_bytes, len(rows)):
+            self.flush()
+        self.write(rows)
+
+
+def export_parts(df: pd.DataFrame, max_mb: float, max_rows: int, open_part,
+                 block_rows: int = None, cpu_workers: int = None) -> list[tuple]:
+    """
+    Split df into utf-8-sig CSV parts of at most max_mb (and max_rows rows
+    when set), byte for byte what csv_chunker.split_csv produces.
+    open_part(n) returns a writer for part n = 1, 2, … with write(bytes) and
+    close() -> result. Returns [(result, row count, bytes)].
+    """
+    splitter = _PartSplitter(_BOM + header_bytes(df), int(max_mb * 1024 * 1024), max_rows, open_part)
+    try:
+        if _contiguous_handles(df):
+            for rows in _handle_groups(df, _blocks(df, row_bytes, block_rows, cpu_workers)):
+                splitter.add_product(rows)
+        else:
+            # A Handle's rows are spread over the frame: pack from the full plan instead
+            rows, _, plan = _plan(df, max_mb, max_rows, None)
+            for pos in plan:
+                splitter.write([rows[i] for i in pos])
+                splitter.flush()
+        splitter.flush()
+    except BaseException:
+        splitter.abort()
+        raise
+    return splitter.parts
+
+
+def export_parts_to_dir(df: pd.DataFrame, out_dir: str, prefix: str, max_mb: float, max_rows: int = 0,
+                        block_rows: int = None, cpu_workers: int = None) -> list[tuple[str, int, int]]:
+    """Parts as out_dir/{prefix}_part{n}.csv; returns [(path, row count, bytes)]."""
+    os.makedirs(out_dir, exist_ok=True)
+    return export_parts(df, max_mb, max_rows, lambda n: _FileWriter(os.path.join(out_dir, f"{prefix}_part{n}.csv")),
+                        block_rows, cpu_workers)
+
+
+def export_parts_to_store(df: pd.DataFrame, prefix: str, max_mb: float, max_rows: int = 0, store=None,
+                          block_rows: int = None, cpu_workers: int = None) -> list[tuple[dict, int]]:
+    """Parts streamed into the artifact store as {prefix}_part{n}.csv; returns [(ref, row count)]."""
+    from utils.artifact_store import get_default_store
+    store = store or get_default_store()
+    parts = export_parts(df, max_mb, max_rows, lambda n: store.writer(f"{prefix}_part{n}.csv", kind="csv"),
+                         block_rows, cpu_workers)
+    return [(ref, rows) for ref, rows, _ in parts]
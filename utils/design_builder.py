@@ -0,0 +1,214 @@
+# utils/design_builder.py
+"""
+Design → Shopify CSV DataFrame, split into an I/O half (Dropbox metadata and
+image links) and a CPU half (SKU generation, SEO fields, CSV bytes) so batch
+builds can run the first on threads and the second on worker processes.
+Nothing here imports Streamlit or the Dropbox SDK at import time; worker
+processes import this module only.
+"""
+from __future__ import annotations
+
+import os
+import json
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING
+
+import pandas as pd
+
+from constants.config import shopify_defaults
+from constants.data_loader import load_json, json_path
+from utils.sku_generator import generate_sku_dataframe
+from utils.dropbox_utils import load_dropbox_image_links_parallel as load_dropbox_image_links
+from utils.text_derive import meta_150_last_sentence as _meta_150_last_sentence, map_unique
+
+if TYPE_CHECKING:
+    import dropbox
+
+BATCH_IO_WORKERS  = int(os.getenv("BATCH_IO_WORKERS", "4"))
+BATCH_CPU_WORKERS = int(os.getenv("BATCH_CPU_WORKERS", "0")) or (os.cpu_count() or 1)
+BATCH_MIN_FOR_PROCESSES = int(os.getenv("BATCH_MIN_FOR_PROCESSES", "3"))  # smaller batches stay in-process
+BATCH_MIN_ROWS_FOR_PROCESSES = 50_000
+
+
+CONFIG_FILES = {
+    "garment_keys": "garment_keys.json",
+    "body_html_map": "size_guides.json",
+    "product_extras": "product_extras.json",
+    "product_types": "product_types.json",
+    "correct_colors_by_type": "colors.json",
+}
+
+
+@lru_cache(maxsize=1)
+def _load_catalog_config(mtimes: tuple) -> dict:
+    return {key: load_json(fname) for key, fname in CONFIG_FILES.items()}
+
+
+def _catalog_config() -> dict:
+    """constants/ JSON, re-read whenever one of the files changes on disk (keyed by mtime)."""
+    return _load_catalog_config(tuple(os.stat(json_path(f)).st_mtime_ns for f in CONFIG_FILES.values()))
+
+
+def clear_catalog_config():
+    _load_catalog_config.cache_clear()
+
+# ----- SEO / CSV helpers -----
+
+def ensure_image_src_column(df: pd.DataFrame) -> pd.DataFrame:
+    if "Image Src" not in df.columns and "Image URL" in df.columns:
+        df["Image Src"] = df["Image URL"]
+    return df
+
+def ensure_shopify_csv_fields(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    - Title = product_name + garment type (already in df)
+    - SEO Title = full title with pipe (already in df["SEO Title"])
+    - SEO Description: from Body (HTML), cut at last '.' before 150 chars
+    - Google Shopping / Custom Label 0: 'Sal'
+    """
+    # Use existing df["Title"] and df["SEO Title"], no modification
+    # Just ensure the SEO Description is processed (once per distinct body, not per variant row)
+
+    df["SEO Description"] = map_unique(df["Body (HTML)"], _meta_150_last_sentence)
+
+    col = "Google Shopping / Custom Label 0"
+    if col not in df.columns:
+        df[col] = "Sal"
+    else:
+        df[col] = df[col].fillna("Sal").replace("", "Sal")
+
+    return df
+
+# ----- I/O half (threads) -----
+
+def download_metadata(dbx: dropbox.Dropbox, folder_path: str) -> dict:
+    from dropbox.files import FileMetadata
+    from dropbox.exceptions import ApiError
+    try:
+        entries = dbx.files_list_folder(folder_path).entries
+        json_files = [e.name for e in entries if isinstance(e, FileMetadata) and e.name.lower().endswith(".json")]
+        if not json_files:
+            raise FileNotFoundError(f"No .json metadata file found in {folder_path}")
+        target_file = json_files[0]  # Use first one found
+        _, res = dbx.files_download(f"{folder_path}/{target_file}")
+        return json.loads(res.content)
+    except ApiError as e:
+        raise RuntimeError(f"Error accessing {folder_path}: {e}")
+
+def validate_metadata(meta: dict):
+    garment_keys = _catalog_config()["garment_keys"]
+    if not meta.get("product_name","").strip() or not meta.get("sku_suffix","").strip() or not meta.get("main_color","").strip():
+        raise ValueError("metadata.json missing product_name / sku_suffix / main_color")
+    if not isinstance(meta.get("tags", []), list):
+        raise ValueError("metadata.json 'tags' must be a list")
+    if len(meta.get("descriptions", [])) != len(garment_keys):
+        raise ValueError(f"metadata.json 'descriptions' must have {len(garment_keys)} items")
+
+def fetch_design_inputs(dbx: dropbox.Dropbox, designs_root: str, folder: str):
+    """Dropbox side of a build: (meta, image_links, missing)."""
+    folder_path = f"{designs_root}/{folder}"
+    meta = download_metadata(dbx, folder_path)
+    validate_metadata(meta)
+    image_links, missing = load_dropbox_image_links(dbx, folder_path, total_images=80)
+    return meta, image_links, missing
+
+# ----- CPU half (processes) -----
+
+def generate_design_dataframe(meta: dict, image_links: dict) -> pd.DataFrame:
+    """metadata.json + image links → CSV-ready DataFrame (pure, picklable in and out)."""
+    cfg = _catalog_config()
+
+    # Restrictions in metadata.json decide excluded colours; missing or empty means no restriction
+    restrictions = meta.get("Restrictions", "")
+    excluded_colors = [c.strip() for c in restrictions.split(",") if c.strip()] if restrictions else []
+
+    tags_csv = ", ".join(t.strip() for t in meta.get("tags", []) if t.strip())
+    df = generate_sku_dataframe(
+        product_name=meta.get("product_name","").strip(),
+        sku_suffix=meta.get("sku_suffix","").strip().upper(),
+        main_color=meta.get("main_color","").strip(),
+        tags=tags_csv,
+        garment_keys=cfg["garment_keys"],
+        raw_descriptions=meta.get("descriptions", []),
+        body_html_map=cfg["body_html_map"],
+        product_extras=cfg["product_extras"],
+        product_types=cfg["product_types"],
+        correct_colors_by_type=cfg["correct_colors_by_type"],
+        vendor=shopify_defaults["vendor"],
+        published=shopify_defaults["published"],
+        inventory_policy=shopify_defaults["inventory_policy"],
+        fulfillment_service=shopify_defaults["fulfillment_service"],
+        requires_shipping=shopify_defaults["requires_shipping"],
+        taxable=shopify_defaults["taxable"],
+        inventory_tracker=shopify_defaults["inventory_tracker"],
+        image_links=image_links,
+        excluded_colors=excluded_colors,
+        page_titles=meta.get("page_titles", []),
+    )
+    df = ensure_image_src_column(df)
+
+    # >>> Your requested CSV fields <<<
+    df = ensure_shopify_csv_fields(df)
+    return df
+
+# ----- entrypoints -----
+
+def build_design_dataframe(dbx: dropbox.Dropbox, designs_root: str, folder: str):
+    """One design, in-process: (df, meta, missing)."""
+    meta, image_links, missing = fetch_design_inputs(dbx, designs_root, folder)
+    return generate_design_dataframe(meta, image_links), meta, missing
+
+def _process_pool(workers: int):
+    # spawn: never fork a process that is running Streamlit and HTTP threads
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def build_designs_parallel(dbx: dropbox.Dropbox, designs_root: str, folders, progress=None,
+                           io_workers: int = None, cpu_workers: int = None):
+    """
+    Build many designs: Dropbox fetches fan out over io_workers threads, and
+    each design goes to the process pool for generation as soon as its
+    fetch lands. Returns [(folder, df, meta, missing, error)] in folder order.
+    """
+    folders = list(folders)
+    io_workers = max(1, int(io_workers or BATCH_IO_WORKERS))
+    cpu_workers = max(1, int(cpu_workers or BATCH_CPU_WORKERS))
+    use_processes = cpu_workers > 1 and len(folders) >= BATCH_MIN_FOR_PROCESSES
+    results = {}
+
+    cpu = _process_pool(min(cpu_workers, len(folders))) if use_processes else None
+    try:
+        with ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="design-io") as io:
+            fetches = {io.submit(fetch_design_inputs, dbx, designs_root, f): f for f in folders}
+            generating = {}
+            for fut in as_completed(fetches):
+                f = fetches[fut]
+                try:
+                    meta, image_links, missing = fut.result()
+                except Exception as e:
+                    results[f] = (f, None, None, None, e)
+                    if progress: progress(f"❌ {f}: {e}")
+                    continue
+                if cpu is None:
+                    try:
+                        results[f] = (f, generate_design_dataframe(meta, image_links), meta, missing, None)
+                    except Exception as e:
+                        results[f] = (f, None, meta, missing, e)
+                    if progress: progress(f"✅ {f}: built")
+                    continue
+                generating[cpu.submit(generate_design_dataframe, meta, image_links)] = (f, meta, missing)
+                if progress: progress(f"⬇️ {f}: fetched, generating…")
+
+        for fut in as_completed(generating):
+            f, meta, missing = generating[fut]
+            try:
+                results[f] = (f, fut.result(), meta, missing, None)
+                if progress: progress(f"✅ {f}: built")
+            except Exception as e:
+                results[f] = (f, None, meta, missing, e)
+                if progress: progress(f"❌ {f}: {e}")
+    finally:
+        if cpu is not None:
+            cpu.shutdown(wait=True)
+    return [results[f] for f in folders]
@@ -1,13 +1,14 @@
 # utils/dropbox_utils.py
+# The Dropbox SDK is imported on first use; callers load .env / dpbox.env (utils.startup.load_env).
+from __future__ import annotations
 
 import os
 import re
 import time
-import dropbox
-from dropbox.exceptions import ApiError
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING
 
-load_dotenv("dpbox.env")
+if TYPE_CHECKING:
+    import dropbox
 
 ## Trying to speed up image link fetching with threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -51,6 +52,7 @@ def load_dropbox_image_links_parallel(
 # -----------------------------
 def get_dropbox_client():
     """Return an authenticated Dropbox client."""
+    import dropbox
     return dropbox.Dropbox(
         app_key=os.getenv("DROPBOX_APP_KEY"),
         app_secret=os.getenv("DROPBOX_APP_SECRET"),
@@ -66,6 +68,7 @@ def to_direct_dropbox_link(url: str) -> str:
 
 def get_shared_link(dbx: dropbox.Dropbox, path: str) -> str | None:
     """Get or create a Dropbox shared link for a file and return a direct link."""
+    from dropbox.exceptions import ApiError
     try:
         links = dbx.sharing_list_shared_links(path=path, direct_only=True).links
         if links:
@@ -105,8 +108,50 @@ def load_dropbox_image_links(
 # -----------------------------
 # New: path / move utilities
 # -----------------------------
+def list_folder_entries(dbx: dropbox.Dropbox, path: str) -> tuple[dict[str, str], list[str]]:
+    """({file name: rev}, folder names) directly under path."""
+    from dropbox.files import FileMetadata, FolderMetadata
+    res = dbx.files_list_folder(path)
+    entries = list(res.entries)
+    while res.has_more:
+        res = dbx.files_list_folder_continue(res.cursor)
+        entries.extend(res.entries)
+    files = {e.name: e.rev for e in entries if isinstance(e, FileMetadata)}
+    folders = [e.name for e in entries if isinstance(e, FolderMetadata)]
+    return files, folders
+
+
+def list_folder_names(dbx: dropbox.Dropbox, path: str) -> tuple[list[str], list[str]]:
+    """(file names, folder names) directly under path."""
+    files, folders = list_folder_entries(dbx, path)
+    return list(files), folders
+
+
+def get_thumbnail_batch(
+    dbx: dropbox.Dropbox,
+    paths: list[str],
+    size: str = "w256h256",
+    fmt: str = "jpeg",
+) -> dict[str, tuple[str, bytes]]:
+    """
+    One files_get_thumbnail_batch call (Dropbox allows 25 paths per call).
+    Returns {path: (rev, thumbnail bytes)}; paths Dropbox can't thumbnail are left out.
+    """
+    import base64
+    from dropbox.files import ThumbnailArg, ThumbnailFormat, ThumbnailSize
+    args = [ThumbnailArg(path=p, format=getattr(ThumbnailFormat, fmt), size=getattr(ThumbnailSize, size))
+            for p in paths]
+    out = {}
+    for path, entry in zip(paths, dbx.files_get_thumbnail_batch(args).entries):
+        if entry.is_success():
+            data = entry.get_success()
+            out[path] = (data.metadata.rev, base64.b64decode(data.thumbnail))
+    return out
+
+
 def path_exists(dbx: dropbox.Dropbox, path: str) -> bool:
     """Return True if a file/folder exists at path."""
+    from dropbox.exceptions import ApiError
     try:
         dbx.files_get_metadata(path)
         return True
@@ -116,6 +161,7 @@ def path_exists(dbx: dropbox.Dropbox, path: str) -> bool:
 
 def _ensure_folder(dbx: dropbox.Dropbox, path: str):
     """Create a folder if it doesn't already exist."""
+    from dropbox.exceptions import ApiError
     try:
         dbx.files_get_metadata(path)
     except ApiError:
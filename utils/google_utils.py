@@ -1,17 +1,26 @@
 import os
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import streamlit as st
 
-def connect_to_sheet(sheet_name):
+def open_sheet(sheet_name):
+    """First worksheet of sheet_name; raises RuntimeError when GOOGLE_KEYFILE is unusable."""
+    # gspread / oauth2client take ~0.4s to import, so only pay for them when a sheet is opened
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     json_key_path = os.getenv("GOOGLE_KEYFILE")
 
     if not json_key_path or not os.path.exists(json_key_path):
-        st.error("❌ GOOGLE_KEYFILE not set or the file doesn't exist.")
-        st.stop()
+        raise RuntimeError("GOOGLE_KEYFILE not set or the file doesn't exist.")
 
     creds = ServiceAccountCredentials.from_json_keyfile_name(json_key_path, scope)
     client = gspread.authorize(creds)
     sheet = client.open(sheet_name).sheet1
     return sheet
+
+def connect_to_sheet(sheet_name):
+    """open_sheet for the Streamlit app: a missing key file stops the script with an error."""
+    try:
+        return open_sheet(sheet_name)
+    except RuntimeError as e:
+        import streamlit as st
+        st.error(f"❌ {e}")
+        st.stop()
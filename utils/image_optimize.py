@@ -0,0 +1,153 @@
+# utils/image_optimize.py
+"""
+Mockup re-encoding before upload. The numbered mockups are multi-MB PNGs;
+handed to Shopify as-is, its image fetcher times out on them and answers
+422 "Could not download image". With SHOPIFY_IMAGE_OPTIMIZE on, the
+uploader fetches each distinct mockup once, resizes it to fit
+IMAGE_OPTIMIZE_MAX_PX and re-encodes it as WebP or JPEG, then sends the
+result through a staged upload instead of the original URL.
+
+Encoding is CPU-bound Pillow work and runs on worker processes; fetches run
+on threads. Results are cached under IMAGE_OPTIMIZE_DIR by the SHA-256 of
+the original bytes plus the settings, so a mockup reused by several
+designs, stores or reruns is encoded once.
+"""
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_OPTIMIZE         = os.getenv("SHOPIFY_IMAGE_OPTIMIZE", "false").lower() in ("1", "true", "yes")
+IMAGE_OPTIMIZE_FORMAT  = os.getenv("IMAGE_OPTIMIZE_FORMAT", "webp").lower()      # webp | jpeg
+IMAGE_OPTIMIZE_MAX_PX  = int(os.getenv("IMAGE_OPTIMIZE_MAX_PX", "2048"))         # longest side
+IMAGE_OPTIMIZE_QUALITY = int(os.getenv("IMAGE_OPTIMIZE_QUALITY", "85"))
+IMAGE_OPTIMIZE_WORKERS = int(os.getenv("IMAGE_OPTIMIZE_WORKERS", "0")) or (os.cpu_count() or 1)
+IMAGE_OPTIMIZE_FETCH_WORKERS = int(os.getenv("IMAGE_OPTIMIZE_FETCH_WORKERS", "4"))
+IMAGE_OPTIMIZE_DIR     = os.getenv("IMAGE_OPTIMIZE_DIR", os.path.join(".state", "image_opt"))
+
+_FORMATS = {"webp": (".webp", "image/webp", "WEBP"), "jpeg": (".jpg", "image/jpeg", "JPEG"),
+            "jpg": (".jpg", "image/jpeg", "JPEG")}
+
+
+def _settings(fmt: str = None, max_px: int = None, quality: int = None) -> tuple:
+    fmt = (fmt or IMAGE_OPTIMIZE_FORMAT).lower()
+    if fmt not in _FORMATS:
+        raise ValueError(f"IMAGE_OPTIMIZE_FORMAT must be webp or jpeg, not {fmt!r}")
+    return fmt, int(max_px or IMAGE_OPTIMIZE_MAX_PX), int(quality or IMAGE_OPTIMIZE_QUALITY)
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(src_path: str, fmt: str = None, max_px: int = None, quality: int = None) -> str:
+    """Where the optimized copy of src_path lives: keyed by its content and the settings."""
+    fmt, max_px, quality = _settings(fmt, max_px, quality)
+    key = hashlib.sha256(f"{_file_sha256(src_path)}|{fmt}|{max_px}|{quality}".encode()).hexdigest()
+    return os.path.join(IMAGE_OPTIMIZE_DIR, key + _FORMATS[fmt][0])
+
+
+def encode(src_path: str, out_path: str, fmt: str, max_px: int, quality: int) -> int:
+    """Resize src_path to fit max_px and write it to out_path as fmt. Returns the bytes written."""
+    from PIL import Image
+    with Image.open(src_path) as im:
+        im.draft("RGB", (max_px, max_px))   # JPEG sources decode straight at a reduced scale
+        im.thumbnail((max_px, max_px), Image.LANCZOS)
+        if fmt == "webp":
+            im = im.convert("RGBA" if "A" in im.getbands() or "transparency" in im.info else "RGB")
+            opts = {"quality": quality, "method": 4}
+        else:
+            if "A" in im.getbands() or "transparency" in im.info:
+                # JPEG has no alpha: flatten transparent mockups onto white like the storefront shows them
+                rgba = im.convert("RGBA")
+                im = Image.new("RGB", rgba.size, (255, 255, 255))
+                im.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                im = im.convert("RGB")
+            opts = {"quality": quality, "optimize": True, "progressive": True}
+        tmp = f"{out_path}.{os.getpid()}.part"
+        try:
+            im.save(tmp, _FORMATS[fmt][2], **opts)
+            os.replace(tmp, out_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return os.path.getsize(out_path)
+
+
+def optimize_sources(srcs, fetch, progress=None, fmt: str = None, max_px: int = None, quality: int = None,
+                     workers: int = None) -> dict:
+    """
+    Optimized local copies for image URLs. fetch(src) -> (path, filename, mime)
+    downloads the original (see shopify_utils._download_image_to_cache).
+    Returns {src: (path, filename, mime)} for every src that encoded to fewer
+    bytes than the original; the rest (fetch or decode failures, images
+    already small) are left out, and the caller keeps the original URL.
+    """
+    from utils.progress import ProgressEvent
+    fmt, max_px, quality = _settings(fmt, max_px, quality)
+    ext, mime, _ = _FORMATS[fmt]
+    srcs = [s for s in dict.fromkeys(srcs) if s]
+    if not srcs:
+        return {}
+    os.makedirs(IMAGE_OPTIMIZE_DIR, exist_ok=True)
+
+    def fetch_one(src):
+        try:
+            path, filename, _ = fetch(src)
+            return src, path, filename, cache_path(path, fmt, max_px, quality)
+        except Exception as e:
+            _emit(progress, ProgressEvent(f"⚠️ Mockup fetch failed, keeping the original URL: {e}", level="warning"))
+            return src, None, None, None
+
+    with ThreadPoolExecutor(max_workers=max(1, IMAGE_OPTIMIZE_FETCH_WORKERS), thread_name_prefix="image-fetch") as io:
+        fetched = [f for f in io.map(fetch_one, srcs) if f[1]]
+
+    todo = list({out: path for _, path, _, out in fetched if not os.path.exists(out)}.items())
+    failed = set()
+    workers = max(1, min(int(workers or IMAGE_OPTIMIZE_WORKERS), len(todo) or 1))
+    if todo:
+        _emit(progress, f"🗜️ Optimizing {len(todo)} mockup(s) to {fmt.upper()} ≤{max_px}px "
+                        f"({len(fetched) - len(todo)} cached)")
+        if workers == 1 or len(todo) == 1:
+            outcomes = [_try_encode(path, out, fmt, max_px, quality) for out, path in todo]
+        else:
+            from utils.design_builder import _process_pool
+            with _process_pool(workers) as pool:
+                outcomes = list(pool.map(_try_encode, [p for _, p in todo], [o for o, _ in todo],
+                                         [fmt] * len(todo), [max_px] * len(todo), [quality] * len(todo)))
+        for (out, path), err in zip(todo, outcomes):
+            if err:
+                failed.add(out)
+                _emit(progress, ProgressEvent(f"⚠️ Could not optimize {os.path.basename(path)}, "
+                                              f"keeping the original: {err}", level="warning"))
+
+    result, before, after = {}, 0, 0
+    for src, path, filename, out in fetched:
+        if out in failed or not os.path.exists(out):
+            continue
+        orig, small = os.path.getsize(path), os.path.getsize(out)
+        if small >= orig:
+            continue
+        before, after = before + orig, after + small
+        result[src] = (out, os.path.splitext(filename)[0] + ext, mime)
+    if result:
+        _emit(progress, f"🗜️ {len(result)} mockup(s): {before / 1048576:.1f} MB → {after / 1048576:.1f} MB")
+    return result
+
+
+def _try_encode(src_path, out_path, fmt, max_px, quality):
+    """encode() for the worker pool: None on success, the error text otherwise."""
+    try:
+        encode(src_path, out_path, fmt, max_px, quality)
+        return None
+    except Exception as e:
+        return str(e) or type(e).__name__
+
+
+def _emit(progress, msg):
+    if progress:
+        progress(msg)
@@ -0,0 +1,284 @@
+# utils/job_queue.py
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+from utils.progress import ProgressAggregator, as_event, level_enabled
+
+JOB_QUEUE_PATH   = os.getenv("JOB_QUEUE_PATH", os.path.join(".state", "jobs.sqlite3"))
+JOB_LEASE_SECS   = float(os.getenv("JOB_LEASE_SECS", "120"))     # a claim not renewed this long is taken over
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))       # claims before a job is failed for good
+JOB_LOG_KEEP     = 200                                           # log lines kept per job
+
+ACTIVE   = ("queued", "running")
+FINISHED = ("done", "failed", "deferred", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT NOT NULL,
+    design      TEXT NOT NULL,
+    store       TEXT NOT NULL,
+    params      TEXT NOT NULL DEFAULT '{}',
+    status      TEXT NOT NULL DEFAULT 'queued',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    lease_until REAL,
+    progress    TEXT,
+    result      TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, lease_until, id);
+CREATE TABLE IF NOT EXISTS job_log (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id      INTEGER NOT NULL,
+    ts          REAL NOT NULL,
+    level       TEXT NOT NULL,
+    msg         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_log_job ON job_log (job_id, id);
+CREATE TABLE IF NOT EXISTS workers (
+    worker      TEXT PRIMARY KEY,
+    seen_at     REAL NOT NULL,
+    job_id      INTEGER
+);
+"""
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    Durable queue of build / upload jobs shared by the app and worker processes.
+
+    The app enqueues and polls; workers claim the oldest runnable job with a
+    lease (JOB_LEASE_SECS) and renew it while they work. A job whose lease
+    runs out — its worker crashed or was killed — is claimed again by the
+    next worker, up to JOB_MAX_ATTEMPTS claims; the upload ledger makes the
+    retry skip what was already created.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or JOB_QUEUE_PATH
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _exec(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _row(r) -> dict:
+        job = dict(r)
+        for k in ("params", "progress", "result"):
+            job[k] = json.loads(job[k]) if job[k] else None
+        return job
+
+    # ---------- app side ----------
+
+    def enqueue(self, kind: str, design: str, store: str, params: dict = None) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (kind, design, store, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, design, store, json.dumps(params or {}), now, now),
+            )
+            return cur.lastrowid
+
+    def active_for(self, store: str, design: str) -> dict | None:
+        """The queued or running job for this design, if any (to avoid enqueuing it twice)."""
+        rows = self._exec(
+            f"SELECT * FROM jobs WHERE store=? AND design=? AND status IN ({','.join('?' * len(ACTIVE))}) "
+            "ORDER BY id LIMIT 1",
+            (store, design, *ACTIVE),
+        )
+        return self._row(rows[0]) if rows else None
+
+    def get(self, job_id: int) -> dict | None:
+        rows = self._exec("SELECT * FROM jobs WHERE id=?", (job_id,))
+        return self._row(rows[0]) if rows else None
+
+    def jobs(self, limit: int = 50, statuses=None) -> list[dict]:
+        if statuses:
+            rows = self._exec(
+                f"SELECT * FROM jobs WHERE status IN ({','.join('?' * len(statuses))}) ORDER BY id DESC LIMIT ?",
+                (*statuses, limit),
+            )
+        else:
+            rows = self._exec("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [self._row(r) for r in rows]
+
+    def log_lines(self, job_id: int, after_id: int = 0, limit: int = 50) -> list[dict]:
+        rows = self._exec(
+            "SELECT * FROM (SELECT * FROM job_log WHERE job_id=? AND id>? ORDER BY id DESC LIMIT ?) ORDER BY id",
+            (job_id, after_id, limit),
+        )
+        return [dict(r) for r in rows]
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a job that no worker has claimed yet."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status='cancelled', updated_at=? WHERE id=? AND status='queued'",
+                (time.time(), job_id),
+            )
+            return cur.rowcount > 0
+
+    def workers_online(self, within: float = None) -> list[dict]:
+        cutoff = time.time() - (within or JOB_LEASE_SECS)
+        return [dict(r) for r in self._exec("SELECT * FROM workers WHERE seen_at>=? ORDER BY worker", (cutoff,))]
+
+    # ---------- worker side ----------
+
+    def claim(self, worker: str, lease: float = None) -> dict | None:
+        """
+        Atomically take the oldest queued job, or a running one whose lease
+        expired. Jobs past JOB_MAX_ATTEMPTS are failed instead of handed out.
+        A job with params["after"] (job ids) waits until none of those is queued or running.
+        """
+        lease = lease or JOB_LEASE_SECS
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO workers (worker, seen_at, job_id) VALUES (?, ?, NULL)",
+                                   (worker, now))
+                self._conn.execute(
+                    "UPDATE jobs SET status='failed', error=?, updated_at=? "
+                    "WHERE status='running' AND lease_until<? AND attempts>=?",
+                    (f"Worker lost {JOB_MAX_ATTEMPTS} times (lease expired)", now, now, JOB_MAX_ATTEMPTS),
+                )
+                row = self._conn.execute(
+                    "SELECT id FROM jobs j WHERE (status='queued' OR (status='running' AND lease_until<?)) "
+                    "AND NOT EXISTS (SELECT 1 FROM json_each(j.params, '$.after') a JOIN jobs d ON d.id=a.value "
+                    f"WHERE d.status IN ({','.join('?' * len(ACTIVE))})) "
+                    "ORDER BY id LIMIT 1",
+                    (now, *ACTIVE),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status='running', worker=?, lease_until=?, attempts=attempts+1, "
+                    "started_at=COALESCE(started_at, ?), updated_at=? WHERE id=?",
+                    (worker, now + lease, now, now, row["id"]),
+                )
+                self._conn.execute("UPDATE workers SET job_id=? WHERE worker=?", (row["id"], worker))
+                job = self._conn.execute("SELECT * FROM jobs WHERE id=?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._row(job)
+
+    def heartbeat(self, job_id: int, worker: str, lease: float = None, progress: dict = None) -> bool:
+        """Renew the lease (and store a progress snapshot). False if another worker owns the job now."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET lease_until=?, updated_at=?, progress=COALESCE(?, progress) "
+                "WHERE id=? AND worker=? AND status='running'",
+                (now + (lease or JOB_LEASE_SECS), now, json.dumps(progress) if progress is not None else None,
+                 job_id, worker),
+            )
+            self._conn.execute("UPDATE workers SET seen_at=? WHERE worker=?", (now, worker))
+            return cur.rowcount > 0
+
+    def finish(self, job_id: int, worker: str, status: str, result=None, error: str = None,
+               progress: dict = None) -> bool:
+        assert status in FINISHED
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status=?, result=?, error=?, progress=COALESCE(?, progress), "
+                "lease_until=NULL, updated_at=? WHERE id=? AND worker=? AND status='running'",
+                (status, json.dumps(result) if result is not None else None, error,
+                 json.dumps(progress) if progress is not None else None, time.time(), job_id, worker),
+            )
+            self._conn.execute("UPDATE workers SET job_id=NULL, seen_at=? WHERE worker=?", (time.time(), worker))
+            return cur.rowcount > 0
+
+    def log(self, job_id: int, msg: str, level: str = "info"):
+        with self._lock:
+            self._conn.execute("INSERT INTO job_log (job_id, ts, level, msg) VALUES (?, ?, ?, ?)",
+                               (job_id, time.time(), level, msg))
+            # Trim in batches of 50 once this job is over its quota (rowids are shared by all jobs)
+            (lines,) = self._conn.execute("SELECT COUNT(*) FROM job_log WHERE job_id=?", (job_id,)).fetchone()
+            if lines >= JOB_LOG_KEEP + 50:
+                self._conn.execute(
+                    "DELETE FROM job_log WHERE job_id=? AND id NOT IN "
+                    "(SELECT id FROM job_log WHERE job_id=? ORDER BY id DESC LIMIT ?)",
+                    (job_id, job_id, JOB_LOG_KEEP),
+                )
+
+
+class JobProgressSink:
+    """
+    Progress callback for a job: lines at SHOPIFY_PROGRESS_LEVEL go to the
+    job log, every event feeds a ProgressAggregator whose snapshot is
+    saved with the lease renewal at most every `interval` seconds.
+    """
+    accepts_events = True
+
+    def __init__(self, queue: JobQueue, job_id: int, worker: str, prefix: str = "", interval: float = 1.0):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker = worker
+        self.prefix = f"[{prefix}] " if prefix else ""
+        self.interval = interval
+        self.agg = ProgressAggregator()
+        self._last = 0.0
+
+    def for_design(self, name: str):
+        sink = JobProgressSink(self.queue, self.job_id, self.worker, prefix=name, interval=self.interval)
+        sink.agg = self.agg
+        return sink
+
+    def __call__(self, msg):
+        ev = as_event(msg)
+        self.agg.add(ev)
+        if level_enabled(ev.level):
+            self.queue.log(self.job_id, f"{self.prefix}{ev}", ev.level)
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.flush()
+
+    def snapshot(self) -> dict:
+        snap = self.agg.snapshot()
+        snap.pop("recent", None)
+        snap["warnings"] = snap["warnings"][-10:]
+        return snap
+
+    def flush(self):
+        self.queue.heartbeat(self.job_id, self.worker, progress=self.snapshot())
+
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def get_default_queue():
+    """Process-wide queue at JOB_QUEUE_PATH."""
+    global _default_queue
+    with _default_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue()
+        return _default_queue
@@ -0,0 +1,215 @@
+# utils/job_worker.py
+"""
+Worker processes for utils.job_queue. Each process claims one job at a time,
+renews its lease from a heartbeat thread and runs the job through
+utils.workflow. Start them with `python cli.py worker --processes N`.
+
+Job kinds (params):
+    upload      designs, designs_root, options, resume  — build + upload folders
+    upload_csv  csv_path, designs_root, options         — upload one built CSV
+    resume      designs_root, options                   — the daily-quota queue (idle workers
+                                                          queue one when designs there fit)
+    move        designs_root, after                     — move to /finished once every job
+                                                          in `after` is done (fan-out uploads)
+"""
+import os
+import time
+import threading
+import traceback
+import multiprocessing
+
+from utils.job_queue import JobProgressSink, get_default_queue, worker_name, JOB_LEASE_SECS
+from utils.upload_ledger import store_key
+from utils.progress import ProgressEvent
+
+JOB_POLL_SECS = float(os.getenv("JOB_POLL_SECS", "2"))
+QUOTA_RESUME_SECS = float(os.getenv("JOB_QUOTA_RESUME_SECS", "300"))   # idle check of the quota queue
+
+# Store credentials are looked up by URL from the worker's own environment; jobs never carry tokens
+_STORE_ENV = [
+    ("SHOPIFY_STORE_URL_TEST", "SHOPIFY_API_PASSWORD_TEST"),
+    ("SHOPIFY_STORE_URL_PROD", "SHOPIFY_API_PASSWORD_PROD"),
+    ("SHOPIFY_STORE_URL", "SHOPIFY_API_PASSWORD"),
+    ("SHOPIFY_STORE_URL", "SHOPIFY_ADMIN_API_ACCESS_TOKEN"),
+]
+
+
+def _known_stores() -> dict:
+    stores = {}
+    for url_env, token_env in _STORE_ENV:
+        url, token = (os.getenv(url_env) or "").strip(), (os.getenv(token_env) or "").strip()
+        if url and token:
+            stores.setdefault(store_key(url), (url, token))
+    return stores
+
+
+def store_client(store_url: str, stores: dict):
+    """The ShopifyClient for a job's store URL, with this worker's credentials."""
+    from utils.shopify_utils import client_for
+    try:
+        url, token = stores[store_key(store_url)]
+    except KeyError:
+        raise RuntimeError(f"No credentials for {store_url} in this worker's environment") from None
+    return client_for(url, token)
+
+
+def job_status(summary: list[tuple]) -> str:
+    statuses = {row[1] for row in summary}
+    if "failed" in statuses:
+        return "failed"
+    if "deferred" in statuses:
+        return "deferred"
+    return "done"
+
+
+class _Lease(threading.Thread):
+    """Renews the job lease every third of JOB_LEASE_SECS, even while the job is quiet."""
+
+    def __init__(self, sink: JobProgressSink, lease: float):
+        super().__init__(daemon=True, name="job-lease")
+        self.sink = sink
+        self.every = lease / 3
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(self.every):
+            self.sink.flush()
+
+
+def enqueue_due_resumes(queue, stores: dict) -> list[int]:
+    """
+    Queue a `resume` job for each of this worker's stores whose quota queue
+    has designs that fit now, unless one is queued or running already. The
+    designs root and options come from the store's latest upload job.
+    """
+    from utils.variant_quota import get_default_quota
+    quota = get_default_quota()
+    if quota is None:
+        return []
+    recent = queue.jobs(limit=50)
+    ids = []
+    for url, _ in stores.values():
+        store = store_client(url, stores).store
+        if not quota.due(store) or queue.active_for(store, "quota queue"):
+            continue
+        last = next((j for j in recent
+                     if store_key(j["store"]) == store_key(store) and j["kind"] in ("upload", "upload_csv", "resume")), None)
+        params = {k: v for k, v in ((last or {}).get("params") or {}).items() if k in ("designs_root", "options")}
+        ids.append(queue.enqueue("resume", "quota queue", store, params))
+    return ids
+
+
+def _move_after(job: dict, sink: JobProgressSink, dbx_factory, root: str) -> list[tuple]:
+    """Move the design to /finished if every job it waited for is done; the claim already waited for them."""
+    from utils import workflow
+    t0 = time.perf_counter()
+    deps = [sink.queue.get(i) or {"id": i, "status": "missing", "store": "?"} for i in job["params"].get("after") or []]
+    unfinished = [f"{d['store']} (job #{d['id']} {d['status']})" for d in deps if d["status"] != "done"]
+    if unfinished:
+        return [(job["design"], "failed", f"Not moved: {', '.join(unfinished)}", time.perf_counter() - t0)]
+    dest = workflow.finish_design(dbx_factory(), root, job["design"])
+    sink(f"📦 Moved to {dest}")
+    return [(job["design"], "done", dest, time.perf_counter() - t0)]
+
+
+def run_job(job: dict, sink: JobProgressSink, dbx_factory, client=None) -> tuple[str, dict]:
+    """Run one claimed job against `client` (its store); returns (status, result)."""
+    from utils import shopify_utils
+    from utils import workflow
+
+    params = job["params"] or {}
+    root = params.get("designs_root") or os.getenv("FOLDER_PATH_Design", "").strip()
+    options = params.get("options") or {}
+    client = (client or shopify_utils.default_client()).for_run()
+
+    if job["kind"] == "upload":
+        summary = workflow.upload_designs(dbx_factory(), root, params["designs"], sink.for_design, options,
+                                          resume=params.get("resume", False), client=client)
+    elif job["kind"] == "upload_csv":
+        dbx = dbx_factory() if options.get("move") else None
+        summary = workflow.upload_csv(dbx, root, job["design"], params["csv_path"],
+                                      sink.for_design(job["design"]), options, client=client)
+    elif job["kind"] == "resume":
+        summary = workflow.resume_quota_queue(dbx_factory(), root, sink.for_design, options, client=client)
+    elif job["kind"] == "move":
+        summary = _move_after(job, sink, dbx_factory, root)
+    else:
+        raise ValueError(f"Unknown job kind: {job['kind']}")
+
+    result = {"summary": [list(row) for row in summary], "metrics": client.metrics.snapshot()}
+    return job_status(summary), result
+
+
+def work(worker: str = None, once: bool = False, poll: float = None, queue=None):
+    """Claim and run jobs until interrupted (or until the queue is empty, with once=True)."""
+    queue = queue or get_default_queue()
+    worker = worker or worker_name()
+    poll = JOB_POLL_SECS if poll is None else poll
+    stores = _known_stores()
+    dbx = None
+
+    def dbx_factory():
+        nonlocal dbx
+        if dbx is None:
+            from utils.dropbox_utils import get_dropbox_client
+            dbx = get_dropbox_client()
+        return dbx
+
+    print(f"worker {worker}: polling {queue.path}", flush=True)
+    resume_checked = None
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            if resume_checked is None or time.monotonic() - resume_checked >= QUOTA_RESUME_SECS:
+                resume_checked = time.monotonic()
+                ids = enqueue_due_resumes(queue, stores)
+                if ids:
+                    print(f"worker {worker}: quota queue fits again, queued job(s) {ids}", flush=True)
+                    continue
+            if once:
+                return
+            time.sleep(poll)
+            continue
+
+        sink = JobProgressSink(queue, job["id"], worker)
+        lease = _Lease(sink, JOB_LEASE_SECS)
+        lease.start()
+        print(f"worker {worker}: job {job['id']} {job['kind']} {job['design']} (attempt {job['attempts']})", flush=True)
+        try:
+            status, result = run_job(job, sink, dbx_factory, store_client(job["store"], stores))
+            error = None
+        except Exception as e:
+            status, result, error = "failed", None, f"{e}\n{traceback.format_exc(limit=5)}"
+            sink(ProgressEvent(f"❌ {e}", level="error"))
+        finally:
+            lease.stop.set()
+            lease.join()
+        if not queue.finish(job["id"], worker, status, result=result, error=error, progress=sink.snapshot()):
+            print(f"worker {worker}: job {job['id']} was taken over; result dropped", flush=True)
+        print(f"worker {worker}: job {job['id']} {status}", flush=True)
+
+
+def _worker_main(once: bool):
+    # Spawned process: load the same env files the app and CLI use
+    from utils.startup import load_env
+    load_env()
+    try:
+        work(once=once)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(processes: int = 1, once: bool = False):
+    """Run `processes` workers: in this process for one, as spawned child processes for more."""
+    if processes <= 1:
+        return work(once=once)
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_worker_main, args=(once,), name=f"job-worker-{i}") for i in range(processes)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.join()
@@ -1,35 +1,26 @@
+"""
+Scan TARGET_FOLDER in Dropbox and write design_dimensions.csv (name, path,
+width, height, aspect ratio per image). Run it as a script:
+
+    python -m utils.pipeline_generate_csv
+
+Importing this module does nothing; the scan happens in main().
+"""
 import os
-import dropbox
-from dotenv import load_dotenv
-from PIL import Image
 from io import BytesIO
-import pandas as pd
-
-load_dotenv("dpbox.env")
 
-DROPBOX_APP_KEY = os.getenv("DROPBOX_APP_KEY")
-DROPBOX_APP_SECRET = os.getenv("DROPBOX_APP_SECRET")
-DROPBOX_REFRESH_TOKEN = os.getenv("DROPBOX_REFRESH_TOKEN")
-TARGET_FOLDER = os.getenv("TARGET_FOLDER")
-EXCLUDED_FOLDERS = os.getenv("EXCLUDED_FOLDERS").split(",")
-VALID_EXTENSIONS = os.getenv("VALID_EXTENSIONS").split(",")
 
-# === Allow large images (disables DecompressionBombWarning) ===
-Image.MAX_IMAGE_PIXELS = None
+def _env_list(name):
+    return [v for v in (os.getenv(name) or "").split(",") if v]
 
-# === Authenticate with Dropbox ===
-dbx = dropbox.Dropbox(
-    app_key=DROPBOX_APP_KEY,
-    app_secret=DROPBOX_APP_SECRET,
-    oauth2_refresh_token=DROPBOX_REFRESH_TOKEN
-)
 
 # === Helper: Check if a file is inside an excluded folder ===
-def is_excluded(path):
-    return any(path.startswith(excl.lower()) for excl in EXCLUDED_FOLDERS)
+def is_excluded(path, excluded_folders):
+    return any(path.startswith(excl.lower()) for excl in excluded_folders)
 
 # === Helper: List image files recursively ===
-def list_image_files(folder_path):
+def list_image_files(dbx, folder_path, excluded_folders, valid_extensions):
+    import dropbox
     print(f"Scanning folder: {folder_path}")
     image_files = []
     result = dbx.files_list_folder(folder_path, recursive=True)
@@ -43,40 +34,57 @@ def list_image_files(folder_path):
         if isinstance(entry, dropbox.files.FileMetadata):
             lower_path = entry.path_lower
             ext = os.path.splitext(lower_path)[1].lower()
-            if not is_excluded(lower_path) and ext in VALID_EXTENSIONS:
+            if not is_excluded(lower_path, excluded_folders) and ext in valid_extensions:
                 image_files.append(entry)
     return image_files
 
 # === Helper: Get image dimensions ===
-def get_image_dimensions(file_path):
+def get_image_dimensions(dbx, file_path):
+    from PIL import Image
     _, res = dbx.files_download(file_path)
     img = Image.open(BytesIO(res.content))
     return img.width, img.height
 
 # === Main: Scan and record designs ===
-print("Scanning designs from Dropbox...")
-image_files = list_image_files(TARGET_FOLDER)
-design_data = []
-
-for file in image_files:
-    try:
-        width, height = get_image_dimensions(file.path_lower)
-        aspect_ratio = round(width / height, 4)
-        design_data.append({
-            "Design Name": os.path.basename(file.path_display),
-            "Dropbox Path": file.path_display,
-            "Width": width,
-            "Height": height,
-            "Aspect Ratio": aspect_ratio
-        })
-    except Exception as e:
-        design_data.append({
-            "Design Name": os.path.basename(file.path_display),
-            "Dropbox Path": file.path_display,
-            "Error": str(e)
-        })
-
-# === Save to CSV ===
-df = pd.DataFrame(design_data)
-df.to_csv("design_dimensions.csv", index=False)
-print(" Done. File saved as 'design_dimensions.csv'")
+def main():
+    import pandas as pd
+    from PIL import Image
+    from utils.startup import load_env
+    from utils.dropbox_utils import get_dropbox_client
+
+    load_env()
+    # === Allow large images (disables DecompressionBombWarning) ===
+    Image.MAX_IMAGE_PIXELS = None
+    dbx = get_dropbox_client()
+
+    print("Scanning designs from Dropbox...")
+    image_files = list_image_files(dbx, os.getenv("TARGET_FOLDER"), _env_list("EXCLUDED_FOLDERS"),
+                                   _env_list("VALID_EXTENSIONS"))
+    design_data = []
+
+    for file in image_files:
+        try:
+            width, height = get_image_dimensions(dbx, file.path_lower)
+            aspect_ratio = round(width / height, 4)
+            design_data.append({
+                "Design Name": os.path.basename(file.path_display),
+                "Dropbox Path": file.path_display,
+                "Width": width,
+                "Height": height,
+                "Aspect Ratio": aspect_ratio
+            })
+        except Exception as e:
+            design_data.append({
+                "Design Name": os.path.basename(file.path_display),
+                "Dropbox Path": file.path_display,
+                "Error": str(e)
+            })
+
+    # === Save to CSV ===
+    df = pd.DataFrame(design_data)
+    df.to_csv("design_dimensions.csv", index=False)
+    print(" Done. File saved as 'design_dimensions.csv'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# utils/progress.py
+import os
+import time
+import threading
+from collections import deque, Counter
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+PROGRESS_LEVEL = os.getenv("SHOPIFY_PROGRESS_LEVEL", "info").lower()
+
+
+def level_enabled(level: str, threshold: str = None) -> bool:
+    return LEVELS.get(level, 20) >= LEVELS.get((threshold or PROGRESS_LEVEL).lower(), 20)
+
+
+class ProgressEvent(str):
+    """
+    A progress message that also carries structured fields.
+
+    It is a str, so plain `emit(msg)` callbacks keep working unchanged;
+    sinks that set `accepts_events = True` read stage / handle / data instead.
+    Stages: upload, product, request, sleep, bulk, build, log.
+    """
+
+    def __new__(cls, msg, stage: str = "log", level: str = "info", handle: str = None, **data):
+        ev = super().__new__(cls, msg)
+        ev.stage = stage
+        ev.level = level
+        ev.handle = handle
+        ev.data = data
+        ev.ts = time.time()
+        return ev
+
+
+def as_event(msg) -> ProgressEvent:
+    return msg if isinstance(msg, ProgressEvent) else ProgressEvent(str(msg))
+
+
+class ProgressAggregator:
+    """
+    Folds a stream of ProgressEvents into counters a UI can render cheaply:
+    products done / total, current handle, request and 429 counts, wire and
+    sleep seconds, recent log lines and every warning. Thread-safe.
+    """
+
+    def __init__(self, level: str = None, recent: int = 8):
+        self.level = (level or PROGRESS_LEVEL).lower()
+        self._lock = threading.Lock()
+        self.products_total = 0
+        self.products_done = 0
+        self.outcomes = Counter()
+        self.current = None
+        self.requests = 0
+        self.statuses = Counter()
+        self.wire_seconds = 0.0
+        self.sleep_seconds = 0.0
+        self.build_seconds = 0.0
+        self.build_wait_seconds = 0.0
+        self.recent = deque(maxlen=recent)
+        self.warnings = deque(maxlen=50)
+        self.started = time.perf_counter()
+
+    def add(self, msg):
+        ev = as_event(msg)
+        d = ev.data
+        with self._lock:
+            if ev.stage == "upload" and "products" in d:
+                self.products_total += int(d["products"])
+            elif ev.stage == "product":
+                if ev.handle:
+                    self.current = ev.handle
+                if d.get("outcome"):
+                    self.products_done += 1
+                    self.outcomes[d["outcome"]] += 1
+            elif ev.stage == "request" and "status" in d:
+                self.requests += 1
+                self.statuses[d["status"]] += 1
+                self.wire_seconds += float(d.get("seconds") or 0)
+            elif ev.stage == "sleep":
+                self.sleep_seconds += float(d.get("seconds") or 0)
+            elif ev.stage == "build":
+                self.build_seconds += float(d.get("build") or 0)
+                self.build_wait_seconds += float(d.get("wait") or 0)
+
+            if LEVELS.get(ev.level, 20) >= LEVELS["warning"]:
+                self.warnings.append(str(ev))
+            if level_enabled(ev.level, self.level):
+                self.recent.append(str(ev))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "products_total": self.products_total,
+                "products_done": self.products_done,
+                "outcomes": dict(self.outcomes),
+                "current": self.current,
+                "requests": self.requests,
+                "statuses": dict(self.statuses),
+                "wire_seconds": self.wire_seconds,
+                "sleep_seconds": self.sleep_seconds,
+                "build_seconds": self.build_seconds,
+                "build_wait_seconds": self.build_wait_seconds,
+                "recent": list(self.recent),
+                "warnings": list(self.warnings),
+                "elapsed": time.perf_counter() - self.started,
+            }
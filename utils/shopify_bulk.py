@@ -0,0 +1,316 @@
+# utils/shopify_bulk.py
+import os
+import json
+import time
+import tempfile
+
+import requests
+
+from utils.shopify_utils import (
+    ShopifyError,
+    TIMEOUT,
+    _graphql,
+    _prepare_payloads,
+    _checked_variants,
+    pending_variants,
+    upload_products_from_df,
+    _staged_upload,
+    _optimize_mockups,
+    _stage_optimized,
+    default_client,
+    _gid_num,
+    _fmt_secs,
+    _metric_key,
+    _sleep,
+    _say,
+)
+from utils.upload_ledger import get_default_ledger
+from utils.image_optimize import IMAGE_OPTIMIZE
+from utils.variant_quota import VariantQuota, get_default_quota
+
+BULK_POLL_INTERVAL = float(os.getenv("SHOPIFY_BULK_POLL_INTERVAL", "5"))
+BULK_POLL_TIMEOUT  = float(os.getenv("SHOPIFY_BULK_POLL_TIMEOUT", str(6 * 3600)))
+BULK_MAX_MB        = float(os.getenv("SHOPIFY_BULK_MAX_MB", "19"))  # Shopify caps the JSONL at 20 MB
+
+_PRODUCT_SET_M = """
+mutation call($input: ProductSetInput!) {
+  productSet(input: $input, synchronous: true) {
+    product { id handle title variants(first: 250) { nodes { id selectedOptions { name value } } } }
+    userErrors { field message }
+  }
+}
+"""
+
+_RUN_MUTATION_M = """
+mutation($mutation: String!, $path: String!) {
+  bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $path) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+_POLL_Q = """
+query($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount url partialDataUrl }
+  }
+}
+"""
+
+_DONE_STATES = {"COMPLETED", "FAILED", "CANCELED", "EXPIRED"}
+
+
+# ------------------ JSONL building ------------------
+
+def product_set_input(handle, payload, color_to_src, images, sources=None):
+    """
+    Translate a REST product payload (from _prepare_payloads) into a productSet input.
+    sources maps image URLs to the originalSource to send instead (staged optimized mockups).
+    """
+    sources = sources or {}
+    variants = payload["variants"]
+    sizes  = list(dict.fromkeys(v["option1"] for v in variants))
+    colors = list(dict.fromkeys(v["option2"] for v in variants))
+
+    src_alt = {img["src"]: img.get("alt") for img in images}
+    ordered = sorted(images, key=lambda img: 0 if img.get("position") == 1 else 1)
+    files = []
+    for img in ordered:
+        f = {"originalSource": sources.get(img["src"], img["src"]), "contentType": "IMAGE"}
+        if img.get("alt"):
+            f["alt"] = img["alt"]
+        files.append(f)
+
+    set_variants = []
+    for v in variants:
+        sv = {
+            "optionValues": [
+                {"optionName": "Size", "name": v["option1"]},
+                {"optionName": "Colour", "name": v["option2"]},
+            ],
+            "price": str(v["price"]),
+            "taxable": v["taxable"],
+            "inventoryItem": {"sku": str(v["sku"]), "requiresShipping": v["requires_shipping"]},
+        }
+        src = color_to_src.get(v["option2"])
+        if src:
+            sv["file"] = {"originalSource": sources.get(src, src), "contentType": "IMAGE"}
+            if src_alt.get(src):
+                sv["file"]["alt"] = src_alt[src]
+        set_variants.append(sv)
+
+    tags = [t.strip() for t in str(payload.get("tags") or "").split(",") if t.strip()]
+    return {
+        "handle": handle,
+        "title": payload["title"],
+        "descriptionHtml": payload["body_html"],
+        "vendor": payload["vendor"],
+        "productType": payload["product_type"],
+        "tags": tags,
+        "seo": {
+            "title": payload["metafields_global_title_tag"],
+            "description": payload["metafields_global_description_tag"],
+        },
+        "productOptions": [
+            {"name": "Size", "values": [{"name": s} for s in sizes]},
+            {"name": "Colour", "values": [{"name": c} for c in colors]},
+        ],
+        "files": files,
+        "variants": set_variants,
+    }
+
+
+def write_bulk_jsonl(df, out_dir, progress=None, skip_handles=(), client=None):
+    """
+    Write one productSet line per handle into JSONL files of at most BULK_MAX_MB.
+    With SHOPIFY_IMAGE_OPTIMIZE on and a client given, mockups are re-encoded
+    and staged to that store first, and the lines point at the staged copies.
+    Returns [(path, [handles in line order])].
+    """
+    limit = int(BULK_MAX_MB * 1024 * 1024)
+    parts = []
+    cur_f, cur_handles, cur_size = None, [], 0
+
+    def open_part():
+        path = os.path.join(out_dir, f"bulk_part{len(parts) + 1}.jsonl")
+        parts.append((path, []))
+        return open(path, "w", encoding="utf-8"), parts[-1][1]
+
+    skip = set(skip_handles)
+    preps = {h: p for h, p in _prepare_payloads(df).items() if h not in skip}
+    sources = {}
+    if IMAGE_OPTIMIZE and client is not None:
+        srcs = [img["src"] for p in preps.values() for img in p["images"]]
+        srcs += [s for p in preps.values() for s in p["color_to_src"].values()]
+        for src, optimized in _optimize_mockups(srcs, progress=progress).items():
+            staged = _stage_optimized(client, optimized, progress=progress)
+            if staged:
+                sources[src] = staged
+    for handle, prep in preps.items():
+        _checked_variants(handle, prep, progress)
+        line = json.dumps(
+            {"input": product_set_input(handle, prep["payload"], prep["color_to_src"], prep["images"], sources)},
+            ensure_ascii=False,
+        ) + "\n"
+        size = len(line.encode("utf-8"))
+        if cur_f is None or (cur_size + size > limit and cur_handles):
+            if cur_f is not None:
+                cur_f.close()
+            cur_f, cur_handles = open_part()
+            cur_size = 0
+        cur_f.write(line)
+        cur_handles.append(handle)
+        cur_size += size
+
+    if cur_f is not None:
+        cur_f.close()
+    return parts
+
+
+# ------------------ bulk operation lifecycle ------------------
+
+def run_bulk_mutation(client, jsonl_path, progress=None, mutation=_PRODUCT_SET_M):
+    """
+    Stage the JSONL, start bulkOperationRunMutation and poll until it finishes.
+    Each JSONL line holds the variables for one run of mutation (productSet by default).
+    """
+    target = _staged_upload(client, jsonl_path, os.path.basename(jsonl_path), "text/jsonl",
+                            "BULK_MUTATION_VARIABLES", progress=progress)
+    staged_path = next(p["value"] for p in target["parameters"] if p["name"] == "key")
+
+    data = _graphql(client, _RUN_MUTATION_M, {"mutation": mutation, "path": staged_path}, progress=progress)
+    res = data.get("bulkOperationRunMutation") or {}
+    if res.get("userErrors"):
+        raise ShopifyError(f"bulkOperationRunMutation failed: {res['userErrors']}")
+    op_id = res["bulkOperation"]["id"]
+    _say(progress, f"🏗️ Bulk operation started: {op_id}")
+    return poll_bulk_operation(client, op_id, progress=progress)
+
+
+def poll_bulk_operation(client, op_id, progress=None):
+    start = time.perf_counter()
+    last_status = None
+    while True:
+        op = (_graphql(client, _POLL_Q, {"id": op_id}, progress=progress).get("node") or {})
+        status = op.get("status")
+        if status != last_status:
+            _say(progress, f"🏗️ Bulk operation {status} ({op.get('objectCount') or 0} objects)",
+                 stage="bulk", status=status, objects=int(op.get("objectCount") or 0))
+            last_status = status
+        if status in _DONE_STATES:
+            if status != "COMPLETED" and not op.get("partialDataUrl"):
+                raise ShopifyError(f"Bulk operation {status}: {op.get('errorCode')}")
+            return op
+        if time.perf_counter() - start > BULK_POLL_TIMEOUT:
+            raise ShopifyError(f"Bulk operation {op_id} still {status} after {_fmt_secs(BULK_POLL_TIMEOUT)}")
+        _sleep(BULK_POLL_INTERVAL, "bulk_poll", _metric_key("POST", f"{client.api_base}/graphql.json"),
+               progress=progress, client=client)
+
+
+def iter_bulk_results(url):
+    """Stream the results JSONL; yields one parsed line at a time."""
+    if not url:
+        return
+    with requests.get(url, stream=True, timeout=TIMEOUT) as r:
+        r.raise_for_status()
+        for raw in r.iter_lines():
+            if raw:
+                yield json.loads(raw)
+
+
+# ------------------ public entrypoint ------------------
+
+def bulk_upload_from_df(df, progress=None, ledger=None, quota=None, client=None):
+    """
+    Create every product in df through Shopify Bulk Operations (productSet,
+    images and variant images in one server-side pass) instead of per-product
+    REST calls. Returns one result dict per handle, like upload_products_from_df;
+    products that don't fit the daily variant quota come back 'deferred (quota)'.
+    """
+    overall_start = time.perf_counter()
+    client = client or default_client()
+    if ledger is None:
+        ledger = get_default_ledger()
+    if quota is None:
+        quota = get_default_quota()
+    store = client.store
+
+    handles = list(dict.fromkeys(df["Handle"]))
+    seen_status = {h: (ledger.get_product(store, h) or {}).get("status") for h in handles} if ledger else {}
+    done = {h for h in handles if seen_status.get(h) == "done"}
+    created = {h for h in handles if seen_status.get(h) == "created"}
+    _say(progress, f"🏗️ Bulk upload: {len(handles)} handles ({len(done)} already uploaded, "
+                   f"{len(created)} to resume per ledger)", stage="upload",
+         products=len(handles) - len(created))   # the REST resume below announces its own
+
+    results = [{"handle_or_title": h, "status": "already uploaded"} for h in handles if h in done]
+
+    # Created but unfinished products exist in the store already: finish them over REST
+    # (images and variant links from the ledger) rather than sending a second productSet
+    if created:
+        results += upload_products_from_df(df[df["Handle"].isin(created)], progress=progress,
+                                           ledger=ledger, quota=quota, client=client)
+
+    pending = pending_variants(df, ledger=ledger, client=client)
+    deferred = []
+    if quota:
+        _, deferred = VariantQuota.pack(pending.items(), quota.remaining(store))
+        for h in deferred:
+            results.append({"handle_or_title": h, "status": "deferred (quota)", "variants": pending[h]})
+        if deferred:
+            _say(progress, f"⏸️ {len(deferred)} product(s) deferred until the daily variant quota frees up")
+
+    for r in results:
+        _say(progress, f"⏭️ {r['handle_or_title']}: {r['status']}", level="debug",
+             stage="product", handle=r["handle_or_title"], outcome=r["status"])
+
+    with tempfile.TemporaryDirectory(prefix="shopify_bulk_") as tmp:
+        parts = write_bulk_jsonl(df, tmp, progress=progress, skip_handles=done | created | set(deferred),
+                                 client=client)
+        for i, (path, part_handles) in enumerate(parts, start=1):
+            _say(progress, f"📦 Bulk part {i}/{len(parts)}: {len(part_handles)} products "
+                           f"({os.path.getsize(path)/1024:.1f} KB JSONL)")
+            op = run_bulk_mutation(client, path, progress=progress)
+            seen = set()
+            for line in iter_bulk_results(op.get("url") or op.get("partialDataUrl")):
+                idx = line.get("__lineNumber")
+                if idx is None or idx >= len(part_handles):
+                    continue
+                handle = part_handles[idx]
+                seen.add(handle)
+                payload = ((line.get("data") or {}).get("productSet") or {})
+                errors = payload.get("userErrors") or line.get("errors") or []
+                product = payload.get("product") or {}
+                product_id = _gid_num(product.get("id"))
+                if product_id and quota:
+                    quota.record(store, pending.get(handle, 0))
+                if product_id and ledger:
+                    variants = [{"id": _gid_num(v.get("id")),
+                                 "option2": next((o["value"] for o in v.get("selectedOptions") or []
+                                                  if o.get("name") == "Colour"), None)}
+                                for v in (product.get("variants") or {}).get("nodes") or []]
+                    ledger.record_created(store, handle, product_id, title=product.get("title"), variants=variants)
+                    if not errors:
+                        ledger.mark_done(store, handle)
+                status = "created" if product_id and not errors else "failed"
+                _say(progress, f"{'✅' if status == 'created' else '❌'} {handle}", level="debug",
+                     stage="product", handle=handle, outcome=status)
+                results.append({
+                    "handle_or_title": product.get("handle") or handle,
+                    "product_id": product_id,
+                    "admin_url": f"https://{store}/admin/products/{product_id}" if product_id else None,
+                    "status": status,
+                    "errors": [e.get("message", str(e)) if isinstance(e, dict) else str(e) for e in errors],
+                })
+            for handle in part_handles:
+                if handle not in seen:
+                    _say(progress, f"❌ {handle}: no bulk result", level="warning",
+                         stage="product", handle=handle, outcome="failed")
+                    results.append({"handle_or_title": handle, "status": "failed",
+                                    "errors": ["No result line returned by bulk operation"]})
+
+    failed = sum(1 for r in results if r["status"] == "failed")
+    _say(progress, f"⏱ Bulk upload finished in {_fmt_secs(time.perf_counter() - overall_start)} "
+                   f"({len(results) - failed - len(deferred)} ok, {failed} failed, {len(deferred)} deferred)")
+    return results
@@ -1,12 +1,26 @@
 # utils/shopify_utils.py
 import os
+import copy
 import time
 import random
 import requests
-import base64
+import hashlib
 import urllib.parse
 import re
+import uuid
+import json as _json
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from queue import Queue, Empty
+
+import pandas as pd
+
+from utils.upload_ledger import get_default_ledger
+from utils.variant_quota import get_default_quota
+from utils.progress import ProgressEvent, level_enabled
+from utils.text_derive import meta_description
+from utils.image_optimize import IMAGE_OPTIMIZE
 
 SHOPIFY_API_VERSION = os.getenv("SHOPIFY_API_VERSION", "2024-10")
 
@@ -18,6 +32,9 @@ CREATE_COOLDOWN      = float(os.getenv("SHOPIFY_PRODUCT_CREATE_COOLDOWN", "1.0")
 IMAGE_UPLOAD_SLEEP   = float(os.getenv("SHOPIFY_IMAGE_UPLOAD_SLEEP", "0"))
 ATTACHMENT_FALLBACK  = os.getenv("SHOPIFY_IMAGE_ATTACHMENT_FALLBACK", "true").lower() in ("1","true","yes")
 AFTER_EACH_DELAY     = float(os.getenv("SHOPIFY_AFTER_EACH_DELAY", "0"))
+PREFLIGHT_CHUNK      = int(os.getenv("SHOPIFY_PREFLIGHT_CHUNK", "50"))
+UPLOAD_CHUNK_BYTES   = int(os.getenv("SHOPIFY_UPLOAD_CHUNK_KB", "256")) * 1024
+IMAGE_CACHE_DIR      = os.getenv("SHOPIFY_IMAGE_CACHE_DIR", os.path.join(".state", "image_cache"))
 
 # Controls for title/SEO fallbacks if CSV columns aren't present:
 TITLE_STRIP_AFTER_PIPE = os.getenv("SHOPIFY_TITLE_STRIP_AFTER_PIPE", "true").lower() in ("1","true","yes")
@@ -26,46 +43,27 @@ META_DESC_MAX          = int(os.getenv("SHOPIFY_META_DESC_MAX", "300"))
 class ShopifyError(Exception):
     pass
 
-_session = requests.Session()  # keep-alive
-
 # ------------------ small text helpers ------------------
 
 def _norm(s):
     return (s or "").strip()
 
-def _strip_html(s: str) -> str:
-    s = re.sub(r"<[^>]+>", " ", s or "")
-    return re.sub(r"\s+", " ", s).strip()
-
 def _split_title_for_seo(title: str):
     title = (title or "").strip()
     clean = title.split("|", 1)[0].strip()
     return clean, title  # (clean_title, long_title)
 
 def _make_meta_description_from_html(body_html: str, fallback_title: str) -> str:
-    text = _strip_html(body_html) or (fallback_title or "")
-    if len(text) > META_DESC_MAX:
-        text = text[:META_DESC_MAX-1].rstrip() + "…"
-    return text
+    return meta_description(body_html, fallback_title, META_DESC_MAX)
 
-def _first_nonempty(series):
-    try:
-        for v in series:
-            if v:
-                return str(v)
-    except Exception:
-        pass
-    return None
-
-def _pick_image_src_per_color(group_df):
-    if "Image Src" not in group_df.columns:
-        return {}
-    mapping = {}
-    for color, sub in group_df.groupby("Option2 Value"):
-        src = _first_nonempty(sub["Image Src"])
-        if src:
-            mapping[_norm(color)] = src
-    return mapping
+def _is_blank(v):
+    return v is None or (isinstance(v, float) and v != v) or not str(v).strip()
+
+def _text_col(df, col):
+    """Column as stripped strings ('' for missing column / NaN)."""
+    if col not in df.columns:
+        return pd.Series("", index=df.index)
+    return df[col].fillna("").astype(str).str.strip()
 
 def _fmt_secs(sec: float) -> str:
     if sec < 60:
@@ -78,239 +76,784 @@ def _fmt_secs(sec: float) -> str:
 
 # ------------------ public entrypoint ------------------
 
-def upload_products_from_df(df, progress=None, variant_budget=None):
+def upload_products_from_df(df, progress=None, variant_budget=None, ledger=None, quota=None, client=None):
     """
     Upload products defined in the CSV-style DataFrame.
     If 'SEO Title' and/or 'SEO Description' columns exist in df,
     we'll use them to set Shopify's SEO fields on create.
-    Optional variant_budget caps total variants across all products.
+    Optional variant_budget caps total variants across all products; the
+    daily variant quota (default: SHOPIFY_DAILY_VARIANT_QUOTA) caps it further.
+    Only whole products are created — one that doesn't fit the remaining
+    budget comes back with status 'deferred (quota)' instead of being cut short.
+    Progress is recorded in the upload ledger (default: SHOPIFY_UPLOAD_LEDGER),
+    so reruns skip finished handles and continue partially uploaded ones.
+    `client` is the target store (default: the SHOPIFY_STORE_URL profile).
+    With SHOPIFY_IMAGE_OPTIMIZE on, mockups uploaded after create are
+    re-encoded (utils.image_optimize) and sent as staged uploads.
     """
     overall_start = time.perf_counter()
 
+    client = client or default_client()
+    if ledger is None:
+        ledger = get_default_ledger()
+    if quota is None:
+        quota = get_default_quota()
+    store = client.store
+
     _say(progress, "✅ Shopify upload started")
     _say(progress, f"📦 Total rows in DataFrame: {len(df)}")
-    _say(progress, f"🔑 Unique product handles: {df['Handle'].nunique()}")
+    _say(progress, f"🔑 Unique product handles: {df['Handle'].nunique()}",
+         stage="upload", products=df["Handle"].nunique())
 
     results = []
-    grouped = df.groupby("Handle", sort=False)
+    preps = _prepare_payloads(df)
+
+    optimized = {}
+    if IMAGE_OPTIMIZE and not INLINE_IMAGES:
+        srcs = [s for h, prep in preps.items()
+                if not ledger or (ledger.get_product(store, h) or {}).get("status") != "done"
+                for s in prep["color_to_src"].values()]
+        optimized = _optimize_mockups(srcs, progress=progress)
 
     remaining_budget = None if variant_budget in (None, 0) else int(variant_budget)
+    if quota:
+        left = quota.remaining(store)
+        _say(progress, f"📊 Daily variant quota: {quota.describe(store)}")
+        remaining_budget = left if remaining_budget is None else min(remaining_budget, left)
+
+    for handle, prep in preps.items():
+        entry = ledger.get_product(store, handle) if ledger else None
+        if entry and entry["status"] == "done":
+            _say(progress, f"⏭️ Already uploaded (ledger): {handle} → ID {entry['product_id']}",
+                 stage="product", handle=handle, outcome="already uploaded")
+            results.append(_ledger_result(store, entry, "already uploaded", ledger))
+            continue
 
-    for handle, group in grouped:
-        raw_title = group.iloc[0]["Title"]
-        ptype     = group.iloc[0]["Type"]
+        ptype = prep["payload"]["product_type"]
 
-        # stats
-        sizes_raw  = group["Option1 Value"].dropna().astype(str).tolist()
-        colors_raw = group["Option2 Value"].dropna().astype(str).tolist()
-        sizes  = sorted(set(s.strip() for s in sizes_raw if s.strip()), key=str)
-        colors = sorted(set(c.strip() for c in colors_raw if c.strip()), key=str)
+        # Whole products only — a resumed product already spent its variants
+        if remaining_budget is not None and not entry and len(prep["variants"]) > remaining_budget:
+            _say(progress, f"⏸️ Deferred {handle}: {len(prep['variants'])} variants, "
+                           f"{max(remaining_budget, 0)} left in today's budget",
+                 stage="product", handle=handle, outcome="deferred (quota)")
+            results.append({"handle_or_title": handle, "status": "deferred (quota)",
+                            "variants": len(prep["variants"])})
+            continue
 
-        _say(progress, "────────────────────────────────────────────────────────")
-        _say(progress, f"🚀 Creating product for handle: {handle} with {len(group)} rows")
-        _say(progress, f"🧩 Variants to send (pre-sanitize): {len(group)} (sizes≈{len(sizes)}, colors≈{len(colors)})")
+        _say(progress, "────────────────────────────────────────────────────────", level="debug")
+        _say(progress, f"🚀 Creating product for handle: {handle} with {prep['rows']} rows",
+             stage="product", handle=handle)
+        _say(progress, f"🧩 Variants to send (pre-sanitize): {prep['rows']} (sizes≈{prep['sizes']}, colors≈{prep['colors']})",
+             level="debug")
 
         t0 = time.perf_counter()
 
-        # --- sanitize variants
-        variants = []
-        seen = set()
-        dropped_missing = 0
-        dropped_dupe = 0
-
-        for _, row in group.iterrows():
-            size  = _norm(row.get("Option1 Value"))
-            color = _norm(row.get("Option2 Value"))
-            if not size or not color:
-                dropped_missing += 1
-                continue
-            key = (size.lower(), color.lower())
-            if key in seen:
-                dropped_dupe += 1
-                continue
-            seen.add(key)
-            variants.append({
-                "price": row.get("Variant Price", "0"),
-                "sku": row["Variant SKU"],
-                "inventory_quantity": int(row.get("Variant Inventory Qty", 0)),
-                "requires_shipping": bool(row.get("Variant Requires Shipping", True)),
-                "taxable": bool(row.get("Variant Taxable", True)),
-                "option1": size,
-                "option2": color,
-            })
-
-        if dropped_missing:
-            _say(progress, f"⚠️ Dropped {dropped_missing} rows with missing Size/Colour.")
-        if dropped_dupe:
-            _say(progress, f"ℹ️ Skipped {dropped_dupe} duplicate (Size,Colour) combos.")
-
-        if not variants:
-            raise ShopifyError(
-                f"No valid variants to send for handle={handle}. "
-                f"(Check Option1/Option2 values in your DataFrame.)"
-            )
-
-        # Apply variant budget (if any)
-        if remaining_budget is not None:
-            if remaining_budget <= 0:
-                _say(progress, "⏭️ Variant budget exhausted — skipping remaining products.")
-                break
-            if len(variants) > remaining_budget:
-                _say(progress, f"🔪 Capping variants from {len(variants)} → {remaining_budget} due to budget")
-                variants = variants[:remaining_budget]
-            remaining_budget -= len(variants)
-
-        _say(progress, f"🧩 Variants to send (final): {len(variants)} (unique combos)")
-
-        # --- image inline mapping (optional)
-        color_to_src = _pick_image_src_per_color(group)
-        inline_images = []
-        if INLINE_IMAGES and color_to_src:
-            seen_src = set()
-            for color, src in color_to_src.items():
-                if not src or src in seen_src:
-                    continue
-                img = {"src": src}
-                try:
-                    pos = int(group.loc[group["Image Src"] == src, "Image Position"].dropna().astype(int).min())
-                    if pos == 1:
-                        img["position"] = 1
-                except Exception:
-                    pass
-                alt = _first_nonempty(group.loc[group["Image Src"] == src, "Image Alt Text"])
-                if alt:
-                    img["alt"] = alt
-                inline_images.append(img)
-                seen_src.add(src)
-
-        # --- titles & SEO
-        # Prefer CSV-provided SEO fields if available
-        csv_seo_title = group.iloc[0].get("SEO Title")
-        csv_seo_desc  = group.iloc[0].get("SEO Description")
-
-        clean_title, long_title = _split_title_for_seo(raw_title)
-        seo_title = csv_seo_title if _norm(csv_seo_title) else long_title
-        seo_desc  = csv_seo_desc  if _norm(csv_seo_desc)  else _make_meta_description_from_html(
-            group.iloc[0]["Body (HTML)"], long_title
-        )
+        variants = _checked_variants(handle, prep, progress)
 
-        # If the CSV already supplied a stripped Title, use as-is; otherwise strip after pipe if flag enabled
-        title_to_use = raw_title
-        if TITLE_STRIP_AFTER_PIPE:
-            title_to_use = clean_title
-
-        # --- Build payload
-        product_payload = {
-            "title": title_to_use,
-            "body_html": group.iloc[0]["Body (HTML)"],
-            "vendor": group.iloc[0]["Vendor"],
-            "product_type": ptype,
-            "tags": group.iloc[0]["Tags"],
-            "options": [{"name": "Size"}, {"name": "Colour"}],
-            "variants": variants,
-            "metafields_global_title_tag": seo_title,
-            "metafields_global_description_tag": seo_desc,
-        }
-        if INLINE_IMAGES and inline_images:
-            product_payload["images"] = inline_images
+        if remaining_budget is not None and not entry:
+            remaining_budget -= len(variants)
 
-        # --- Create product
-        product_data = _create_product(product_payload, progress=progress)
+        _say(progress, f"🧩 Variants to send (final): {len(variants)} (unique combos)", level="debug")
+
+        color_to_src = prep["color_to_src"]
+        product_payload = dict(prep["payload"], variants=variants)
+        if INLINE_IMAGES and prep["images"]:
+            product_payload["images"] = prep["images"]
+
+        # --- Create product (or resume the one the ledger already knows about)
+        if entry:
+            product_data = {
+                "id": entry["product_id"],
+                "title": entry.get("title"),
+                "handle": handle,
+                "variants": entry["variants"],
+                "images": [],
+            }
+            _say(progress, f"♻️ Resuming product from ledger: {handle} (ID: {entry['product_id']})")
+        else:
+            try:
+                product_data = _create_product(client, product_payload, progress=progress)
+            except ShopifyError as e:
+                if quota and str(e).startswith("DAILY_VARIANT_LIMIT:"):
+                    quota.mark_exhausted(store)
+                raise
+            if quota:
+                quota.record(store, len(product_data.get("variants") or variants))
+            if ledger:
+                ledger.record_created(store, handle, product_data["id"],
+                                      title=product_data.get("title"),
+                                      variants=product_data.get("variants", []))
+            _say(progress, f"✅ Created product: {product_data.get('title')} (ID: {product_data['id']})")
         product_id = product_data["id"]
-        _say(progress, f"✅ Created product: {product_data.get('title')} (ID: {product_id})")
 
         # --- Upload images after create if not inlined
-        src_to_image_id = {}
+        src_to_image_id = dict(ledger.images(store, handle)) if ledger else {}
         if not INLINE_IMAGES and color_to_src:
-            _say(progress, "⏳ Uploading images after create…")
+            _say(progress, "⏳ Uploading images after create…", level="debug")
             for src in list(dict.fromkeys(color_to_src.values())):
-                if not src:
+                if not src or src in src_to_image_id:
                     continue
-                img = _upload_image(product_id, src, progress=progress)
+                img = _upload_image(client, product_id, src, progress=progress, optimized=optimized.get(src))
                 src_to_image_id[src] = img["id"]
+                if ledger:
+                    ledger.record_image(store, handle, src, img["id"])
         else:
             for img in product_data.get("images", []):
                 if img.get("src"):
                     src_to_image_id[img["src"]] = img["id"]
+                    if ledger:
+                        ledger.record_image(store, handle, img["src"], img["id"])
 
         # --- Link variant images by color
+        link_failures = 0
         if src_to_image_id and color_to_src:
             color_to_image_id = { _norm(c): src_to_image_id.get(s)
                                   for c, s in color_to_src.items()
                                   if src_to_image_id.get(s) }
+            already_linked = ledger.linked_variants(store, handle) if ledger else set()
             linked = defaultdict(int)
             for v in product_data.get("variants", []):
                 color = _norm(v.get("option2"))
                 if not color:
                     continue
                 img_id = color_to_image_id.get(color)
-                if not img_id:
+                if not img_id or v["id"] in already_linked:
                     continue
                 try:
-                    _update_variant_image(v["id"], img_id, progress=progress)
+                    _update_variant_image(client, v["id"], img_id, progress=progress)
                     linked[color] += 1
+                    if ledger:
+                        ledger.record_link(store, handle, v["id"], img_id)
                 except ShopifyError as e:
-                    _say(progress, f"⚠️ Link failed for {color}: {e}")
+                    link_failures += 1
+                    _say(progress, f"⚠️ Link failed for {color}: {e}", level="warning", handle=handle)
 
             for color, count in linked.items():
-                _say(progress, f"✅ Linked {count} variants to image for {ptype}|{color}")
+                _say(progress, f"✅ Linked {count} variants to image for {ptype}|{color}", level="debug")
+
+        # Failed links keep the product 'created' so the next run retries only those
+        if ledger and not link_failures:
+            ledger.mark_done(store, handle)
 
         dt = time.perf_counter() - t0
-        _say(progress, f"⏱ Product finished in {_fmt_secs(dt)}")
+        _say(progress, f"⏱ Product finished in {_fmt_secs(dt)}", stage="product", handle=handle,
+             outcome="resumed" if entry else "created", seconds=dt)
 
         results.append({
             "handle_or_title": product_data.get("handle") or product_data.get("title"),
             "product_id": product_id,
             "created_variants": len(product_data.get("variants", [])),
-            "created_images": len(product_data.get("images", [])),
-            "admin_url": f"https://{os.getenv('SHOPIFY_STORE_URL')}/admin/products/{product_id}"
+            "created_images": len(product_data.get("images", [])) or len(src_to_image_id),
+            "admin_url": f"https://{store}/admin/products/{product_id}",
+            "status": "resumed" if entry else "created",
         })
 
-        if CREATE_COOLDOWN > 0:
-            time.sleep(CREATE_COOLDOWN)
+        if CREATE_COOLDOWN > 0 and not entry:
+            _sleep(CREATE_COOLDOWN, "create_cooldown", _metric_key("POST", f"{client.api_base}/products.json"),
+                   progress=progress, client=client)
+
+    deferred = [r for r in results if r["status"] == "deferred (quota)"]
+    if deferred:
+        _say(progress, f"⏸️ {len(deferred)} product(s) deferred until the daily variant quota frees up "
+                       f"({sum(r['variants'] for r in deferred)} variants)")
 
     total = time.perf_counter() - overall_start
     _say(progress, f"⏱ All products in this design uploaded in {_fmt_secs(total)}")
     return results
 
-# ------------------ low-level HTTP ------------------
+def pending_variants(df, ledger=None, client=None):
+    """
+    {handle: variants still to create} for handles the ledger hasn't seen,
+    i.e. what uploading df to client's store would spend from the daily variant quota.
+    """
+    if ledger is None:
+        ledger = get_default_ledger()
+    store = (client or default_client()).store
+    out = {}
+    for handle, prep in _prepare_payloads(df).items():
+        if ledger and ledger.get_product(store, handle):
+            continue
+        out[handle] = len(prep["variants"])
+    return out
+
+def _prepare_payloads(df):
+    """
+    Build REST product payloads for every handle in df in one columnar pass:
+    one duplicate scan for (handle, size, colour), one grouped aggregation
+    for image src / position / alt, one first-row lookup for titles & SEO.
+    Returns {handle: {"payload", "variants", "color_to_src", "images", "rows",
+    "sizes", "colors", "dropped_missing", "dropped_dupe"}} in first-seen order.
+    """
+    df = df[df["Handle"].notna()]
+    handles = df["Handle"]
+    size  = _text_col(df, "Option1 Value")
+    color = _text_col(df, "Option2 Value")
+
+    # --- sanitize variants: drop missing Size/Colour, keep first of each (handle, size, colour)
+    missing = (size == "") | (color == "")
+    dupe = pd.DataFrame({"h": handles, "s": size.str.lower(), "c": color.str.lower()}).duplicated() & ~missing
+    keep = ~missing & ~dupe
+
+    kept = df[keep]
+    n_kept = len(kept)
+    def col(name, default):
+        return kept[name].tolist() if name in kept.columns else [default] * n_kept
+    prices = col("Variant Price", "0")
+    skus   = kept["Variant SKU"].tolist()
+    qtys   = kept["Variant Inventory Qty"].astype(int).tolist() if "Variant Inventory Qty" in kept.columns else [0] * n_kept
+    ships  = kept["Variant Requires Shipping"].astype(bool).tolist() if "Variant Requires Shipping" in kept.columns else [True] * n_kept
+    taxes  = kept["Variant Taxable"].astype(bool).tolist() if "Variant Taxable" in kept.columns else [True] * n_kept
+
+    variants_by_handle = defaultdict(list)
+    for h, sz, cl, pr, sku, q, sh, tx in zip(kept["Handle"].tolist(), size[keep].tolist(), color[keep].tolist(),
+                                             prices, skus, qtys, ships, taxes):
+        variants_by_handle[h].append({
+            "price": pr,
+            "sku": sku,
+            "inventory_quantity": q,
+            "requires_shipping": sh,
+            "taxable": tx,
+            "option1": sz,
+            "option2": cl,
+        })
+
+    rows_by_handle   = handles.value_counts(sort=False).to_dict()
+    missing_by       = missing.groupby(handles, sort=False).sum().to_dict()
+    dupe_by          = dupe.groupby(handles, sort=False).sum().to_dict()
+    sizes_by         = size[size != ""].groupby(handles[size != ""], sort=False).nunique().to_dict()
+    colors_by        = color[color != ""].groupby(handles[color != ""], sort=False).nunique().to_dict()
+
+    # --- images: first non-empty src per (handle, colour), then position/alt per (handle, src)
+    color_to_src = defaultdict(dict)
+    src_meta = {}
+    if "Image Src" in df.columns:
+        src = _text_col(df, "Image Src")
+        has = (src != "") & df["Option2 Value"].notna()
+        im = pd.DataFrame({
+            "h": handles[has],
+            "color": df.loc[has, "Option2 Value"].astype(str),
+            "src": src[has],
+            "pos": pd.to_numeric(df.loc[has, "Image Position"], errors="coerce") if "Image Position" in df.columns else float("nan"),
+            "alt": _text_col(df, "Image Alt Text")[has].replace("", float("nan")),
+        })
+        firsts = im.drop_duplicates(["h", "color"]).sort_values("color", kind="stable")
+        for h, c, sr in zip(firsts["h"].tolist(), firsts["color"].tolist(), firsts["src"].tolist()):
+            color_to_src[h][_norm(c)] = sr
+        agg = im.groupby(["h", "src"], sort=False).agg(pos=("pos", "min"), alt=("alt", "first"))
+        for (h, sr), pos, alt in zip(agg.index.tolist(), agg["pos"].tolist(), agg["alt"].tolist()):
+            src_meta[(h, sr)] = (pos, alt)
+
+    # --- titles & SEO from each handle's first row
+    firsts = df.drop_duplicates("Handle")
+    has_seo_title = "SEO Title" in firsts.columns
+    has_seo_desc  = "SEO Description" in firsts.columns
+
+    out = {}
+    for row in firsts.to_dict("records"):
+        handle = row["Handle"]
+        raw_title = row["Title"]
+
+        images = []
+        seen_src = set()
+        for sr in color_to_src.get(handle, {}).values():
+            if sr in seen_src:
+                continue
+            img = {"src": sr}
+            pos, alt = src_meta.get((handle, sr), (None, None))
+            if pos == 1:
+                img["position"] = 1
+            if not _is_blank(alt):
+                img["alt"] = str(alt)
+            images.append(img)
+            seen_src.add(sr)
+
+        # Prefer CSV-provided SEO fields if available
+        csv_seo_title = row.get("SEO Title") if has_seo_title else None
+        csv_seo_desc  = row.get("SEO Description") if has_seo_desc else None
+
+        clean_title, long_title = _split_title_for_seo(raw_title)
+        seo_title = csv_seo_title if not _is_blank(csv_seo_title) else long_title
+        seo_desc  = csv_seo_desc  if not _is_blank(csv_seo_desc)  else _make_meta_description_from_html(
+            row["Body (HTML)"], long_title
+        )
+
+        # If the CSV already supplied a stripped Title, use as-is; otherwise strip after pipe if flag enabled
+        title_to_use = raw_title
+        if TITLE_STRIP_AFTER_PIPE:
+            title_to_use = clean_title
 
-def _api_base():
-    store = os.getenv("SHOPIFY_STORE_URL", "").strip().replace("https://", "").replace("http://", "")
-    _require(store, "SHOPIFY_STORE_URL is not set")
-    return f"https://{store}/admin/api/{SHOPIFY_API_VERSION}"
+        variants = variants_by_handle.get(handle, [])
+        out[handle] = {
+            "payload": {
+                "title": title_to_use,
+                "body_html": row["Body (HTML)"],
+                "vendor": row["Vendor"],
+                "product_type": row["Type"],
+                "tags": row["Tags"],
+                "options": [{"name": "Size"}, {"name": "Colour"}],
+                "variants": variants,
+                "metafields_global_title_tag": seo_title,
+                "metafields_global_description_tag": seo_desc,
+            },
+            "variants": variants,
+            "color_to_src": color_to_src.get(handle, {}),
+            "images": images,
+            "rows": int(rows_by_handle.get(handle, 0)),
+            "sizes": int(sizes_by.get(handle, 0)),
+            "colors": int(colors_by.get(handle, 0)),
+            "dropped_missing": int(missing_by.get(handle, 0)),
+            "dropped_dupe": int(dupe_by.get(handle, 0)),
+        }
+    return out
+
+def _checked_variants(handle, prep, progress=None):
+    """Report what sanitizing dropped for one handle; raise if nothing is left to send."""
+    if prep["dropped_missing"]:
+        _say(progress, f"⚠️ Dropped {prep['dropped_missing']} rows with missing Size/Colour.",
+             level="warning", handle=handle)
+    if prep["dropped_dupe"]:
+        _say(progress, f"ℹ️ Skipped {prep['dropped_dupe']} duplicate (Size,Colour) combos.", handle=handle)
+    if not prep["variants"]:
+        raise ShopifyError(
+            f"No valid variants to send for handle={handle}. "
+            f"(Check Option1/Option2 values in your DataFrame.)"
+        )
+    return prep["variants"]
+
+# ------------------ pre-flight existence check ------------------
+
+_PREFLIGHT_HANDLES_Q = """
+query($q: String!, $after: String) {
+  products(first: 250, after: $after, query: $q) {
+    nodes { id handle }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+_PREFLIGHT_SKUS_Q = """
+query($q: String!, $after: String) {
+  productVariants(first: 250, after: $after, query: $q) {
+    nodes { sku product { id handle } }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+def preflight_existing(df, progress=None, ledger=None, chunk_size=None, client=None):
+    """
+    Resolve every Handle and Variant SKU in df against the store with a few
+    batched GraphQL searches (chunk_size terms per query, paginated).
+    Returns {"handles": {handle: product_gid}, "skus": {sku: store_handle},
+             "conflicting_handles": [df handles that clash]}.
+    Handles the upload ledger already owns are ignored — those are resumes, not duplicates.
+    """
+    chunk_size = chunk_size or PREFLIGHT_CHUNK
+    client = client or default_client()
+    store = client.store
+
+    owned_handles, owned_ids = set(), set()
+    if ledger is None:
+        ledger = get_default_ledger()
+    handles = [h for h in dict.fromkeys(df["Handle"].dropna().astype(str)) if h]
+    if ledger:
+        for h in handles:
+            entry = ledger.get_product(store, h)
+            if entry:
+                owned_handles.add(h)
+                owned_ids.add(int(entry["product_id"]))
+
+    check_handles = [h for h in handles if h not in owned_handles]
+    sku_rows = df.loc[~df["Handle"].isin(owned_handles), ["Handle", "Variant SKU"]].dropna()
+    sku_to_handle = dict(zip(sku_rows["Variant SKU"].astype(str).str.strip(), sku_rows["Handle"]))
+    skus = [k for k in sku_to_handle if k]
+
+    t0 = time.perf_counter()
+    found_handles = {}
+    for chunk in _chunks(check_handles, chunk_size):
+        q = " OR ".join(f"handle:{_search_quote(h)}" for h in chunk)
+        wanted = set(chunk)
+        for node in _graphql_paginate(client, _PREFLIGHT_HANDLES_Q, {"q": q}, ("products",), progress=progress):
+            if node.get("handle") in wanted and _gid_num(node["id"]) not in owned_ids:
+                found_handles[node["handle"]] = node["id"]
+
+    found_skus = {}
+    for chunk in _chunks(skus, chunk_size):
+        q = " OR ".join(f"sku:{_search_quote(k)}" for k in chunk)
+        wanted = set(chunk)
+        for node in _graphql_paginate(client, _PREFLIGHT_SKUS_Q, {"q": q}, ("productVariants",), progress=progress):
+            sku = (node.get("sku") or "").strip()
+            product = node.get("product") or {}
+            if sku in wanted and _gid_num(product.get("id")) not in owned_ids:
+                found_skus[sku] = product.get("handle")
+
+    conflicting = set(found_handles) | {sku_to_handle[k] for k in found_skus}
+    conflicting = [h for h in handles if h in conflicting]
+    _say(progress, f"🔍 Pre-flight: {len(check_handles)} handles, {len(skus)} SKUs checked in "
+                   f"{_fmt_secs(time.perf_counter() - t0)} — {len(found_handles)} handle(s), "
+                   f"{len(found_skus)} SKU(s) already in store")
+    return {"handles": found_handles, "skus": found_skus, "conflicting_handles": conflicting}
+
+def drop_conflicts(df, report):
+    """Return df without the handles flagged in a preflight_existing report."""
+    bad = set(report.get("conflicting_handles") or [])
+    if not bad:
+        return df
+    return df[~df["Handle"].isin(bad)].reset_index(drop=True)
+
+def _chunks(items, size):
+    for i in range(0, len(items), max(1, size)):
+        yield items[i:i + size]
+
+def _search_quote(term):
+    return '"' + str(term).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _gid_num(gid):
+    try:
+        return int(str(gid).rsplit("/", 1)[-1])
+    except (TypeError, ValueError):
+        return None
 
-def _headers():
-    token = os.getenv("SHOPIFY_API_PASSWORD") or os.getenv("SHOPIFY_ADMIN_API_ACCESS_TOKEN")
-    _require(token, "SHOPIFY_API_PASSWORD (Admin API access token) is not set")
+def _ledger_result(store, entry, status, ledger):
+    product_id = entry["product_id"]
     return {
-        "X-Shopify-Access-Token": token,
-        "Content-Type": "application/json",
-        "Accept": "application/json",
+        "handle_or_title": entry["handle"] or entry.get("title"),
+        "product_id": product_id,
+        "created_variants": len(entry["variants"]),
+        "created_images": len(ledger.images(store, entry["handle"])),
+        "admin_url": f"https://{store}/admin/products/{product_id}",
+        "status": status,
     }
 
-def _post(url, json, progress=None):
+# ------------------ telemetry ------------------
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class HttpMetrics:
+    """
+    Per-endpoint HTTP counters for the Shopify client.
+    Wire time (request → response) and sleep time (Retry-After, backoff,
+    call-limit throttle, fixed delays) are kept apart so a run shows where
+    the wall-clock time went. Keys are (host, method, endpoint template).
+    A run gets its own instance via ShopifyClient.for_run(); METRICS is the
+    process-wide total every request is booked in as well.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+        self.started = time.time()
+
+    def _entry(self, key):
+        e = self._data.get(key)
+        if e is None:
+            e = self._data[key] = {
+                "requests": 0, "status": defaultdict(int), "throttled_429": 0,
+                "retries": 0, "errors": 0, "wire_seconds": 0.0, "wire_max": 0.0,
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                "sleep": defaultdict(lambda: {"count": 0, "seconds": 0.0}),
+            }
+        return e
+
+    def observe_request(self, key, status, seconds):
+        with self._lock:
+            e = self._entry(key)
+            e["requests"] += 1
+            e["status"][str(status)] += 1
+            if status == 429:
+                e["throttled_429"] += 1
+            if status == "error":
+                e["errors"] += 1
+            e["wire_seconds"] += seconds
+            e["wire_max"] = max(e["wire_max"], seconds)
+            i = next((i for i, b in enumerate(LATENCY_BUCKETS) if seconds <= b), len(LATENCY_BUCKETS))
+            e["buckets"][i] += 1
+
+    def observe_retry(self, key):
+        with self._lock:
+            self._entry(key)["retries"] += 1
+
+    def observe_sleep(self, key, reason, seconds):
+        with self._lock:
+            slot = self._entry(key)["sleep"][reason]
+            slot["count"] += 1
+            slot["seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            endpoints = []
+            for (host, method, endpoint), e in sorted(self._data.items()):
+                sleep = {r: dict(v) for r, v in e["sleep"].items()}
+                endpoints.append({
+                    "host": host, "method": method, "endpoint": endpoint,
+                    "requests": e["requests"], "status": dict(e["status"]),
+                    "throttled_429": e["throttled_429"], "retries": e["retries"], "errors": e["errors"],
+                    "wire_seconds": round(e["wire_seconds"], 3), "wire_max": round(e["wire_max"], 3),
+                    "wire_avg": round(e["wire_seconds"] / e["requests"], 3) if e["requests"] else 0.0,
+                    "sleep_seconds": round(sum(v["seconds"] for v in sleep.values()), 3),
+                    "sleep": sleep,
+                    "latency_buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], e["buckets"])),
+                })
+        return {"started": self.started, "elapsed": round(time.time() - self.started, 3), "endpoints": endpoints}
+
+    def to_json(self) -> str:
+        return _json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        lines = [
+            "# HELP shopify_http_requests_total Shopify HTTP responses by status (status=\"error\" for timeouts).",
+            "# TYPE shopify_http_requests_total counter",
+        ]
+        def lbl(ep, **extra):
+            pairs = {"host": ep["host"], "method": ep["method"], "endpoint": ep["endpoint"], **extra}
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs.items()) + "}"
+        for ep in snap["endpoints"]:
+            for status, n in ep["status"].items():
+                lines.append(f"shopify_http_requests_total{lbl(ep, status=status)} {n}")
+        lines += ["# HELP shopify_http_retries_total Retried Shopify HTTP attempts.",
+                  "# TYPE shopify_http_retries_total counter"]
+        lines += [f"shopify_http_retries_total{lbl(ep)} {ep['retries']}" for ep in snap["endpoints"]]
+        lines += ["# HELP shopify_http_request_duration_seconds Wire time per Shopify request.",
+                  "# TYPE shopify_http_request_duration_seconds histogram"]
+        for ep in snap["endpoints"]:
+            cum = 0
+            for le, n in ep["latency_buckets"].items():
+                cum += n
+                lines.append(f"shopify_http_request_duration_seconds_bucket{lbl(ep, le=le)} {cum}")
+            lines.append(f"shopify_http_request_duration_seconds_sum{lbl(ep)} {ep['wire_seconds']}")
+            lines.append(f"shopify_http_request_duration_seconds_count{lbl(ep)} {ep['requests']}")
+        lines += ["# HELP shopify_http_sleep_seconds_total Time spent sleeping before/after Shopify requests.",
+                  "# TYPE shopify_http_sleep_seconds_total counter"]
+        for ep in snap["endpoints"]:
+            for reason, v in ep["sleep"].items():
+                lines.append(f"shopify_http_sleep_seconds_total{lbl(ep, reason=reason)} {round(v['seconds'], 3)}")
+        lines += ["# HELP shopify_http_sleeps_total Number of sleeps by reason.",
+                  "# TYPE shopify_http_sleeps_total counter"]
+        for ep in snap["endpoints"]:
+            for reason, v in ep["sleep"].items():
+                lines.append(f"shopify_http_sleeps_total{lbl(ep, reason=reason)} {v['count']}")
+        return "\n".join(lines) + "\n"
+
+METRICS = HttpMetrics()   # cumulative for the process (Prometheus scrapes); never reset
+
+def _metrics(client) -> tuple:
+    """Where a request to this client is booked: METRICS, plus the run's own HttpMetrics if it has one."""
+    run = getattr(client, "metrics", None)
+    return (METRICS,) if run is None else (METRICS, run)
+
+def _metric_key(method, url):
+    """(host, METHOD, endpoint) with numeric ids templated, e.g. /products/{id}/images.json."""
+    parsed = urllib.parse.urlparse(url or "")
+    path = re.sub(r"^/admin/api/[^/]+", "", parsed.path)
+    path = re.sub(r"/\d+(?=/|\.json|$)", "/{id}", path)
+    if not parsed.path.startswith("/admin/"):
+        path = "staged-upload"
+    return (parsed.netloc, method, path)
+
+def _sleep(delay, reason, key=None, progress=None, client=None):
+    """time.sleep that books the wait against an endpoint in the client's metrics (and the progress stream)."""
+    if delay <= 0:
+        return
+    time.sleep(delay)
+    if key is not None:
+        for m in _metrics(client):
+            m.observe_sleep(key, reason, delay)
+    _say(progress, f"💤 Slept {delay:.1f}s ({reason})", level="debug", stage="sleep",
+         reason=reason, seconds=delay)
+
+# ------------------ store clients ------------------
+
+class CallLimiter:
+    """
+    REST call-limit pacing for one store. Once X-Shopify-Shop-Api-Call-Limit
+    reports the bucket 75% full, the next request to that store (from any
+    thread) waits until it has drained to half at ~2 calls/s.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._not_before = 0.0
+
+    def observe(self, resp, progress=None):
+        hdr = resp.headers.get("X-Shopify-Shop-Api-Call-Limit")
+        if not hdr:
+            return
+        try:
+            used, cap = hdr.split("/")
+            used = int(used.strip()); cap = int(cap.strip())
+        except ValueError:
+            return
+        if cap > 0 and used >= int(0.75 * cap):
+            target_used = int(0.50 * cap)
+            delta = max(0, used - target_used)
+            sleep_sec = max(0.5, delta / 2.0)  # ~2 tokens/sec
+            _say(progress, f"🕒 Throttling for call limit {used}/{cap}. Sleeping {sleep_sec:.1f}s…", level="debug")
+            with self._lock:
+                self._not_before = max(self._not_before, time.monotonic() + sleep_sec)
+
+    def wait(self, key=None, progress=None, client=None):
+        with self._lock:
+            delay = self._not_before - time.monotonic()
+        _sleep(delay, "call_limit", key, progress=progress, client=client)
+
+
+class ShopifyClient:
+    """
+    One target store: Admin API base URL, access token, its own keep-alive
+    session and call-limit pacing. Upload, pre-flight and bulk functions take
+    a client, so several stores can be driven at once from separate threads
+    without touching the process environment.
+    """
+
+    def __init__(self, store_url: str, token: str, name: str = None, api_version: str = None):
+        raw = (store_url or "").strip()
+        self.store = raw.replace("https://", "").replace("http://", "")
+        self.token = (token or "").strip()
+        self.name = name or self.store
+        # An explicit http:// store URL (local stand-in) keeps plain HTTP; everything else is https
+        self.scheme = "http" if raw.startswith("http://") else "https"
+        self.api_version = api_version or SHOPIFY_API_VERSION
+        self.session = requests.Session()
+        self.limiter = CallLimiter()
+        self.metrics = None   # HttpMetrics of one run, see for_run()
+
+    def __repr__(self):
+        return f"ShopifyClient({self.name!r})"
+
+    def for_run(self, metrics: HttpMetrics = None) -> "ShopifyClient":
+        """
+        This client with its own HttpMetrics (or `metrics`, shared by the
+        stores of one fan-out) for a single upload run. Session and
+        call-limit budget stay shared with every other run on the store.
+        """
+        run = copy.copy(self)
+        run.metrics = metrics or HttpMetrics()
+        return run
+
+    @property
+    def api_base(self) -> str:
+        _require(self.store, "SHOPIFY_STORE_URL is not set")
+        return f"{self.scheme}://{self.store}/admin/api/{self.api_version}"
+
+    @property
+    def headers(self) -> dict:
+        _require(self.token, "SHOPIFY_API_PASSWORD (Admin API access token) is not set")
+        return {
+            "X-Shopify-Access-Token": self.token,
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def client_for(store_url: str, token: str, name: str = None) -> ShopifyClient:
+    """
+    The process-wide client for a store + token, so every session, job and
+    thread targeting that store shares one connection pool and call-limit budget.
+    """
+    key = ((store_url or "").strip(), (token or "").strip())
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = ShopifyClient(*key, name=name)
+        return client
+
+def default_client() -> ShopifyClient:
+    """Client for SHOPIFY_STORE_URL / SHOPIFY_API_PASSWORD (CLI, workers and callers that pass none)."""
+    return client_for(os.getenv("SHOPIFY_STORE_URL", ""),
+                      os.getenv("SHOPIFY_API_PASSWORD") or os.getenv("SHOPIFY_ADMIN_API_ACCESS_TOKEN") or "")
+
+class _QueueRelay:
+    """Progress callback for a store thread: events go to a queue the calling thread drains."""
+    accepts_events = True
+
+    def __init__(self, queue, client):
+        self.queue, self.client = queue, client
+
+    def __call__(self, ev):
+        self.queue.put((self.client, ev))
+
+def for_each_store(clients, fn, progress_for=None, poll: float = 0.2) -> dict:
+    """
+    Run fn(client, progress) for every client at once, one thread per store,
+    so each store's rate budget is spent in parallel instead of back to back.
+    Progress from the store threads is handed to progress_for(client) on the
+    calling thread (safe for Streamlit). Returns {client.name: fn's result,
+    or the exception that stopped that store}.
+    """
+    clients = list(clients)
+    events = Queue()
+
+    def drain():
+        while True:
+            try:
+                client, ev = events.get_nowait()
+            except Empty:
+                return
+            _say(progress_for(client), ev, level=ev.level, stage=ev.stage, handle=ev.handle, **ev.data)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(clients)), thread_name_prefix="shopify-store") as pool:
+        futures = {pool.submit(fn, c, _QueueRelay(events, c) if progress_for else None): c for c in clients}
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=poll)
+            if progress_for:
+                drain()
+    out = {}
+    for fut, c in futures.items():
+        try:
+            out[c.name] = fut.result()
+        except Exception as e:
+            out[c.name] = e
+    return out
+
+def upload_to_stores(df, clients, progress_for=None, **kwargs) -> dict:
+    """
+    upload_products_from_df(df) to several stores concurrently (see
+    for_each_store); kwargs go to every upload. Returns {client.name:
+    results, or the exception that stopped that store}.
+    """
+    return for_each_store(
+        clients, lambda c, progress: upload_products_from_df(df, progress=progress, client=c, **kwargs), progress_for)
+
+# ------------------ low-level HTTP ------------------
+
+def _post(client, url, json, progress=None):
+    key = _metric_key("POST", url)
     consecutive_429 = 0
     for attempt in range(1, MAX_RETRIES + 1):
+        if attempt > 1:
+            for m in _metrics(client):
+                m.observe_retry(key)
+        client.limiter.wait(key, progress, client)
+        t_req = time.perf_counter()
         try:
-            _say(progress, f"📡 POST {url}")
+            _say(progress, f"📡 POST {url}", level="debug")
             if isinstance(json, dict) and "product" in json:
                 title = json["product"].get("title")
                 if title:
-                    _say(progress, f"📤 Payload (title): {title}")
+                    _say(progress, f"📤 Payload (title): {title}", level="debug")
 
-            r = _session.post(url, headers=_headers(), json=json, timeout=TIMEOUT)
-            _say(progress, f"📥 Response status: {r.status_code}")
+            r = client.session.post(url, headers=client.headers, json=json, timeout=TIMEOUT)
+            dt = time.perf_counter() - t_req
+            for m in _metrics(client):
+                m.observe_request(key, r.status_code, dt)
+            _say(progress, f"📥 Response status: {r.status_code}", level="debug", stage="request",
+                 method="POST", endpoint=key[2], status=r.status_code, seconds=dt)
 
             if r.status_code == 429:
                 txt = (r.text or "").lower()
                 if "daily variant creation limit" in txt:
                     raise ShopifyError("DAILY_VARIANT_LIMIT: " + r.text)
                 ra = r.headers.get("Retry-After")
+                reason = "backoff"
                 if ra:
                     try:
                         delay = float(ra)
-                        _say(progress, f"⏳ Rate limited (429). Retry-After={delay:.1f}s")
+                        reason = "retry_after"
+                        _say(progress, f"⏳ Rate limited (429). Retry-After={delay:.1f}s", level="debug")
                     except Exception:
                         delay = _exp_backoff(attempt, progress)
                 else:
@@ -319,125 +862,338 @@ def _post(url, json, progress=None):
                     if consecutive_429 >= 5: delay = max(delay, 45.0)
                     if consecutive_429 >= 6: delay = max(delay, 75.0)
                 consecutive_429 += 1
-                time.sleep(delay)
+                _sleep(delay, reason, key, progress=progress, client=client)
                 continue
 
             if 200 <= r.status_code < 300:
                 consecutive_429 = 0
-                _respect_call_limit(r, progress)
-                _small_after_delay(progress)
-                _say(progress, "✅ POST successful")
+                client.limiter.observe(r, progress)
+                _small_after_delay(progress, key, client=client)
+                _say(progress, "✅ POST successful", level="debug")
                 return r.json()
 
             if r.status_code >= 500:
                 delay = _exp_backoff(attempt, progress)
-                time.sleep(delay)
+                _sleep(delay, "backoff", key, progress=progress, client=client)
                 continue
 
             raise ShopifyError(f"POST {url} failed: {r.status_code} {r.text}")
 
         except (requests.Timeout, requests.ConnectionError) as e:
-            _say(progress, f"⏳ POST timeout/conn error (attempt {attempt}/{MAX_RETRIES}): {e}")
+            dt = time.perf_counter() - t_req
+            for m in _metrics(client):
+                m.observe_request(key, "error", dt)
+            _say(progress, f"⏳ POST timeout/conn error (attempt {attempt}/{MAX_RETRIES}): {e}", level="warning",
+                 stage="request", method="POST", endpoint=key[2], status="error", seconds=dt)
             delay = _exp_backoff(attempt, progress)
-            time.sleep(delay)
+            _sleep(delay, "backoff", key, progress=progress, client=client)
             continue
         except requests.RequestException as e:
             raise ShopifyError(f"POST {url} error: {e}")
 
     raise ShopifyError(f"POST {url} exhausted retries")
 
-def _put(url, json, progress=None):
+def _put(client, url, json, progress=None):
+    key = _metric_key("PUT", url)
     for attempt in range(1, MAX_RETRIES + 1):
+        if attempt > 1:
+            for m in _metrics(client):
+                m.observe_retry(key)
+        client.limiter.wait(key, progress, client)
+        t_req = time.perf_counter()
         try:
-            _say(progress, f"📡 PUT {url}")
-            r = _session.put(url, headers=_headers(), json=json, timeout=TIMEOUT)
+            _say(progress, f"📡 PUT {url}", level="debug")
+            r = client.session.put(url, headers=client.headers, json=json, timeout=TIMEOUT)
+            dt = time.perf_counter() - t_req
+            for m in _metrics(client):
+                m.observe_request(key, r.status_code, dt)
+            _say(progress, f"📥 Response status: {r.status_code}", level="debug", stage="request",
+                 method="PUT", endpoint=key[2], status=r.status_code, seconds=dt)
 
             if r.status_code == 429:
+                reason = "retry_after" if r.headers.get("Retry-After") else "backoff"
                 delay = _retry_after_or_backoff(r, attempt, progress)
-                time.sleep(delay)
+                _sleep(delay, reason, key, progress=progress, client=client)
                 continue
 
-            _say(progress, f"📥 Response status: {r.status_code}")
-
             if 200 <= r.status_code < 300:
-                _respect_call_limit(r, progress)
-                _small_after_delay(progress)
-                _say(progress, "✅ PUT successful")
+                client.limiter.observe(r, progress)
+                _small_after_delay(progress, key, client=client)
+                _say(progress, "✅ PUT successful", level="debug")
                 return r.json()
 
             if r.status_code >= 500:
                 delay = _exp_backoff(attempt, progress)
-                time.sleep(delay)
+                _sleep(delay, "backoff", key, progress=progress, client=client)
                 continue
 
             raise ShopifyError(f"PUT {url} failed: {r.status_code} {r.text}")
 
         except (requests.Timeout, requests.ConnectionError) as e:
-            _say(progress, f"⏳ PUT timeout/conn error (attempt {attempt}/{MAX_RETRIES}): {e}")
+            dt = time.perf_counter() - t_req
+            for m in _metrics(client):
+                m.observe_request(key, "error", dt)
+            _say(progress, f"⏳ PUT timeout/conn error (attempt {attempt}/{MAX_RETRIES}): {e}", level="warning",
+                 stage="request", method="PUT", endpoint=key[2], status="error", seconds=dt)
             delay = _exp_backoff(attempt, progress)
-            time.sleep(delay)
+            _sleep(delay, "backoff", key, progress=progress, client=client)
             continue
         except requests.RequestException as e:
             raise ShopifyError(f"PUT {url} error: {e}")
 
     raise ShopifyError(f"PUT {url} exhausted retries")
 
-def _create_product(product_payload, progress=None):
-    url = f"{_api_base()}/products.json"
-    return _post(url, {"product": product_payload}, progress=progress)["product"]
+def _graphql(client, query, variables=None, progress=None):
+    """POST a GraphQL Admin query; retries THROTTLED responses, raises ShopifyError on other errors."""
+    url = f"{client.api_base}/graphql.json"
+    for attempt in range(1, MAX_RETRIES + 1):
+        body = _post(client, url, {"query": query, "variables": variables or {}}, progress=progress)
+        errors = body.get("errors")
+        if not errors:
+            return body.get("data") or {}
+        codes = {((e or {}).get("extensions") or {}).get("code") for e in errors if isinstance(e, dict)}
+        if "THROTTLED" in codes:
+            delay = _graphql_throttle_delay(body, attempt, progress)
+            _sleep(delay, "graphql_throttle", _metric_key("POST", url), progress=progress, client=client)
+            continue
+        raise ShopifyError(f"GraphQL error: {errors}")
+    raise ShopifyError("GraphQL request exhausted retries (THROTTLED)")
+
+def _graphql_paginate(client, query, variables, path, progress=None):
+    """Yield nodes from a connection at data[path...], following pageInfo.endCursor."""
+    after = None
+    while True:
+        data = _graphql(client, query, dict(variables, after=after), progress=progress)
+        conn = data
+        for key in path:
+            conn = (conn or {}).get(key) or {}
+        for node in conn.get("nodes") or []:
+            yield node
+        page = conn.get("pageInfo") or {}
+        if not page.get("hasNextPage"):
+            return
+        after = page.get("endCursor")
+
+# ------------------ staged uploads ------------------
+
+_STAGED_UPLOADS_M = """
+mutation($input: [StagedUploadInput!]!) {
+  stagedUploadsCreate(input: $input) {
+    stagedTargets { url resourceUrl parameters { name value } }
+    userErrors { field message }
+  }
+}
+"""
+
+class _MultipartFileStream:
+    """
+    File-like multipart/form-data body that reads the file in chunks.
+    Having __len__ lets requests send a Content-Length instead of chunked encoding.
+    """
 
-def _download_image_bytes(src_url, progress=None):
+    def __init__(self, fields, file_path, filename, mime_type):
+        self.boundary = "----skugen" + uuid.uuid4().hex
+        head = b"".join(
+            (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{f["name"]}"\r\n\r\n'
+             f'{f["value"]}\r\n').encode("utf-8")
+            for f in fields
+        )
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; '
+                 f'filename="{filename}"\r\nContent-Type: {mime_type}\r\n\r\n').encode("utf-8")
+        self._parts = [head, None, f"\r\n--{self.boundary}--\r\n".encode("utf-8")]
+        self._file_path = file_path
+        self._file = None
+        self._idx = 0
+        self._pos = 0
+        self._len = len(head) + os.path.getsize(file_path) + len(self._parts[2])
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._len
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._len
+        size = min(size, UPLOAD_CHUNK_BYTES)
+        while self._idx < 3:
+            if self._idx == 1:
+                if self._file is None:
+                    self._file = open(self._file_path, "rb")
+                chunk = self._file.read(size)
+                if chunk:
+                    return chunk
+                self._file.close()
+            else:
+                part = self._parts[self._idx]
+                if self._pos < len(part):
+                    chunk = part[self._pos:self._pos + size]
+                    self._pos += len(chunk)
+                    return chunk
+            self._idx += 1
+            self._pos = 0
+        return b""
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+def _stream_multipart_post(client, url, fields, file_path, filename, mime_type, progress=None):
+    """POST file_path as multipart form data without loading it into memory; retried like _post."""
+    key = _metric_key("POST", url)
+    for attempt in range(1, MAX_RETRIES + 1):
+        if attempt > 1:
+            for m in _metrics(client):
+                m.observe_retry(key)
+        body = _MultipartFileStream(fields, file_path, filename, mime_type)
+        t_req = time.perf_counter()
+        try:
+            _say(progress, f"📡 Staged upload {filename} ({len(body)/1024:.1f} KB)", level="debug")
+            r = client.session.post(url, data=body, headers={"Content-Type": body.content_type}, timeout=TIMEOUT)
+            dt = time.perf_counter() - t_req
+            for m in _metrics(client):
+                m.observe_request(key, r.status_code, dt)
+            _say(progress, f"📥 Staged upload status: {r.status_code}", level="debug", stage="request",
+                 method="POST", endpoint=key[2], status=r.status_code, seconds=dt)
+            if 200 <= r.status_code < 300:
+                return r
+            if r.status_code == 429 or r.status_code >= 500:
+                _sleep(_retry_after_or_backoff(r, attempt, progress), "backoff", key,
+                       progress=progress, client=client)
+                continue
+            raise ShopifyError(f"Staged upload failed: {r.status_code} {r.text[:500]}")
+        except (requests.Timeout, requests.ConnectionError) as e:
+            dt = time.perf_counter() - t_req
+            for m in _metrics(client):
+                m.observe_request(key, "error", dt)
+            _say(progress, f"⏳ Staged upload timeout/conn error (attempt {attempt}/{MAX_RETRIES}): {e}",
+                 level="warning", stage="request", method="POST", endpoint=key[2], status="error", seconds=dt)
+            _sleep(_exp_backoff(attempt, progress), "backoff", key, progress=progress, client=client)
+            continue
+        except requests.RequestException as e:
+            raise ShopifyError(f"Staged upload error: {e}")
+        finally:
+            body.close()
+    raise ShopifyError("Staged upload exhausted retries")
+
+def _staged_upload(client, file_path, filename, mime_type, resource, progress=None):
+    """
+    Create a staged upload target for `resource` (e.g. BULK_MUTATION_VARIABLES, IMAGE)
+    and stream file_path into it. Returns the target {url, resourceUrl, parameters}.
+    """
+    target_input = {"resource": resource, "filename": filename, "mimeType": mime_type, "httpMethod": "POST"}
+    if resource != "BULK_MUTATION_VARIABLES":
+        target_input["fileSize"] = str(os.path.getsize(file_path))
+    data = _graphql(client, _STAGED_UPLOADS_M, {"input": [target_input]}, progress=progress)
+    res = data.get("stagedUploadsCreate") or {}
+    if res.get("userErrors"):
+        raise ShopifyError(f"stagedUploadsCreate failed: {res['userErrors']}")
+    target = res["stagedTargets"][0]
+    _stream_multipart_post(client, target["url"], target["parameters"], file_path, filename, mime_type,
+                           progress=progress)
+    return target
+
+def _create_product(client, product_payload, progress=None):
+    url = f"{client.api_base}/products.json"
+    return _post(client, url, {"product": product_payload}, progress=progress)["product"]
+
+_EXT_MIME = {".png": "image/png", ".webp": "image/webp", ".gif": "image/gif",
+             ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+
+def _download_image_to_cache(src_url, progress=None):
+    """
+    Stream src_url to disk (keyed by URL hash) in UPLOAD_CHUNK_BYTES pieces.
+    Returns (path, filename, mime_type); a cached file is reused without refetching.
+    """
+    name = os.path.basename(urllib.parse.urlparse(src_url).path) or "image"
+    root, ext = os.path.splitext(name)
+    key = hashlib.sha256(src_url.encode("utf-8")).hexdigest()
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+
+    candidates = [ext.lower()] if ext.lower() in _EXT_MIME else list(_EXT_MIME)
+    for cext in candidates:
+        cached = os.path.join(IMAGE_CACHE_DIR, key + cext)
+        if os.path.exists(cached):
+            _say(progress, f"💾 Using cached origin image ({os.path.getsize(cached)/1024:.1f} KB)", level="debug")
+            return cached, (name if ext else root + cext), _EXT_MIME[cext]
+
+    tmp = os.path.join(IMAGE_CACHE_DIR, f"{key}.{uuid.uuid4().hex}.part")
     try:
-        r = requests.get(src_url, timeout=TIMEOUT, stream=True)
-        r.raise_for_status()
-        data = r.content
-        path = urllib.parse.urlparse(src_url).path
-        name = os.path.basename(path) or "image"
-        root, ext = os.path.splitext(name)
-        if not ext:
-            ctype = r.headers.get("Content-Type", "")
-            if "png" in ctype: ext = ".png"
-            elif "webp" in ctype: ext = ".webp"
-            else: ext = ".jpg"
-            name = root + ext
-        _say(progress, f"⬇️ Downloaded {len(data)/1024:.1f} KB from origin")
-        return data, name
+        with requests.get(src_url, timeout=TIMEOUT, stream=True) as r:
+            r.raise_for_status()
+            if ext.lower() not in _EXT_MIME:
+                ctype = r.headers.get("Content-Type", "")
+                if "png" in ctype: ext = ".png"
+                elif "webp" in ctype: ext = ".webp"
+                else: ext = ".jpg"
+                name = root + ext
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(chunk_size=UPLOAD_CHUNK_BYTES):
+                    if chunk:
+                        f.write(chunk)
+        path = os.path.join(IMAGE_CACHE_DIR, key + ext.lower())
+        os.replace(tmp, path)
+        _say(progress, f"⬇️ Downloaded {os.path.getsize(path)/1024:.1f} KB from origin", level="debug")
+        return path, name, _EXT_MIME[ext.lower()]
     except Exception as ex:
-        raise ShopifyError(f"Failed to fetch image bytes from {src_url}: {ex}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise ShopifyError(f"Failed to fetch image from {src_url}: {ex}")
+
+def _optimize_mockups(srcs, progress=None) -> dict:
+    """image_optimize.optimize_sources with origins fetched through the image cache."""
+    from utils.image_optimize import optimize_sources
+    return optimize_sources(srcs, lambda src: _download_image_to_cache(src, progress=progress), progress=progress)
+
+def _stage_optimized(client, optimized, progress=None):
+    """Staged resourceUrl for an optimized mockup (path, filename, mime), or None when staging fails."""
+    path, filename, mime = optimized
+    try:
+        return _staged_upload(client, path, filename, mime, "IMAGE", progress=progress)["resourceUrl"]
+    except ShopifyError as e:
+        _say(progress, f"⚠️ Staged upload of {filename} failed, using the original URL: {e}", level="warning")
+        return None
 
-def _upload_image(product_id, src_url, position=None, alt=None, progress=None):
-    url = f"{_api_base()}/products/{product_id}/images.json"
+def _upload_image(client, product_id, src_url, position=None, alt=None, progress=None, optimized=None):
+    url = f"{client.api_base}/products/{product_id}/images.json"
     payload = {"image": {"src": src_url}}
     if position is not None:
         payload["image"]["position"] = position
     if alt:
         payload["image"]["alt"] = alt
 
+    if optimized:
+        staged = _stage_optimized(client, optimized, progress=progress)
+        if staged:
+            try:
+                img = _post(client, url, dict(payload, image=dict(payload["image"], src=staged)), progress=progress)["image"]
+                _sleep(IMAGE_UPLOAD_SLEEP, "image_upload_sleep", _metric_key("POST", url),
+                       progress=progress, client=client)
+                return img
+            except ShopifyError as e:
+                _say(progress, f"⚠️ Optimized image rejected, sending the original: {e}", level="warning")
+
     try:
-        img = _post(url, payload, progress=progress)["image"]
-        if IMAGE_UPLOAD_SLEEP > 0:
-            time.sleep(IMAGE_UPLOAD_SLEEP)
+        img = _post(client, url, payload, progress=progress)["image"]
+        _sleep(IMAGE_UPLOAD_SLEEP, "image_upload_sleep", _metric_key("POST", url), progress=progress, client=client)
         return img
     except ShopifyError as e:
         msg = str(e)
         if ATTACHMENT_FALLBACK and ("Could not download image" in msg or "422" in msg):
-            _say(progress, "🛟 Fallback: uploading image as attachment (base64)…")
-            data, filename = _download_image_bytes(src_url, progress=progress)
-            attach = base64.b64encode(data).decode("ascii")
-            payload2 = {"image": {"attachment": attach, "filename": filename}}
-            if position is not None:
-                payload2["image"]["position"] = position
-            if alt:
-                payload2["image"]["alt"] = alt
-            img = _post(url, payload2, progress=progress)["image"]
-            if IMAGE_UPLOAD_SLEEP > 0:
-                time.sleep(IMAGE_UPLOAD_SLEEP)
+            _say(progress, "🛟 Fallback: streaming image through a staged upload…")
+            path, filename, mime = _download_image_to_cache(src_url, progress=progress)
+            target = _staged_upload(client, path, filename, mime, "IMAGE", progress=progress)
+            payload["image"]["src"] = target["resourceUrl"]
+            img = _post(client, url, payload, progress=progress)["image"]
+            _sleep(IMAGE_UPLOAD_SLEEP, "image_upload_sleep", _metric_key("POST", url), progress=progress, client=client)
             return img
         raise
 
-def _update_variant_image(variant_id, image_id, progress=None):
-    url = f"{_api_base()}/variants/{variant_id}.json"
-    return _put(url, {"variant": {"id": variant_id, "image_id": image_id}}, progress=progress)["variant"]
+def _update_variant_image(client, variant_id, image_id, progress=None):
+    url = f"{client.api_base}/variants/{variant_id}.json"
+    return _put(client, url, {"variant": {"id": variant_id, "image_id": image_id}}, progress=progress)["variant"]
 
 # ------------------ rate limiting helpers ------------------
 
@@ -446,44 +1202,47 @@ def _retry_after_or_backoff(resp, attempt, progress=None):
     if ra:
         try:
             delay = float(ra)
-            _say(progress, f"⏳ Rate limited (429). Respecting Retry-After: {delay:.1f}s")
+            _say(progress, f"⏳ Rate limited (429). Respecting Retry-After: {delay:.1f}s", level="debug")
             return delay
         except Exception:
             pass
     return _exp_backoff(attempt, progress)
 
+def _graphql_throttle_delay(body, attempt, progress=None):
+    try:
+        cost = body["extensions"]["cost"]
+        status = cost["throttleStatus"]
+        need = float(cost.get("requestedQueryCost") or 0) - float(status["currentlyAvailable"])
+        delay = max(0.5, need / float(status["restoreRate"]))
+        _say(progress, f"🕒 GraphQL throttled. Waiting {delay:.1f}s for cost bucket…", level="debug")
+        return delay
+    except Exception:
+        return _exp_backoff(attempt, progress)
+
 def _exp_backoff(attempt, progress=None):
     delay = (BACKOFF_BASE ** (attempt - 1)) + random.uniform(0.0, 0.6)
-    _say(progress, f"⏳ Backing off {delay:.1f}s before retry…")
+    _say(progress, f"⏳ Backing off {delay:.1f}s before retry…", level="debug")
     return delay
 
-def _respect_call_limit(resp, progress=None):
-    hdr = resp.headers.get("X-Shopify-Shop-Api-Call-Limit")
-    if not hdr:
-        return
-    try:
-        used, cap = hdr.split("/")
-        used = int(used.strip()); cap = int(cap.strip())
-        if cap > 0 and used >= int(0.75 * cap):
-            target_used = int(0.50 * cap)
-            delta = max(0, used - target_used)
-            sleep_sec = max(0.5, delta / 2.0)  # ~2 tokens/sec
-            _say(progress, f"🕒 Throttling for call limit {used}/{cap}. Sleeping {sleep_sec:.1f}s…")
-            time.sleep(sleep_sec)
-    except Exception:
-        pass
-
-def _small_after_delay(progress=None):
+def _small_after_delay(progress=None, key=None, client=None):
     if AFTER_EACH_DELAY > 0:
-        time.sleep(AFTER_EACH_DELAY)
+        _sleep(AFTER_EACH_DELAY, "after_each_delay", key, progress=progress, client=client)
 
 def _require(val, msg):
     if not val:
         raise ShopifyError(msg)
 
-def _say(cb, msg):
+def _say(cb, msg, level="info", stage="log", handle=None, **data):
+    """
+    Emit one progress event. Plain callbacks only see events at or above
+    SHOPIFY_PROGRESS_LEVEL; sinks with accepts_events=True get all of them
+    (to keep counters) and decide what to show.
+    """
+    ev = ProgressEvent(msg, stage=stage, level=level, handle=handle, **data)
     if cb:
-        try: cb(str(msg))
+        if not getattr(cb, "accepts_events", False) and not level_enabled(level):
+            return
+        try: cb(ev)
         except Exception: pass
-    else:
-        print(msg)
+    elif level_enabled(level):
+        print(ev)
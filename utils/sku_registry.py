@@ -0,0 +1,211 @@
+# utils/sku_registry.py
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+REGISTRY_PATH   = os.getenv("SKU_REGISTRY_PATH", os.path.join(".state", "sku_registry.sqlite3"))
+REFRESH_SECS    = float(os.getenv("SKU_REGISTRY_REFRESH_SECS", "60"))   # min gap between sheet reads
+FLUSH_BATCH     = int(os.getenv("SKU_REGISTRY_FLUSH_BATCH", "25"))      # pending rows that trigger a write
+FLUSH_SECS      = float(os.getenv("SKU_REGISTRY_FLUSH_SECS", "30"))     # ...or age of the oldest pending row
+CLAIM_SECS      = float(os.getenv("SKU_REGISTRY_CLAIM_SECS", "300"))    # a flush claim older than this was lost
+
+# suffixes.synced: 1 on the sheet, 0 queued, 2 claimed by a flush in progress
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS suffixes (
+    suffix      TEXT PRIMARY KEY,
+    lister      TEXT,
+    reserved_at TEXT,
+    synced      INTEGER NOT NULL DEFAULT 1,
+    queued_at   REAL
+);
+CREATE INDEX IF NOT EXISTS suffixes_pending ON suffixes (synced, queued_at);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key         TEXT PRIMARY KEY,
+    value       REAL NOT NULL
+);
+"""
+
+
+def norm_suffix(suffix: str) -> str:
+    return (suffix or "").strip().upper()
+
+
+class SkuRegistry:
+    """
+    Local copy of the "SKU Tracker" sheet (suffix, lister, timestamp) with a
+    unique index on suffix, so guard checks are a primary-key lookup instead
+    of downloading the sheet.
+
+    refresh() reads only rows appended since the last read (at most once per
+    SKU_REGISTRY_REFRESH_SECS). reserve() claims a suffix locally and queues
+    it; flush() writes every queued row to the sheet with one append_rows
+    call. Queued rows live in SQLite, so a crash before the flush only delays
+    them until the next one. A flush claims its rows in one transaction
+    before writing, so concurrent flushes (sessions, worker processes) never
+    append the same reservation twice.
+    """
+
+    def __init__(self, sheet_factory, path: str = None):
+        self.sheet_factory = sheet_factory   # () -> gspread Worksheet, called only when the sheet is needed
+        self.path = path or REGISTRY_PATH
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _exec(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _state(self, key: str, default: float = 0.0) -> float:
+        rows = self._exec("SELECT value FROM sync_state WHERE key=?", (key,))
+        return rows[0]["value"] if rows else default
+
+    def _set_state(self, key: str, value: float):
+        self._exec("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+    # ---------- sheet → local ----------
+
+    def _import(self, rows) -> int:
+        new = 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows:
+                    suffix = norm_suffix(row[0] if row else "")
+                    if not suffix:
+                        continue
+                    cur = self._conn.execute(
+                        "INSERT OR IGNORE INTO suffixes (suffix, lister, reserved_at, synced) VALUES (?, ?, ?, 1)",
+                        (suffix, row[1] if len(row) > 1 else None, row[2] if len(row) > 2 else None),
+                    )
+                    new += cur.rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return new
+
+    def refresh(self, force: bool = False, full: bool = False) -> int:
+        """
+        Pull sheet rows into the registry; returns how many suffixes were new.
+        Incremental (rows after the last one seen) unless full=True or the
+        registry has never synced. Skipped inside the refresh interval unless forced.
+        """
+        now = time.time()
+        if not (force or full) and now - self._state("refreshed_at") < REFRESH_SECS:
+            return 0
+        sheet = self.sheet_factory()
+        seen = int(self._state("sheet_rows"))
+        if full or not seen:
+            rows = sheet.get_all_values()[1:]
+            with self._lock:
+                self._conn.execute("DELETE FROM suffixes WHERE synced=1")
+            new = self._import(rows)
+            seen = len(rows)
+        else:
+            rows = sheet.get(f"A{seen + 2}:C")
+            new = self._import(rows)
+            seen += len(rows)
+        self._set_state("sheet_rows", seen)
+        self._set_state("refreshed_at", now)
+        return new
+
+    # ---------- guard / reserve ----------
+
+    def is_used(self, suffix: str) -> bool:
+        return bool(self._exec("SELECT 1 FROM suffixes WHERE suffix=?", (norm_suffix(suffix),)))
+
+    def reserve(self, suffix: str, lister: str) -> bool:
+        """Claim suffix and queue it for the sheet; False if it is already taken."""
+        try:
+            self._exec(
+                "INSERT INTO suffixes (suffix, lister, reserved_at, synced, queued_at) VALUES (?, ?, ?, 0, ?)",
+                (norm_suffix(suffix), lister, datetime.now().isoformat(), time.time()),
+            )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    # ---------- local → sheet (write-behind) ----------
+
+    def pending(self) -> int:
+        return int(self._exec("SELECT COUNT(*) AS n FROM suffixes WHERE synced!=1")[0]["n"])
+
+    def _claim(self) -> list:
+        """Move queued rows to claimed (synced=2) and return them, atomically across processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                claimed_at = self._conn.execute(
+                    "SELECT value FROM sync_state WHERE key='flush_claimed_at'").fetchone()
+                if claimed_at and now - claimed_at["value"] > CLAIM_SECS:
+                    # A flush that claimed rows died before finishing: queue them again
+                    self._conn.execute("UPDATE suffixes SET synced=0 WHERE synced=2")
+                rows = self._conn.execute(
+                    "SELECT suffix, lister, reserved_at FROM suffixes WHERE synced=0 ORDER BY queued_at").fetchall()
+                if rows:
+                    self._conn.executemany("UPDATE suffixes SET synced=2 WHERE suffix=?",
+                                           [(r["suffix"],) for r in rows])
+                    self._conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('flush_claimed_at', ?)",
+                                       (now,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def flush(self) -> int:
+        """Append every queued reservation to the sheet in one call; returns the row count."""
+        with self._flush_lock:
+            rows = self._claim()
+            if not rows:
+                return 0
+            keys = [(r["suffix"],) for r in rows]
+            try:
+                self.sheet_factory().append_rows([[r["suffix"], r["lister"], r["reserved_at"]] for r in rows])
+            except Exception:
+                with self._lock:
+                    self._conn.executemany("UPDATE suffixes SET synced=0 WHERE suffix=? AND synced=2", keys)
+                raise
+            with self._lock:
+                self._conn.executemany("UPDATE suffixes SET synced=1, queued_at=NULL WHERE suffix=?", keys)
+            return len(rows)
+
+    def flush_due(self) -> int:
+        """flush() once SKU_REGISTRY_FLUSH_BATCH rows are queued or the oldest waited SKU_REGISTRY_FLUSH_SECS."""
+        row = self._exec("SELECT COUNT(*) AS n, MIN(queued_at) AS oldest FROM suffixes WHERE synced=0")[0]
+        if not row["n"]:
+            return 0
+        if row["n"] >= FLUSH_BATCH or time.time() - row["oldest"] >= FLUSH_SECS:
+            return self.flush()
+        return 0
+
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def get_default_registry(sheet_factory=None):
+    """Process-wide registry at SKU_REGISTRY_PATH; sheet_factory is used on first creation."""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            if sheet_factory is None:
+                from utils.google_utils import open_sheet
+                sheet_factory = lambda: open_sheet("SKU Tracker")
+            _default_registry = SkuRegistry(sheet_factory)
+        return _default_registry
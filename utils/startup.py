@@ -0,0 +1,140 @@
+# utils/startup.py
+"""
+Environment loading and startup timing for app.py, cli.py and the job workers.
+
+With APP_STARTUP_PROFILE=1, install() times every module imported after it
+(self and cumulative, like `python -X importtime`) and mark() times the
+init phases of each script run. app.py shows the report in the sidebar,
+cli.py prints it to stderr.
+"""
+import os
+import sys
+import time
+import builtins
+import threading
+
+STARTUP_PROFILE = os.getenv("APP_STARTUP_PROFILE", "false").lower() in ("1", "true", "yes")
+
+_env_loaded = False
+
+
+def load_env():
+    """
+    Load .env, then dpbox.env for anything it leaves unset. Neither overrides
+    the process environment; repeat calls (Streamlit reruns) are free.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    load_dotenv("dpbox.env")
+    _env_loaded = True
+
+
+# ---------- import timing ----------
+
+_real_import = builtins.__import__
+_imports = {}                  # module -> (self seconds, cumulative seconds, depth)
+_local = threading.local()
+
+
+def _first_load(name, fromlist):
+    """Module this import will load first, or None when everything it names is loaded already."""
+    if name not in sys.modules:
+        return name
+    # `from pkg import mod` with pkg loaded: time it as pkg.mod
+    parent = sys.modules[name]
+    for f in fromlist or ():
+        if f != "*" and f"{name}.{f}" not in sys.modules and not hasattr(parent, f):
+            return f"{name}.{f}"
+    return None
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    key = None if level else _first_load(name, fromlist)
+    if key is None:
+        return _real_import(name, globals, locals, fromlist, level)
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    frame = [0.0]                      # time spent in nested first-time imports
+    stack.append(frame)
+    t0 = time.perf_counter()
+    try:
+        return _real_import(name, globals, locals, fromlist, level)
+    finally:
+        total = time.perf_counter() - t0
+        stack.pop()
+        if stack:
+            stack[-1][0] += total
+        _imports.setdefault(key, (total - frame[0], total, len(stack)))
+
+
+def install():
+    """Start timing imports (no-op unless APP_STARTUP_PROFILE is set)."""
+    if STARTUP_PROFILE and builtins.__import__ is not _timed_import:
+        builtins.__import__ = _timed_import
+
+
+# ---------- init phases ----------
+
+_phases = {}                   # label -> {"first": s, "last": s, "runs": n}
+_run = {"t": None, "started": None}
+
+
+def begin_run():
+    """Start timing a script run (each Streamlit rerun calls this again)."""
+    now = time.perf_counter()
+    _run["t"] = _run["started"] = now
+
+
+def mark(label: str):
+    """Record the time since the previous mark (or begin_run) under `label`."""
+    if _run["t"] is None:
+        return
+    now = time.perf_counter()
+    secs, _run["t"] = now - _run["t"], now
+    p = _phases.get(label)
+    if p is None:
+        _phases[label] = {"first": secs, "last": secs, "runs": 1}
+    else:
+        p["last"] = secs
+        p["runs"] += 1
+
+
+def run_seconds() -> float:
+    return time.perf_counter() - _run["started"] if _run["started"] is not None else 0.0
+
+
+# ---------- report ----------
+
+def import_report(top: int = 15) -> list[dict]:
+    """
+    Slowest imports by cumulative time: everything the entry script imported
+    directly, plus this repo's own modules (what each pulls in is in `total_ms`).
+    """
+    rows = [
+        {"module": name, "self_ms": round(s * 1000, 1), "total_ms": round(c * 1000, 1)}
+        for name, (s, c, depth) in _imports.items()
+        if depth == 0 or name.split(".")[0] in ("utils", "constants")
+    ]
+    rows.sort(key=lambda r: r["total_ms"], reverse=True)
+    return rows[:top]
+
+
+def phase_report() -> list[dict]:
+    return [
+        {"phase": label, "first_ms": round(p["first"] * 1000, 1), "last_ms": round(p["last"] * 1000, 1),
+         "runs": p["runs"]}
+        for label, p in _phases.items()
+    ]
+
+
+def format_report(top: int = 15) -> str:
+    lines = ["startup imports (ms)        self     total"]
+    lines += [f"  {r['module']:<24}{r['self_ms']:>8.1f}{r['total_ms']:>10.1f}" for r in import_report(top)]
+    if _phases:
+        lines.append("init phases (ms)           first      last")
+        lines += [f"  {r['phase']:<24}{r['first_ms']:>8.1f}{r['last_ms']:>10.1f}" for r in phase_report()]
+    return "\n".join(lines)
@@ -0,0 +1,67 @@
+# utils/text_derive.py
+"""
+Text fields derived from product copy: plain text from Body (HTML), the
+150-char SEO description, the Shopify meta description.
+
+A design repeats one Body (HTML) per garment on every variant row (12
+distinct values across ~465 rows), so the helpers are memoized and
+map_unique() runs a helper once per distinct value of a column and
+broadcasts the results back to the rows.
+"""
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+TEXT_CACHE_SIZE = int(os.getenv("TEXT_DERIVE_CACHE_SIZE", "4096"))   # distinct bodies kept per process
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE  = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def html_to_text(html: str) -> str:
+    """Tags replaced by spaces, whitespace collapsed."""
+    return _WS_RE.sub(" ", _TAG_RE.sub(" ", html or "")).strip()
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def meta_150_last_sentence(html: str) -> str:
+    """
+    Plain text from HTML, then cut at the last '.' before 150 chars.
+    If no '.' exists before 150, return the first 150 chars trimmed.
+    """
+    text = html_to_text(html)
+    if len(text) <= 150:
+        return text
+    cut = text[:150]
+    last_dot = cut.rfind(".")
+    if last_dot != -1:
+        return cut[:last_dot+1].strip()
+    return cut.strip()
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def meta_description(body_html: str, fallback_title: str, max_len: int) -> str:
+    """Plain text of body_html (or fallback_title when empty), ellipsized to max_len."""
+    text = html_to_text(body_html) or (fallback_title or "")
+    if len(text) > max_len:
+        text = text[:max_len-1].rstrip() + "…"
+    return text
+
+
+def clear_caches():
+    for fn in (html_to_text, meta_150_last_sentence, meta_description):
+        fn.cache_clear()
+
+
+def map_unique(series: pd.Series, fn) -> pd.Series:
+    """
+    fn once per distinct value of series.astype(str), broadcast back to every
+    row: the same result as series.astype(str).apply(fn).
+    """
+    codes, uniques = pd.factorize(series.astype(str))
+    derived = np.array([fn(u) for u in uniques], dtype=object)
+    return pd.Series(derived[codes], index=series.index, name=series.name)
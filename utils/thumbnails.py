@@ -0,0 +1,69 @@
+# utils/thumbnails.py
+"""
+Preview thumbnails for Dropbox images. The UI used to show designs and
+mockups through shared links, so the browser pulled the full print file
+(tens of MB) for a 300px preview. Thumbnails come from
+files_get_thumbnail_batch instead: up to 25 per call, calls spread over a
+few threads, and each one cached on disk by path, rev, size and format, so
+an unchanged file is fetched once and a new rev is picked up on its own.
+"""
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+THUMB_CACHE_DIR = os.getenv("DROPBOX_THUMB_CACHE_DIR", os.path.join(".state", "thumbs"))
+THUMB_FORMAT    = os.getenv("DROPBOX_THUMB_FORMAT", "jpeg")     # jpeg | png
+THUMB_WORKERS   = int(os.getenv("DROPBOX_THUMB_WORKERS", "4"))   # batch calls in flight
+THUMB_BATCH     = 25                                             # files_get_thumbnail_batch limit
+
+PREVIEW_SIZE = "w1024h768"   # Auto tab design preview
+SIDEBAR_SIZE = "w480h320"    # sidebar mockup preview
+GALLERY_SIZE = "w256h256"    # ready-folder gallery tiles
+
+
+def _cache_file(path: str, rev: str, size: str, fmt: str) -> str:
+    key = hashlib.sha256(f"{path.lower()}|{rev}|{size}|{fmt}".encode("utf-8")).hexdigest()
+    return os.path.join(THUMB_CACHE_DIR, f"{key}.{'jpg' if fmt == 'jpeg' else fmt}")
+
+
+def _fetch_batch(dbx, paths, size, fmt) -> dict:
+    from dropbox.exceptions import ApiError
+    from utils.dropbox_utils import get_thumbnail_batch
+    try:
+        return get_thumbnail_batch(dbx, paths, size, fmt)
+    except ApiError:
+        return {}
+
+
+def get_thumbnails(dbx, files, size: str = GALLERY_SIZE, fmt: str = None) -> dict[str, bytes]:
+    """
+    Thumbnails for files = [(path, rev)] as {path: bytes}. Cached ones are
+    read from disk; the rest are fetched THUMB_BATCH at a time. A rev of None
+    (not known from a listing) always fetches. Files Dropbox can't
+    thumbnail are left out.
+    """
+    fmt = fmt or THUMB_FORMAT
+    out, todo = {}, []
+    for path, rev in dict(files).items():
+        cached = _cache_file(path, rev, size, fmt) if rev else None
+        if cached and os.path.exists(cached):
+            with open(cached, "rb") as f:
+                out[path] = f.read()
+        else:
+            todo.append(path)
+    if not todo:
+        return out
+
+    os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
+    batches = [todo[i:i + THUMB_BATCH] for i in range(0, len(todo), THUMB_BATCH)]
+    with ThreadPoolExecutor(max_workers=max(1, min(THUMB_WORKERS, len(batches))),
+                            thread_name_prefix="dropbox-thumbs") as pool:
+        for got in pool.map(lambda b: _fetch_batch(dbx, b, size, fmt), batches):
+            for path, (rev, data) in got.items():
+                target = _cache_file(path, rev, size, fmt)
+                tmp = f"{target}.{os.getpid()}.part"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, target)
+                out[path] = data
+    return out
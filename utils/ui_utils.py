@@ -1,3 +1,5 @@
+import os
+import time
 import base64
 import streamlit as st
 
@@ -21,3 +23,45 @@ def render_logo(path="logo.png", width=200):
         )
     else:
         st.warning("⚠️ Logo couldn't be loaded.")
+
+
+class StreamlitProgressSink:
+    """
+    Progress callback for upload functions that renders into one status
+    container at most every SHOPIFY_PROGRESS_INTERVAL seconds instead of one
+    widget per message: a progress bar, a counters line and the last few
+    log lines. Warnings stay listed; call flush() when the run ends.
+    """
+    accepts_events = True
+
+    def __init__(self, container, interval: float = None, level: str = None):
+        from utils.progress import ProgressAggregator
+        self.interval = float(interval if interval is not None else os.getenv("SHOPIFY_PROGRESS_INTERVAL", "0.3"))
+        self.agg = ProgressAggregator(level=level)
+        self._bar = container.progress(0.0)
+        self._stats = container.empty()
+        self._log = container.empty()
+        self._last = 0.0
+
+    def __call__(self, msg):
+        self.agg.add(msg)
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.flush()
+
+    def flush(self):
+        snap = self.agg.snapshot()
+        total, done = snap["products_total"], snap["products_done"]
+        if total:
+            self._bar.progress(min(1.0, done / total), text=f"{done}/{total} products")
+        throttled = snap["statuses"].get(429, 0)
+        errors = sum(n for s, n in snap["statuses"].items() if s == "error" or (isinstance(s, int) and s >= 500))
+        outcomes = ", ".join(f"{k} {v}" for k, v in snap["outcomes"].items())
+        self._stats.markdown(
+            f"**{snap['current'] or '—'}** · {snap['requests']} requests (429×{throttled}, errors×{errors}) · "
+            f"wire {snap['wire_seconds']:.1f}s · sleeping {snap['sleep_seconds']:.1f}s · "
+            f"elapsed {snap['elapsed']:.1f}s" + (f"  \n{outcomes}" if outcomes else "")
+        )
+        lines = snap["recent"] + [w for w in snap["warnings"] if w not in snap["recent"]]
+        self._log.code("\n".join(lines) or " ", language=None)
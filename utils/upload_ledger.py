@@ -0,0 +1,171 @@
+# utils/upload_ledger.py
+import os
+import json
+import time
+import sqlite3
+import threading
+
+LEDGER_PATH    = os.getenv("SHOPIFY_UPLOAD_LEDGER", os.path.join(".state", "upload_ledger.sqlite3"))
+LEDGER_ENABLED = os.getenv("SHOPIFY_UPLOAD_LEDGER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    store       TEXT NOT NULL,
+    handle      TEXT NOT NULL,
+    product_id  INTEGER NOT NULL,
+    title       TEXT,
+    variants    TEXT NOT NULL DEFAULT '[]',
+    status      TEXT NOT NULL DEFAULT 'created',
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (store, handle)
+);
+CREATE TABLE IF NOT EXISTS images (
+    store       TEXT NOT NULL,
+    handle      TEXT NOT NULL,
+    src         TEXT NOT NULL,
+    image_id    INTEGER NOT NULL,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (store, handle, src)
+);
+CREATE TABLE IF NOT EXISTS variant_links (
+    store       TEXT NOT NULL,
+    handle      TEXT NOT NULL,
+    variant_id  INTEGER NOT NULL,
+    image_id    INTEGER NOT NULL,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (store, handle, variant_id)
+);
+"""
+
+
+def store_key(store_url: str) -> str:
+    """Normalise a store URL so 'https://x.myshopify.com/' and 'x.myshopify.com' share rows."""
+    s = (store_url or "").strip().lower()
+    s = s.replace("https://", "").replace("http://", "")
+    return s.rstrip("/")
+
+
+class UploadLedger:
+    """
+    Durable per-store, per-handle record of upload progress.
+
+    Steps are recorded as soon as Shopify confirms them (product created,
+    image uploaded, variant linked), so a rerun after a crash or the daily
+    variant limit can skip finished work without spending API calls.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or LEDGER_PATH
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _exec(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ---------- products ----------
+
+    def get_product(self, store: str, handle: str):
+        rows = self._exec(
+            "SELECT * FROM products WHERE store=? AND handle=?",
+            (store_key(store), handle),
+        )
+        if not rows:
+            return None
+        row = dict(rows[0])
+        row["variants"] = json.loads(row["variants"] or "[]")
+        return row
+
+    def record_created(self, store: str, handle: str, product_id, title=None, variants=None):
+        """Store the new product id plus (variant_id, colour) pairs needed for later linking."""
+        slim = [{"id": v.get("id"), "option2": v.get("option2")} for v in (variants or [])]
+        self._exec(
+            "INSERT OR REPLACE INTO products (store, handle, product_id, title, variants, status, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 'created', ?)",
+            (store_key(store), handle, int(product_id), title, json.dumps(slim), time.time()),
+        )
+
+    def mark_done(self, store: str, handle: str):
+        self._exec(
+            "UPDATE products SET status='done', updated_at=? WHERE store=? AND handle=?",
+            (time.time(), store_key(store), handle),
+        )
+
+    def forget(self, store: str, handles):
+        """Drop every record for the given handles (e.g. after deleting them in Shopify)."""
+        key = store_key(store)
+        for handle in handles:
+            for table in ("products", "images", "variant_links"):
+                self._exec(f"DELETE FROM {table} WHERE store=? AND handle=?", (key, handle))
+
+    # ---------- images ----------
+
+    def images(self, store: str, handle: str) -> dict:
+        rows = self._exec(
+            "SELECT src, image_id FROM images WHERE store=? AND handle=?",
+            (store_key(store), handle),
+        )
+        return {r["src"]: r["image_id"] for r in rows}
+
+    def record_image(self, store: str, handle: str, src: str, image_id):
+        self._exec(
+            "INSERT OR REPLACE INTO images (store, handle, src, image_id, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (store_key(store), handle, src, int(image_id), time.time()),
+        )
+
+    # ---------- variant links ----------
+
+    def linked_variants(self, store: str, handle: str) -> set:
+        rows = self._exec(
+            "SELECT variant_id FROM variant_links WHERE store=? AND handle=?",
+            (store_key(store), handle),
+        )
+        return {r["variant_id"] for r in rows}
+
+    def record_link(self, store: str, handle: str, variant_id, image_id):
+        self._exec(
+            "INSERT OR REPLACE INTO variant_links (store, handle, variant_id, image_id, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (store_key(store), handle, int(variant_id), int(image_id), time.time()),
+        )
+
+    # ---------- reporting ----------
+
+    def summary(self, store: str, handles) -> dict:
+        """Return {'done': n, 'partial': n, 'new': n} for the given handles."""
+        out = {"done": 0, "partial": 0, "new": 0}
+        for handle in handles:
+            row = self.get_product(store, handle)
+            if row is None:
+                out["new"] += 1
+            elif row["status"] == "done":
+                out["done"] += 1
+            else:
+                out["partial"] += 1
+        return out
+
+
+_default_ledger = None
+_default_lock = threading.Lock()
+
+
+def get_default_ledger():
+    """Process-wide ledger at SHOPIFY_UPLOAD_LEDGER, or None when disabled."""
+    global _default_ledger
+    if not LEDGER_ENABLED:
+        return None
+    with _default_lock:
+        if _default_ledger is None:
+            _default_ledger = UploadLedger()
+        return _default_ledger
@@ -0,0 +1,196 @@
+# utils/variant_quota.py
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+
+from utils.upload_ledger import store_key
+
+QUOTA_PATH          = os.getenv("SHOPIFY_VARIANT_QUOTA_DB", os.path.join(".state", "variant_quota.sqlite3"))
+DAILY_VARIANT_QUOTA = int(os.getenv("SHOPIFY_DAILY_VARIANT_QUOTA", "0"))   # 0: no cap of our own
+QUOTA_WINDOW_SECS   = 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    store       TEXT NOT NULL,
+    ts          REAL NOT NULL,
+    variants    INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_store_ts ON usage (store, ts);
+CREATE TABLE IF NOT EXISTS blocked (
+    store       TEXT PRIMARY KEY,
+    until       REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queue (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    store       TEXT NOT NULL,
+    design      TEXT NOT NULL,
+    csv_path    TEXT NOT NULL,
+    handles     TEXT NOT NULL,
+    variants    INTEGER NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'queued',
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+"""
+
+
+class VariantQuota:
+    """
+    Rolling 24h record of variants created per store, persisted locally.
+
+    Shopify caps variant creation per day; the uploader asks this scheduler
+    how much is left and only starts products (or designs) that fit whole.
+    Designs that don't fit are queued with their CSV and picked up again
+    once enough of the window has rolled off.
+
+    With daily_quota 0 nothing is held back until Shopify answers with
+    DAILY_VARIANT_LIMIT (mark_exhausted); the store is then blocked until
+    its oldest creation in the window rolls off.
+    """
+
+    def __init__(self, path: str = None, daily_quota: int = None):
+        self.path = path or QUOTA_PATH
+        self.daily_quota = max(0, int(daily_quota or DAILY_VARIANT_QUOTA))
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _exec(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ---------- quota ----------
+
+    def used(self, store: str, now: float = None) -> int:
+        now = now or time.time()
+        rows = self._exec("SELECT COALESCE(SUM(variants), 0) AS n FROM usage WHERE store=? AND ts>?",
+                          (store_key(store), now - QUOTA_WINDOW_SECS))
+        return int(rows[0]["n"])
+
+    def remaining(self, store: str, now: float = None) -> int | float:
+        """Variants left in the window: 0 while blocked, math.inf with no daily quota set."""
+        now = now or time.time()
+        rows = self._exec("SELECT until FROM blocked WHERE store=?", (store_key(store),))
+        if rows and rows[0]["until"] > now:
+            return 0
+        if not self.daily_quota:
+            return math.inf
+        return max(0, self.daily_quota - self.used(store, now))
+
+    def describe(self, store: str) -> str:
+        """Quota state for progress lines, e.g. '640/1000 left'."""
+        left = self.remaining(store)
+        if self.daily_quota:
+            return f"{left}/{self.daily_quota} left"
+        if left:
+            return "no cap set (waits only after Shopify's daily limit)"
+        return f"Shopify's daily limit hit, blocked until {time.strftime('%Y-%m-%d %H:%M', time.localtime(self.resets_at(store)))}"
+
+    def record(self, store: str, variants: int):
+        if variants > 0:
+            self._exec("INSERT INTO usage (store, ts, variants) VALUES (?, ?, ?)",
+                       (store_key(store), time.time(), int(variants)))
+
+    def mark_exhausted(self, store: str):
+        """Shopify reported the daily limit: block until the oldest usage in the window rolls off."""
+        now = time.time()
+        rows = self._exec("SELECT MIN(ts) AS t FROM usage WHERE store=? AND ts>?",
+                          (store_key(store), now - QUOTA_WINDOW_SECS))
+        oldest = rows[0]["t"]
+        until = (oldest + QUOTA_WINDOW_SECS) if oldest else (now + QUOTA_WINDOW_SECS)
+        self._exec("INSERT OR REPLACE INTO blocked (store, until) VALUES (?, ?)", (store_key(store), until))
+
+    def resets_at(self, store: str, needed: int = 1, now: float = None):
+        """Epoch seconds when at least `needed` variants will be available again (None if already)."""
+        now = now or time.time()
+        key = store_key(store)
+        blocked = self._exec("SELECT until FROM blocked WHERE store=?", (key,))
+        blocked_until = blocked[0]["until"] if blocked and blocked[0]["until"] > now else None
+        if blocked_until is None and self.remaining(store, now) >= needed:
+            return None
+        if not self.daily_quota:
+            return blocked_until
+        free = self.daily_quota - self.used(store, now)
+        for r in self._exec("SELECT ts, variants FROM usage WHERE store=? AND ts>? ORDER BY ts",
+                            (key, now - QUOTA_WINDOW_SECS)):
+            free += r["variants"]
+            if free >= needed:
+                t = r["ts"] + QUOTA_WINDOW_SECS
+                return max(t, blocked_until or 0)
+        return blocked_until
+
+    # ---------- packing ----------
+
+    @staticmethod
+    def pack(items, budget):
+        """
+        First-fit of whole items into budget, keeping input order.
+        items: [(key, variants)] → (fitting keys, deferred keys).
+        """
+        fit, deferred = [], []
+        for key, n in items:
+            if n <= budget:
+                fit.append(key)
+                budget -= n
+            else:
+                deferred.append(key)
+        return fit, deferred
+
+    # ---------- deferred designs ----------
+
+    def defer(self, store: str, design: str, csv_path: str, handles, variants: int):
+        """Queue a design (or the remainder of one) to upload once the quota allows."""
+        now = time.time()
+        key = store_key(store)
+        existing = self._exec("SELECT id FROM queue WHERE store=? AND design=? AND status='queued'", (key, design))
+        if existing:
+            self._exec("UPDATE queue SET csv_path=?, handles=?, variants=?, updated_at=? WHERE id=?",
+                       (csv_path, json.dumps(list(handles)), int(variants), now, existing[0]["id"]))
+            return existing[0]["id"]
+        self._exec("INSERT INTO queue (store, design, csv_path, handles, variants, status, created_at, updated_at) "
+                   "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                   (key, design, csv_path, json.dumps(list(handles)), int(variants), now, now))
+        return self._exec("SELECT last_insert_rowid() AS id")[0]["id"]
+
+    def queued(self, store: str):
+        rows = self._exec("SELECT * FROM queue WHERE store=? AND status='queued' ORDER BY id", (store_key(store),))
+        return [dict(r, handles=json.loads(r["handles"])) for r in rows]
+
+    def due(self, store: str):
+        """
+        Queued designs that fit whole into what's left of today's quota, oldest first.
+        A design bigger than a full day's quota is due whenever a full day is free;
+        the uploader then creates the products that fit and re-queues the rest.
+        """
+        items = self.queued(store)
+        cap = self.daily_quota or math.inf
+        fit, _ = self.pack([(i, min(i["variants"], cap)) for i in items], self.remaining(store))
+        return fit
+
+    def complete(self, item_id: int, status: str = "done"):
+        self._exec("UPDATE queue SET status=?, updated_at=? WHERE id=?", (status, time.time(), item_id))
+
+
+_default_quota = None
+_default_lock = threading.Lock()
+
+
+def get_default_quota():
+    """Process-wide scheduler at SHOPIFY_VARIANT_QUOTA_DB."""
+    global _default_quota
+    with _default_lock:
+        if _default_quota is None:
+            _default_quota = VariantQuota()
+        return _default_quota
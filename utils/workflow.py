@@ -0,0 +1,476 @@
+# utils/workflow.py
+"""
+Design workflow steps shared by the Streamlit app, the CLI and the
+background workers: folder readiness, store pre-flight, quota gating,
+archiving and whole upload runs. No Streamlit here; progress goes through
+`emit(msg)` callbacks.
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import pandas as pd
+
+from utils.dropbox_utils import list_folder_names, path_exists, _ensure_folder
+from utils.shopify_utils import preflight_existing, drop_conflicts, pending_variants, default_client, for_each_store
+from utils.upload_ledger import get_default_ledger
+from utils.variant_quota import get_default_quota
+from utils.progress import ProgressEvent
+from utils.csv_export import write_csv
+
+if TYPE_CHECKING:
+    import dropbox
+    from utils.shopify_utils import ShopifyClient
+
+ARCHIVE_IMAGE_RE = r"^([1-9]\d{0,2})\.(png|jpg|jpeg|webp)$"
+
+
+def analyze_design_folders(dbx: dropbox.Dropbox, root: str, list_folder=list_folder_names):
+    """
+    Return (ready_list, not_ready_list), with deeper .json validation (e.g. description count).
+    list_folder(dbx, path) -> (file names, folder names); the app passes its cached version.
+    """
+    ready, not_ready = [], []
+
+    try:
+        _, subfolders = list_folder(dbx, root)
+        IGNORE_FOLDERS = {"finished", "images", "designs", "1_Ready"}
+
+        folders = [n for n in subfolders if n.lower() not in IGNORE_FOLDERS]
+    except Exception as e:
+        return ready, [{"Folder": "N/A", "Issues": f"Failed to list root: {e}"}]
+
+    for name in folders:
+        path = f"{root}/{name}"
+        try:
+            files = set(list_folder(dbx, path)[0])
+            errors = []
+
+            json_files = [fn for fn in files if fn.lower().endswith(".json")]
+            has_meta = bool(json_files)
+            has_txt = any(fn.lower().endswith((".txt", ".pdf")) for fn in files)
+
+            has_art = any(
+                fn.split(".")[0] == name and fn.lower().split(".")[-1] in {"png", "jpg", "jpeg", "webp"}
+                for fn in files
+            )
+            numbered_pngs = [fn for fn in files if fn.lower().endswith(".png") and fn.split(".")[0].isdigit()]
+            numbered_count = len(numbered_pngs)
+
+
+            if not has_art:
+                errors.append("Missing matching artwork")
+            if numbered_count < 80:
+                errors.append(f"Only {numbered_count}/80 images")
+
+            if errors:
+                not_ready.append({
+                    "Folder": name,
+                    "Has .json": "✅" if has_meta else "❌",
+                    "Has notes": "✅" if has_txt else "❌",
+                    "Has art": "✅" if has_art else "❌",
+                    "Image count": f"{numbered_count} / 80",
+                    "Issues": ", ".join(errors),
+                })
+            else:
+                ready.append(name)
+
+        except Exception as e:
+            not_ready.append({
+                "Folder": name,
+                "Has metadata": "❌",
+                "Has .txt": "❌",
+                "Has art": "❌",
+                "Image count": "0 / 80",
+                "Issues": f"Error: {e}",
+            })
+
+    return ready, not_ready
+
+def _store(client: ShopifyClient | None) -> str:
+    return (client or default_client()).store
+
+def ledger_note(df: pd.DataFrame, client: ShopifyClient = None) -> str | None:
+    """One-line summary of what the upload ledger already has for these handles (None if nothing)."""
+    ledger = get_default_ledger()
+    if ledger is None:
+        return None
+    c = ledger.summary(_store(client), df["Handle"].unique())
+    if not c["done"] and not c["partial"]:
+        return None
+    return f"♻️ Resuming from upload ledger: {c['done']} done, {c['partial']} partial, {c['new']} new"
+
+def store_preflight(df: pd.DataFrame, emit, abort_on_conflict: bool = False,
+                    client: ShopifyClient = None) -> pd.DataFrame | None:
+    """
+    Check df's handles/SKUs against the store before any create call.
+    Returns df without conflicting products, or None if the design should not be uploaded.
+    """
+    report = preflight_existing(df, progress=emit, client=client)
+    bad = report["conflicting_handles"]
+    if not bad:
+        return df
+    emit(f"⚠️ Already in store: {', '.join(bad)}")
+    if report["skus"]:
+        sample = list(report["skus"].items())[:5]
+        emit("   SKUs e.g. " + ", ".join(f"{k} → {h}" for k, h in sample))
+    if abort_on_conflict:
+        return None
+    df = drop_conflicts(df, report)
+    emit(f"⏭️ Skipping {len(bad)} conflicting product(s); {df['Handle'].nunique()} left to upload")
+    return df if len(df) else None
+
+def quota_eta(quota, store: str, need: int) -> str:
+    t = quota.resets_at(store, min(need, quota.daily_quota or need))
+    return "fits now" if t is None else f"fits after {datetime.fromtimestamp(t):%Y-%m-%d %H:%M}"
+
+def quota_gate(fname: str, df: pd.DataFrame, csv_path: str, emit, reserved: int = 0,
+               client: ShopifyClient = None) -> int | None:
+    """
+    Whole-design check against today's variant quota.
+    Returns the variants this design will spend, or None after queueing it
+    (with its CSV) to upload once enough of the rolling day has freed up.
+    """
+    quota = get_default_quota()
+    if quota is None:
+        return 0
+    store = _store(client)
+    pending = pending_variants(df, client=client)
+    need = sum(pending.values())
+    left = quota.remaining(store) - reserved
+    # Bigger than a whole day: go product by product, the rest is re-queued by defer_leftovers
+    if need <= left or (need > quota.daily_quota and left > 0):
+        if quota.daily_quota:
+            emit(f"📊 {need} new variants; {max(left, 0)} left in today's quota")
+        return min(need, max(left, 0))
+    quota.defer(store, fname, os.path.abspath(csv_path), list(pending), need)
+    emit(f"⏸️ Queued for later: needs {need} variants, {max(left, 0)} left today ({quota_eta(quota, store, need)})")
+    return None
+
+def defer_leftovers(fname: str, csv_path: str, results: list[dict], client: ShopifyClient = None) -> int:
+    """Queue the products upload_products_from_df deferred for quota; returns how many."""
+    quota = get_default_quota()
+    deferred = [r for r in results if r.get("status") == "deferred (quota)"]
+    if quota is None or not deferred:
+        return 0
+    quota.defer(_store(client), fname, os.path.abspath(csv_path),
+                [r["handle_or_title"] for r in deferred], sum(r["variants"] for r in deferred))
+    return len(deferred)
+
+
+def clean_and_archive_to_completed(dbx: dropbox.Dropbox, designs_root: str, folder: str,
+                                   finished_dir: str, completed_root: str) -> tuple[int, str]:
+    """Delete numbered images 1–127 from <root>/<finished_dir>/<folder>, then move it under completed_root."""
+    finished_path = f"{designs_root}/{finished_dir}/{folder}"
+    if not path_exists(dbx, finished_path):
+        raise RuntimeError(f"Folder not in /{finished_dir}: {finished_path}")
+
+    pat = re.compile(ARCHIVE_IMAGE_RE, re.IGNORECASE)
+    deleted = 0
+    files, _ = list_folder_names(dbx, finished_path)
+    for name in files:
+        m = pat.match(name)
+        if not m:
+            continue
+        num = int(m.group(1))
+        if 1 <= num <= 127:
+            dbx.files_delete_v2(f"{finished_path}/{name}")
+            deleted += 1
+
+    _ensure_folder(dbx, completed_root)
+    dest = f"{completed_root}/{folder}"
+    dbx.files_move_v2(finished_path, dest, autorename=True)
+    return deleted, dest
+
+
+# ---------- headless runs (CLI / background workers) ----------
+
+UPLOAD_DEFAULTS = {
+    "preflight": True,           # store handle/SKU pre-flight
+    "abort_on_conflict": False,  # skip the whole design on any conflict
+    "move": False,               # move to /finished after upload
+    "bulk": False,               # one Bulk Operations job for all designs
+    "sku_lister": None,          # SKU Tracker lister name; None skips the guard
+    "variant_budget": None,      # max variants to create per design upload; None = no cap
+    "out_dir": ".",              # where per-design CSVs are kept (quota queue reads them back)
+}
+
+
+def _opts(options: dict | None) -> dict:
+    return {**UPLOAD_DEFAULTS, **(options or {})}
+
+
+def finish_design(dbx: dropbox.Dropbox, designs_root: str, folder: str) -> str:
+    from utils.dropbox_utils import move_to_finished
+    return move_to_finished(dbx, designs_root, folder, finished_dir=os.getenv("FINISHED_DIR_NAME", "finished"))
+
+
+def _after_upload(dbx, designs_root, name, opts, emit):
+    if opts["move"]:
+        try:
+            emit(f"📦 Moved to {finish_design(dbx, designs_root, name)}")
+        except Exception as e:
+            emit(ProgressEvent(f"⚠️ Move failed: {e}", level="warning"))
+
+
+def upload_one(name: str, df: pd.DataFrame, csv_path: str, emit, options: dict = None,
+               reserved: int = 0, bulk: bool = False, client: ShopifyClient = None):
+    """
+    Pre-flight, quota gate and upload for one design.
+    Returns (status, detail, need): status is done / deferred / failed, or
+    "bulk" with detail = the DataFrame to send and need = variants it will spend.
+    """
+    from utils.shopify_utils import upload_products_from_df
+    opts = _opts(options)
+
+    note = ledger_note(df, client)
+    if note: emit(note)
+    if opts["preflight"]:
+        df = store_preflight(df, emit, abort_on_conflict=opts["abort_on_conflict"], client=client)
+        if df is None:
+            return "failed", "Pre-flight conflict", 0
+    need = quota_gate(name, df, csv_path, emit, reserved=reserved, client=client)
+    if need is None:
+        return "deferred", "Queued for the daily variant quota", 0
+    if bulk:
+        return "bulk", df, need
+    results = upload_products_from_df(df, progress=emit, variant_budget=opts["variant_budget"], client=client)
+    if defer_leftovers(name, csv_path, results, client):
+        return "deferred", "Partly uploaded, rest queued for the daily quota", 0
+    return "done", "", 0
+
+
+def upload_csv(dbx, designs_root: str, name: str, csv_path: str, emit, options: dict = None,
+               client: ShopifyClient = None) -> list[tuple]:
+    """Upload an already built CSV (the app's "Upload built CSV" step). Returns summary rows."""
+    from utils.shopify_utils import ShopifyError
+    opts = _opts(options)
+    t0 = time.perf_counter()
+    df = pd.read_csv(csv_path, encoding="utf-8-sig")
+    try:
+        status, detail, _ = upload_one(name, df, csv_path, emit, opts, client=client)
+    except ShopifyError as e:
+        if not str(e).startswith("DAILY_VARIANT_LIMIT:"):
+            raise
+        quota_gate(name, df, csv_path, emit, client=client)
+        status, detail = "deferred", "Daily variant limit (queued)"
+    if status == "done":
+        _after_upload(dbx, designs_root, name, opts, emit)
+    return [(name, status, detail, time.perf_counter() - t0)]
+
+
+def upload_csv_to_stores(dbx, designs_root: str, name: str, csv_path: str, clients: list[ShopifyClient],
+                         progress_for, options: dict = None) -> dict:
+    """
+    upload_csv to several stores at once, one thread per store (pre-flight,
+    quota and ledger are per store). The folder is moved only once every
+    store is done. progress_for(client) gives each store's progress callback.
+    Returns {store name: summary rows}.
+    """
+    opts = _opts(options)
+    t0 = time.perf_counter()
+    per_store = for_each_store(
+        clients, lambda c, emit: upload_csv(None, designs_root, name, csv_path, emit, dict(opts, move=False), client=c),
+        progress_for)
+    summary = {store: rows if not isinstance(rows, Exception) else [(name, "failed", str(rows), time.perf_counter() - t0)]
+               for store, rows in per_store.items()}
+    if all(row[1] == "done" for rows in summary.values() for row in rows):
+        _after_upload(dbx, designs_root, name, opts, progress_for(clients[0]))
+    return summary
+
+
+def resume_quota_queue(dbx, designs_root: str, emit_for, options: dict = None,
+                       client: ShopifyClient = None) -> list[tuple]:
+    """
+    Upload queued designs that now fit today's quota. emit_for(name) gives
+    the progress callback per design. Returns (design, status, detail, seconds) rows.
+    """
+    from utils.shopify_utils import ShopifyError
+    opts = _opts(options)
+    quota = get_default_quota()
+    if quota is None:
+        return []
+    summary = []
+    for item in quota.due(_store(client)):
+        name, t0 = item["design"], time.perf_counter()
+        emit = emit_for(name)
+        emit("▶️ Resuming from quota queue")
+        try:
+            if not os.path.exists(item["csv_path"]):
+                quota.complete(item["id"], "missing")
+                summary.append((name, "failed", f"Missing {item['csv_path']}", time.perf_counter() - t0))
+                continue
+            df = pd.read_csv(item["csv_path"], encoding="utf-8-sig")
+            status, detail, _ = upload_one(name, df, item["csv_path"], emit, opts, client=client)
+            if status == "deferred":
+                # Still doesn't fit: it was re-queued under the same design
+                summary.append((name, status, detail, time.perf_counter() - t0))
+                continue
+            quota.complete(item["id"], "done" if status == "done" else "conflict")
+            summary.append((name, status, detail, time.perf_counter() - t0))
+            if status == "done":
+                _after_upload(dbx, designs_root, name, opts, emit)
+        except ShopifyError as e:
+            if str(e).startswith("DAILY_VARIANT_LIMIT:"):
+                summary.append((name, "deferred", "Daily variant limit", time.perf_counter() - t0))
+                break
+            quota.complete(item["id"], "failed")
+            summary.append((name, "failed", str(e), time.perf_counter() - t0))
+        except Exception as e:
+            quota.complete(item["id"], "failed")
+            summary.append((name, "failed", str(e), time.perf_counter() - t0))
+    return summary
+
+
+def upload_designs(dbx, designs_root: str, designs: list[str], emit_for, options: dict = None,
+                   resume: bool = True, client: ShopifyClient = None) -> list[tuple]:
+    """
+    Build and upload design folders, next builds prefetched while one
+    uploads (same flow as the app's "Build & Upload ALL"). Queued designs
+    run first when resume is set. Returns (design, status, detail, seconds) rows.
+    """
+    from utils.shopify_utils import ShopifyError
+    from utils.shopify_bulk import bulk_upload_from_df
+    from utils.design_builder import build_design_dataframe
+    from utils.batch_pipeline import prefetch_map
+    from utils.sku_registry import get_default_registry
+
+    opts = _opts(options)
+    summary = resume_quota_queue(dbx, designs_root, emit_for, opts, client=client) if resume else []
+    quota = get_default_quota()
+    queued = {i["design"] for i in quota.queued(_store(client))} if quota else set()
+    done = {row[0] for row in summary}
+    todo = [f for f in designs if f not in queued and f not in done]
+    registry = get_default_registry() if opts["sku_lister"] else None
+    os.makedirs(opts["out_dir"], exist_ok=True)
+    bulk_designs, bulk_reserved = [], 0
+
+    for name, built, error, stats in prefetch_map(lambda f: build_design_dataframe(dbx, designs_root, f), todo):
+        t0 = time.perf_counter()
+        emit = emit_for(name)
+        df = csv_path = None
+        try:
+            if error:
+                raise error
+            df, meta, missing = built
+            emit(ProgressEvent(f"✅ DataFrame ready (built in {stats['build']:.1f}s, waited {stats['wait']:.1f}s)",
+                               stage="build", build=stats["build"], wait=stats["wait"]))
+            if missing:
+                emit(ProgressEvent(f"⚠️ Missing images: {missing[:10]}", level="warning"))
+
+            suffix = meta.get("sku_suffix", "").strip().upper()
+            if registry is not None and not ledger_note(df, client):
+                registry.refresh()
+                if not registry.reserve(suffix, opts["sku_lister"]):
+                    summary.append((name, "failed", f"SKU suffix already used: {suffix}", time.perf_counter() - t0))
+                    continue
+                registry.flush_due()
+
+            csv_path = os.path.abspath(os.path.join(opts["out_dir"], f"{suffix}.csv"))
+            write_csv(df, csv_path)
+            status, detail, need = upload_one(name, df, csv_path, emit, opts, reserved=bulk_reserved, bulk=opts["bulk"],
+                                              client=client)
+            if status == "bulk":
+                bulk_designs.append((name, detail, t0, csv_path))
+                bulk_reserved += need
+                emit("🧾 Queued for bulk upload")
+                continue
+            summary.append((name, status, detail, time.perf_counter() - t0))
+            if status == "done":
+                _after_upload(dbx, designs_root, name, opts, emit)
+        except ShopifyError as e:
+            if str(e).startswith("DAILY_VARIANT_LIMIT:") and df is not None and csv_path:
+                # Quota is now marked exhausted: this and later designs get queued, not dropped
+                quota_gate(name, df, csv_path, emit, client=client)
+                summary.append((name, "deferred", "Daily variant limit (queued)", time.perf_counter() - t0))
+            else:
+                summary.append((name, "failed", str(e), time.perf_counter() - t0))
+        except Exception as e:
+            summary.append((name, "failed", str(e), time.perf_counter() - t0))
+
+    if registry is not None:
+        try:
+            registry.flush()
+        except Exception as e:
+            emit_for("sku")(ProgressEvent(
+                f"⚠️ SKU Tracker sync failed; {registry.pending()} suffix(es) stay queued locally: {e}", level="warning"))
+
+    if bulk_designs:
+        emit = emit_for("bulk")
+        try:
+            results = bulk_upload_from_df(pd.concat([d for _, d, _, _ in bulk_designs], ignore_index=True),
+                                          progress=emit, client=client)
+            by_handle = {r["handle_or_title"]: r for r in results}
+            for name, df_i, t0, csv_path in bulk_designs:
+                rows = [by_handle.get(h) for h in df_i["Handle"].unique()]
+                failed = [r for r in rows if not r or r["status"] == "failed"]
+                secs = time.perf_counter() - t0
+                if failed:
+                    errs = "; ".join(e for r in failed if r for e in r.get("errors", []))
+                    summary.append((name, "failed", errs or "bulk result missing", secs))
+                elif defer_leftovers(name, csv_path, [r for r in rows if r], client):
+                    summary.append((name, "deferred", "Deferred (daily quota)", secs))
+                else:
+                    summary.append((name, "done", "", secs))
+                    _after_upload(dbx, designs_root, name, opts, emit)
+        except Exception as e:
+            for name, _, t0, _ in bulk_designs:
+                summary.append((name, "failed", f"Bulk upload: {e}", time.perf_counter() - t0))
+    return summary
+
+
+def sync_designs(dbx, designs_root: str, designs: list[str], emit, fields=None, dry_run: bool = True,
+                 client: ShopifyClient = None) -> list[tuple]:
+    """
+    Push current catalog config (prices, size guides, extras) to designs that
+    are already live. Each design's metadata.json is read from the root or
+    /finished and regenerated with the config files as they are now; only the
+    fields that differ from the store are written (nothing with dry_run).
+    Returns (design, status, detail, seconds) rows.
+    """
+    from utils.design_builder import download_metadata, validate_metadata, generate_design_dataframe
+    from utils.catalog_sync import SYNC_FIELDS, sync_catalog
+
+    finished = f"{designs_root}/{os.getenv('FINISHED_DIR_NAME', 'finished')}"
+    summary, frames = [], {}
+    t0 = time.perf_counter()
+    for name in designs:
+        try:
+            folder = next((p for p in (f"{designs_root}/{name}", f"{finished}/{name}") if path_exists(dbx, p)), None)
+            if folder is None:
+                raise RuntimeError(f"Not found in {designs_root} or {finished}")
+            meta = download_metadata(dbx, folder)
+            validate_metadata(meta)
+            frames[name] = generate_design_dataframe(meta, {})
+        except Exception as e:
+            summary.append((name, "failed", str(e), time.perf_counter() - t0))
+    if not frames:
+        return summary
+
+    try:
+        report = sync_catalog(pd.concat(frames.values(), ignore_index=True), progress=emit,
+                              fields=fields or SYNC_FIELDS, dry_run=dry_run, client=client)
+    except Exception as e:
+        return summary + [(name, "failed", str(e), time.perf_counter() - t0) for name in frames]
+
+    secs = time.perf_counter() - t0
+    for name, df in frames.items():
+        handles = set(df["Handle"].unique())
+        prods = [d for d in report["products"] if d["handle"] in handles]
+        vars_ = [d for d in report["variants"] if d["handle"] in handles]
+        missing = [h for h in report["missing"] if h in handles]
+        errors = [f"{h}: {e}" for h, errs in report["errors"].items() if h in handles for e in errs]
+        n_prices = sum(len(d["variants"]) for d in vars_)
+        gone = f"{len(missing)} of {len(handles)} handle(s) not in store" if missing else ""
+        detail = ", ".join(filter(None, [f"{len(prods)} product update(s), {n_prices} price(s)", gone]))
+        if errors:
+            summary.append((name, "failed", "; ".join(errors[:5]), secs))
+        elif not prods and not vars_:
+            summary.append((name, "unchanged", gone, secs))
+        else:
+            summary.append((name, "preview" if dry_run else "done", detail, secs))
+    return summary